@@ -2,6 +2,7 @@
 /// ATTENTION: You need to edit Adafruit_BME680.cpp and comment line 129 --> //_wire->begin();
 
 #include "MPU6050_6Axis_MotionApps_V6_12.h"
+#include <util/crc16.h>
 
 #define LIGHT_PIN 2
 #define LIGHT_WIND_SPEED_PIN 8
@@ -10,6 +11,11 @@
 #define BME_CHECK_INTERVAL_MS 10000
 #define ROTATION_CHECK_INTERVAL_MS 1000
 #define MPU_CHECK_INTERVAL_MS 50
+// 0: comma-separated text lines; 1: binary frames (see sendBinaryFrame)
+// The host can also switch the mode at runtime by sending 'b' (binary) or 't' (text)
+#define BINARY_FRAMES 0
+#define FRAME_SYNC_0 0xA5
+#define FRAME_SYNC_1 0x5A
 
 int voltage = 0, errorCode = 0;
 uint16_t packetSize;
@@ -30,6 +36,15 @@ VectorFloat gravity;
 VectorInt16 aa;
 float currTemp=0;
 float temp, humidity, pressure, gas;  // BME readings  
+bool binary_frames = BINARY_FRAMES;
+
+// payload of the binary frame: same fields (and order) of the text mode, little-endian
+struct __attribute__((packed)) SensorsPayload {
+  uint32_t arduino_timestamp;
+  uint32_t free_memory;
+  float readings[18];
+};
+SensorsPayload payload;
 
 //BME680_Class BME680;  ///< Create an instance of the BME680 class
 Adafruit_BME680 bme; // I2C
@@ -38,6 +53,21 @@ MPU6050 mpu;
 extern char *__brkval;
 int freeMemory() {char top; return &top - __brkval;}
 
+// frame: sync (2 bytes) | length (1 byte) | payload | crc16 CCITT-FALSE of length + payload (2 bytes)
+void sendBinaryFrame() {
+  uint8_t length = sizeof(payload);
+  uint8_t *data = (uint8_t*)&payload;
+  uint16_t crc = _crc_xmodem_update(0xFFFF, length);
+  for (uint8_t i = 0; i < length; ++i) crc = _crc_xmodem_update(crc, data[i]);
+
+  Serial.write(FRAME_SYNC_0);
+  Serial.write(FRAME_SYNC_1);
+  Serial.write(length);
+  Serial.write(data, length);
+  Serial.write((uint8_t)(crc & 0xFF));
+  Serial.write((uint8_t)(crc >> 8));
+}
+
 void setup() {
   Wire.setClock(200000); // 400kHz I2C clock (200kHz if CPU is 8MHz)
   
@@ -109,6 +139,8 @@ void loop() {
       if ( counter == 0 ) userCommand[0] = b;
       ++counter; // ignore the rest of the characters
     } // while    
+    if (userCommand[0] == 'b') binary_frames = true;
+    else if (userCommand[0] == 't') binary_frames = false;
   } // if
 
   bool has_new_data = false;
@@ -163,6 +195,31 @@ void loop() {
   }
 
   if (!has_new_data) return;
+
+  if (binary_frames) {
+    payload.arduino_timestamp = millis();
+    payload.free_memory = freeMemory();
+    payload.readings[0] = rps;
+    payload.readings[1] = wind_speed_rps;
+    payload.readings[2] = voltage;
+    payload.readings[3] = q.w;
+    payload.readings[4] = q.x;
+    payload.readings[5] = q.y;
+    payload.readings[6] = q.z;
+    payload.readings[7] = gravity.x;
+    payload.readings[8] = gravity.y;
+    payload.readings[9] = gravity.z;
+    payload.readings[10] = aa.x;
+    payload.readings[11] = aa.y;
+    payload.readings[12] = aa.z;
+    payload.readings[13] = currTemp;
+    payload.readings[14] = temp;
+    payload.readings[15] = humidity;
+    payload.readings[16] = pressure;
+    payload.readings[17] = gas/100;
+    sendBinaryFrame();
+    return;
+  } // if
   
   Serial.print(millis()); Serial.print(',');
   Serial.print(freeMemory()); Serial.print(',');
@@ -0,0 +1,47 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+'''
+    Predict latency with the inputs sent as byte_data vs shared memory.
+    It runs against the stand-in agent of the tests (tests/fakeagent.py),
+    so it measures the transport only (no model is executed)
+    Usage: python benchmarks/bench_agent_transport.py [--batch-sizes 1 8 64] [--iterations N]
+'''
+import os
+import sys
+import time
+import argparse
+import tempfile
+import numpy as np
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, os.path.join(APP_DIR, 'tests'))
+import turbine
+import fakeagent
+
+def bench(client, model_name, x, shm, iterations):
+    for i in range(10): # warm up
+        client.predict(model_name, x, shm=shm)
+    start = time.perf_counter()
+    for i in range(iterations):
+        client.predict(model_name, x, shm=shm)
+    return (time.perf_counter() - start) / iterations
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 8, 64, 512], help='N of the (N,6,10,10) inputs')
+    parser.add_argument('--iterations', type=int, default=500, help='# of predictions per transport')
+    args = parser.parse_args()
+
+    socket_path = os.path.join(tempfile.mkdtemp(), 'agent.sock')
+    print("%8s %10s %12s %12s" % ('N', 'KB', 'byte_data', 'shm'))
+    for batch_size in args.batch_sizes:
+        server, servicer = fakeagent.serve(socket_path, fakeagent.FakeAgent(batch_size))
+        client = turbine.EdgeAgentClient(socket_path)
+        client.load_model('model', '/models/model')
+        x = np.random.rand(batch_size, 6, 10, 10).astype(np.float32)
+        byte_data_time = bench(client, 'model', x, False, args.iterations)
+        shm_time = bench(client, 'model', x, True, args.iterations)
+        print("%8d %10.1f %10.3fms %10.3fms" % (batch_size, x.nbytes / 1024, byte_data_time * 1000, shm_time * 1000))
+        client.unload_model('model')
+        del client
+        server.stop(None)
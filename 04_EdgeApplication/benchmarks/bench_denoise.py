@@ -0,0 +1,58 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+'''
+    Per-tick cost of denoising the window of the main loop:
+        before: list of samples -> np.array -> wavelet_denoise per feature
+        after: RingBuffer + WaveletDenoiser (one multi-channel transform)
+    Usage: python benchmarks/bench_denoise.py [--ticks N]
+'''
+import os
+import sys
+import time
+import argparse
+import numpy as np
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import turbine
+
+MIN_NUM_SAMPLES = 500
+NUM_FEATURES = 6
+TIME_STEPS = 100
+STEP = 10
+
+def bench_before(readings, raw_std):
+    samples = [r for r in readings[:MIN_NUM_SAMPLES + 1]]
+    start = time.process_time()
+    for r in readings[MIN_NUM_SAMPLES + 1:]:
+        data = np.array(samples)
+        samples = samples[1:]
+        data = np.array([turbine.wavelet_denoise(data[:,i], raw_std[i], 'db6') for i in range(NUM_FEATURES)])
+        data = data.transpose((1,0))[-(TIME_STEPS+STEP):]
+        samples.append(r)
+    return data, time.process_time() - start
+
+def bench_after(readings, raw_std):
+    samples = turbine.RingBuffer(MIN_NUM_SAMPLES + 1, NUM_FEATURES)
+    denoiser = turbine.WaveletDenoiser(samples, raw_std, 'db6')
+    for r in readings[:MIN_NUM_SAMPLES + 1]:
+        samples.append(r)
+    start = time.process_time()
+    for r in readings[MIN_NUM_SAMPLES + 1:]:
+        data = denoiser.denoise(TIME_STEPS+STEP)
+        samples.append(r)
+    return data, time.process_time() - start
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--ticks', type=int, default=2000, help='# of predictions')
+    args = parser.parse_args()
+
+    np.random.seed(42)
+    raw_std = np.random.rand(NUM_FEATURES) * 0.1 + 0.01
+    readings = np.random.rand(MIN_NUM_SAMPLES + 1 + args.ticks, NUM_FEATURES)
+
+    before, before_time = bench_before(readings, raw_std)
+    after, after_time = bench_after(readings, raw_std)
+    print("window: %dx%d; ticks: %d" % (MIN_NUM_SAMPLES + 1, NUM_FEATURES, args.ticks))
+    print("before: %.3f ms/tick" % (before_time * 1000 / args.ticks))
+    print("after:  %.3f ms/tick" % (after_time * 1000 / args.ticks))
+    print("max abs error: %g" % np.abs(before - after).max())
@@ -0,0 +1,42 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+'''
+    Scalar (math) vs vectorized (numpy) quaternion to euler conversion:
+    a batch of N quaternions and a single reading (the per-sample call of run.py)
+    Usage: python benchmarks/bench_euler.py [--rows N]
+'''
+import os
+import sys
+import time
+import timeit
+import argparse
+import numpy as np
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import turbine
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=1000000, help='# of quaternions')
+    args = parser.parse_args()
+
+    np.random.seed(42)
+    q = np.random.uniform(-1, 1, (args.rows, 4))
+    q /= np.linalg.norm(q, axis=1, keepdims=True)
+
+    start = time.perf_counter()
+    expected = np.array([turbine.euler_from_quaternion(*r) for r in q.tolist()])
+    scalar_time = time.perf_counter() - start
+    out = np.empty((args.rows, 3))
+    start = time.perf_counter()
+    turbine.euler_from_quaternions(q, out=out)
+    vector_time = time.perf_counter() - start
+    print("rows: %d" % args.rows)
+    print("scalar:     %.3f s" % scalar_time)
+    print("vectorized: %.3f s" % vector_time)
+    print("max abs diff: %g" % np.abs(out - expected).max())
+
+    r = q[0].tolist()
+    scalar_call = min(timeit.repeat(lambda: turbine.euler_from_quaternion(*r), number=10000, repeat=5)) / 10000
+    row = q[:1].copy()
+    vector_call = min(timeit.repeat(lambda: turbine.euler_from_quaternions(row), number=10000, repeat=5)) / 10000
+    print("single reading: scalar %.2f us/call; vectorized %.2f us/call" % (scalar_call * 1e6, vector_call * 1e6))
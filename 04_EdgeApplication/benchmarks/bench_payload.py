@@ -0,0 +1,50 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+'''
+    Bytes per record and encode CPU per batch of the telemetry payload encoders,
+    for text readings (string tokens) and float readings (replay/binary frames)
+    Usage: python benchmarks/bench_payload.py [--batch-size N] [--iterations N]
+'''
+import os
+import sys
+import time
+import argparse
+import numpy as np
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import turbine
+
+NUM_FIELDS = 20
+
+def readings(batch_size, text):
+    np.random.seed(42)
+    data = np.random.rand(batch_size, NUM_FIELDS).astype(np.float32) * 100
+    data[:,0] = np.arange(batch_size) * 50 + 123456789 # arduino_timestamp
+    data[:,1] = 1024 # free memory
+    if text:
+        return [np.array(['%.3f' % v for v in r]) for r in data]
+    return [r.astype(np.float64) for r in data]
+
+def bench(encoder, records, iterations):
+    start = time.process_time()
+    for i in range(iterations):
+        payload = encoder.encode([encoder.encode_record(r)[0] for r in records])
+    return len(payload) / len(records), (time.process_time() - start) * 1000 / iterations
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--batch-size', type=int, default=500, help='# of readings per payload')
+    parser.add_argument('--iterations', type=int, default=20, help='# of batches encoded')
+    args = parser.parse_args()
+
+    encoders = [
+        ('json', turbine.JsonPayloadEncoder()),
+        ('columnar', turbine.ColumnarPayloadEncoder(NUM_FIELDS)),
+        ('columnar+zlib', turbine.ColumnarPayloadEncoder(NUM_FIELDS, compress=True))
+    ]
+    for mode, text in (('text (string tokens)', True), ('replay/binary (float readings)', False)):
+        ts = time.time()
+        records = [{'ts': ts + i * 0.05, 'data': d} for i, d in enumerate(readings(args.batch_size, text))]
+        print("%s, batch of %d readings:" % (mode, args.batch_size))
+        for name, encoder in encoders:
+            size, cpu = bench(encoder, records, args.iterations)
+            print("  %-14s %6.1f B/record %6.1f ms/batch" % (name, size, cpu))
@@ -0,0 +1,66 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+'''
+    Per-sample cost of keeping the window of the latest samples:
+        before: list of samples -> np.array of the window -> samples[1:]
+        after: RingBuffer.append + zero-copy view of the window
+    Reports the CPU per sample, the CPU per second of data at each sample
+    rate (--rates) and the peak memory allocated (tracemalloc)
+    Usage: python benchmarks/bench_ringbuffer.py [--samples N] [--rates 20 200]
+'''
+import os
+import sys
+import time
+import argparse
+import tracemalloc
+import numpy as np
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import turbine
+
+WINDOW = 501 # MIN_NUM_SAMPLES + 1
+NUM_FEATURES = 6
+
+def run_before(readings):
+    samples = []
+    for r in readings:
+        samples.append(r)
+        if len(samples) >= WINDOW:
+            data = np.array(samples)
+            samples = samples[1:]
+    return data
+
+def run_after(readings):
+    samples = turbine.RingBuffer(WINDOW, NUM_FEATURES)
+    for r in readings:
+        samples.append(r)
+        if samples.is_full():
+            data = samples.last()
+    return data
+
+def measure(func, readings):
+    start = time.process_time()
+    data = func(readings)
+    cpu = time.process_time() - start
+    tracemalloc.start()
+    func(readings)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return data, cpu / len(readings), peak
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--samples', type=int, default=20000, help='# of samples appended')
+    parser.add_argument('--rates', type=int, nargs='+', default=[20, 200], help='sample rates (Hz) to report')
+    args = parser.parse_args()
+
+    np.random.seed(42)
+    # the readings are tuples, as built by parse_reading
+    readings = [tuple(r) for r in np.random.rand(args.samples, NUM_FEATURES).tolist()]
+    print("window: %dx%d; samples: %d" % (WINDOW, NUM_FEATURES, args.samples))
+    results = {}
+    for name, func in (('before', run_before), ('after', run_after)):
+        data, cpu, peak = measure(func, readings)
+        results[name] = data
+        rates = '; '.join('%d Hz: %.2f ms CPU/s' % (rate, cpu * rate * 1000) for rate in args.rates)
+        print("%-6s %8.2f us/sample; peak alloc %6.1f KB; %s" % (name + ':', cpu * 1e6, peak / 1024, rates))
+    print("same window: %s" % np.array_equal(results['before'], results['after']))
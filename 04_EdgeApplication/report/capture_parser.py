@@ -0,0 +1,201 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import json
+import base64
+import time
+import struct
+import zlib
+import queue
+import threading
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone, timedelta
+from dateutil.parser import isoparse
+
+# columnar payload of the logs, shared by both lambdas
+COLUMNAR_MAGIC = b'WTLC'
+COLUMNAR_FLAG_ZLIB = 0x01
+EPOCH = datetime(1970, 1, 1)
+COLUMNAR_HEADER = struct.Struct('<4sBBHqI') # magic, version, flags, num_fields, base_ts (ms), num_records
+
+__STOP__ = object()
+
+def format_timestamp(ts_ms):
+    '''
+        ms since epoch to the ISO format used in the logs (UTC)
+    '''
+    ts = EPOCH + timedelta(milliseconds=ts_ms)
+    return "%s+00:00" % ts.strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3]
+
+def decode_columnar_logs(payload):
+    '''
+        Convert a columnar payload (turbine/payload.py: ColumnarPayloadEncoder)
+        to the json format of the logs
+    '''
+    magic, version, flags, num_fields, base_ts, num_records = COLUMNAR_HEADER.unpack_from(payload)
+    if magic != COLUMNAR_MAGIC or version != 1:
+        raise Exception("Invalid columnar payload")
+    body = payload[COLUMNAR_HEADER.size:]
+    if flags & COLUMNAR_FLAG_ZLIB:
+        body = zlib.decompress(body)
+    deltas = struct.unpack_from('<%di' % num_records, body)
+    columns = [struct.unpack_from('<%df' % num_records, body, 4 * num_records * (i + 1)) for i in range(num_fields)]
+    logs = []
+    ts_ms = base_ts
+    for i in range(num_records):
+        ts_ms += deltas[i]
+        logs.append({
+            'ts': format_timestamp(ts_ms),
+            'data': [float('%.7g' % c[i]) for c in columns]
+        })
+    return logs
+
+def to_epoch_ms(text):
+    '''
+        Convert an ISO 8601 timestamp (UTC if it has no offset) to ms since epoch
+    '''
+    try:
+        # ~30x faster than isoparse
+        ts = datetime.fromisoformat(text[:-1] + '+00:00' if text.endswith('Z') else text)
+    except ValueError:
+        ts = isoparse(text) # formats fromisoformat doesn't support (python < 3.11)
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return int(round(ts.timestamp() * 1000))
+
+def event_timestamps(metadata, default=None):
+    '''
+        Inference timestamps (ms since epoch) of a batch of predictions, taken
+        from their eventMetadata. The predictions without it get default (now)
+    '''
+    default = int(round(time.time() * 1000)) if default is None else default
+    parsed = {} # the predictions of a batched capture share the timestamp
+    timestamps = np.empty(len(metadata), dtype=np.int64)
+    for i, meta in enumerate(metadata):
+        text = meta.get('inferenceTime')
+        if text not in parsed:
+            parsed[text] = default if text is None else to_epoch_ms(text)
+        timestamps[i] = parsed[text]
+    return timestamps
+
+def decode_tensors(encoded, num_values, dtype='<f4'):
+    '''
+        Decode a list of base64 tensors with num_values elements each
+        into a single (N, num_values) array
+    '''
+    if len(encoded) == 0:
+        return np.empty((0, num_values), dtype=dtype)
+    if any(e.endswith('=') for e in encoded):
+        # padded tensors can't be decoded together
+        raw = b''.join(base64.b64decode(e) for e in encoded)
+    else:
+        raw = base64.b64decode(''.join(encoded))
+    return np.frombuffer(raw, dtype=dtype).reshape(len(encoded), num_values)
+
+def iter_capture_batches(body, num_values=6, batch_size=1000, chunk_size=64*1024, source=''):
+    '''
+        Parse a SageMaker Edge Manager capture file (json lines) streamed
+        from S3 (StreamingBody, or any object with iter_lines). Batched
+        captures have one input/output tensor pair per prediction, plus
+        an optional last input tensor with the json list of the turbines.
+        Yields (metadata, inputs, outputs) for each batch_size predictions:
+            metadata: list with the eventMetadata of each prediction, plus
+                predictionId: "<source>:<index of the prediction in the file>",
+                the same every time the file is parsed
+                turbineId: name of the turbine (None in older captures)
+            inputs, outputs: float32 arrays (N, num_values)
+        Only one batch is kept in memory, regardless of the file size
+    '''
+    metadata, inputs, outputs = [], [], []
+    index = 0
+    for line in body.iter_lines(chunk_size=chunk_size):
+        if len(line.strip()) == 0:
+            continue
+        log = json.loads(line)
+        input_tensors, output_tensors = log['deviceFleetInputs'], log['deviceFleetOutputs']
+        turbines = [None] * len(output_tensors)
+        if len(input_tensors) == len(output_tensors) + 1:
+            turbines = json.loads(base64.b64decode(input_tensors[-1]['data']))
+        for input_tensor, output_tensor, turbine_id in zip(input_tensors, output_tensors, turbines):
+            meta = dict(log['eventMetadata'])
+            meta['predictionId'] = '%s:%d' % (source, index)
+            meta['turbineId'] = turbine_id
+            index += 1
+            metadata.append(meta)
+            inputs.append(input_tensor['data'])
+            outputs.append(output_tensor['data'])
+        if len(metadata) >= batch_size:
+            yield metadata, decode_tensors(inputs, num_values), decode_tensors(outputs, num_values)
+            metadata, inputs, outputs = [], [], []
+    if len(metadata) > 0:
+        yield metadata, decode_tensors(inputs, num_values), decode_tensors(outputs, num_values)
+
+def get_capture_batches(s3_client, bucket, key, num_values=6, batch_size=1000):
+    '''
+        Stream a capture file from S3 and parse it with iter_capture_batches
+    '''
+    body = s3_client.get_object(Bucket=bucket, Key=key)['Body']
+    try:
+        for batch in iter_capture_batches(body, num_values, batch_size, source='%s/%s' % (bucket, key)):
+            yield batch
+    finally:
+        body.close()
+
+def map_ordered(func, items, max_workers=4, max_pending=2):
+    '''
+        Run the generator func(item) for all the items concurrently, in a
+        thread pool, and yield the results in the order of the items: all the
+        results of the first item, then the results of the second one, etc.
+        Each item runs at most max_pending results ahead of the consumer,
+        so the memory is bounded by max_workers * max_pending results.
+        An exception raised by func is raised by the consumer
+    '''
+    stop = threading.Event() # the consumer gave up
+    def put(results, result, error=None):
+        while not stop.is_set():
+            try:
+                results.put((result, error), timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def run(item, results):
+        try:
+            if stop.is_set():
+                return
+            for result in func(item):
+                if not put(results, result):
+                    return
+            put(results, __STOP__)
+        except Exception as e:
+            put(results, __STOP__, e)
+
+    executor = ThreadPoolExecutor(max_workers)
+    try:
+        # the pool starts the items in order, so the one being consumed is always running
+        queues = []
+        for item in items:
+            queues.append(queue.Queue(max_pending))
+            executor.submit(run, item, queues[-1])
+        for results in queues:
+            while True:
+                result, error = results.get()
+                if error is not None:
+                    raise error
+                if result is __STOP__:
+                    break
+                yield result
+    finally:
+        stop.set()
+        executor.shutdown(wait=True)
+
+def iter_records_batches(s3_client, records, num_values=6, batch_size=1000, max_workers=4):
+    '''
+        Stream the capture files of the Records of an S3 event concurrently.
+        Yields (metadata, inputs, outputs) batches (see iter_capture_batches),
+        in the order of the records
+    '''
+    def parse(r):
+        return get_capture_batches(s3_client, r['s3']['bucket']['name'], r['s3']['object']['key'], num_values, batch_size)
+    return map_ordered(parse, records, max_workers)
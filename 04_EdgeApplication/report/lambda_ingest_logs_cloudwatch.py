@@ -2,60 +2,134 @@
 # SPDX-License-Identifier: MIT-0
 import json
 import os
-import io
 import boto3
-import time
 import base64
-import struct
+import numpy as np
+from capture_parser import iter_records_batches, event_timestamps, to_epoch_ms, decode_columnar_logs
 
 logs_client = boto3.client('logs')
 s3_client = boto3.client('s3')
+capture_max_workers = int(os.getenv("CAPTURE_MAX_WORKERS", 4)) # capture files streamed concurrently
+
+# PutLogEvents limits
+MAX_BATCH_BYTES = 1048576 # sum of the messages (utf-8) + EVENT_OVERHEAD per event
+MAX_BATCH_EVENTS = 10000
+MAX_BATCH_SPAN = 24 * 60 * 60 * 1000 # ms between the first and the last event
+EVENT_OVERHEAD = 26
+
+class LogShipper(object):
+    def __init__(self, client, log_group_name, max_retries=3):
+        '''
+            Sends log events to the streams of a log group with PutLogEvents.
+            The events are sorted by timestamp and split into batches that
+            respect the limits of the API (bytes, # of events and time span).
+            The sequence token returned by each call is cached per stream and
+            used by the next call (also by the next invocations of a warm
+            lambda), so the streams don't need to be described. If the token
+            is invalid (another writer, cold start), the call is retried with
+            the token expected by CloudWatch, up to max_retries times
+        '''
+        self.client = client
+        self.log_group_name = log_group_name
+        self.max_retries = max_retries
+        self.sequence_tokens = {} # log stream: next sequence token
+        self.num_calls = 0
+        self.num_events = 0
+        self.num_rejected = 0
+
+    def batches(self, events):
+        '''
+            Split the events (sorted by timestamp) into batches
+        '''
+        batch, batch_bytes = [], 0
+        for e in sorted(events, key=lambda e: e['timestamp']):
+            size = len(e['message'].encode('utf-8')) + EVENT_OVERHEAD
+            if len(batch) > 0 and (len(batch) >= MAX_BATCH_EVENTS or batch_bytes + size > MAX_BATCH_BYTES or
+                    e['timestamp'] - batch[0]['timestamp'] >= MAX_BATCH_SPAN):
+                yield batch
+                batch, batch_bytes = [], 0
+            batch.append(e)
+            batch_bytes += size
+        if len(batch) > 0:
+            yield batch
+
+    def __expected_token__(self, log_stream_name, error):
+        token = error.response.get('expectedSequenceToken')
+        if token is None:
+            resp = self.client.describe_log_streams(logGroupName=self.log_group_name, logStreamNamePrefix=log_stream_name)
+            for stream in resp['logStreams']:
+                if stream['logStreamName'] == log_stream_name:
+                    token = stream.get('uploadSequenceToken')
+        return token
+
+    def __put_batch__(self, log_stream_name, batch):
+        for attempt in range(self.max_retries + 1):
+            params = dict(logGroupName=self.log_group_name, logStreamName=log_stream_name, logEvents=batch)
+            token = self.sequence_tokens.get(log_stream_name)
+            if token is not None:
+                params['sequenceToken'] = token
+            self.num_calls += 1
+            try:
+                resp = self.client.put_log_events(**params)
+            except self.client.exceptions.InvalidSequenceTokenException as e:
+                self.sequence_tokens[log_stream_name] = self.__expected_token__(log_stream_name, e)
+                continue
+            except self.client.exceptions.DataAlreadyAcceptedException as e:
+                # a previous (timed out) call already sent this batch
+                self.sequence_tokens[log_stream_name] = self.__expected_token__(log_stream_name, e)
+                return
+            self.sequence_tokens[log_stream_name] = resp.get('nextSequenceToken')
+            self.num_events += len(batch)
+            if resp.get('rejectedLogEventsInfo') is not None:
+                self.num_rejected += 1
+                print("Rejected log events: %s" % resp['rejectedLogEventsInfo'])
+            return
+        raise Exception("Invalid sequence token after %d retries: %s" % (self.max_retries, log_stream_name))
+
+    def put_events(self, log_stream_name, events):
+        for batch in self.batches(events):
+            self.__put_batch__(log_stream_name, batch)
+
+    def stats(self):
+        return {'calls': self.num_calls, 'events': self.num_events, 'rejected_batches': self.num_rejected}
+
+# predictions parsed at a time: ~1 PutLogEvents call each
+PREDS_BATCH_SIZE = 3000
+
+# created once per lambda container, so the sequence tokens are kept between invocations
+shipper = LogShipper(logs_client, '/wind-turbine-farm')
 
 def put_events(log_stream_name, data):
-    resp = logs_client.describe_log_streams(
-        logGroupName='/wind-turbine-farm',
-        logStreamNamePrefix=log_stream_name
-    )
-    next_token=resp['logStreams'][0].get('uploadSequenceToken')
-    params = dict(
-        logGroupName='/wind-turbine-farm',
-        logStreamName=log_stream_name,
-        logEvents=data
-    )
-    if next_token is not None:
-        params['sequenceToken'] = next_token
-    logs_client.put_log_events(**params)
-    
+    shipper.put_events(log_stream_name, data)
+
 
 def lambda_handler(event, context):
     #print("Received event: " + json.dumps(event, indent=2))
     # get the device name and check for the message type: logs or preds
     if event.get('Records') is not None:
-        for r in event['Records']:
-            bucket = r['s3']['bucket']['name']
-            key = r['s3']['object']['key']
-            
-            with io.BytesIO() as data:
-                s3_client.download_fileobj(bucket, key, data)
-                data.seek(0)
-                log_data = []
-                for line in data.readlines():
-                    log = json.loads(line)
-                    inputs = struct.unpack('6f', base64.b64decode(log['deviceFleetInputs'][0]['data']))
-                    outputs = struct.unpack('6f', base64.b64decode(log['deviceFleetOutputs'][0]['data']))
-                    log_data.append({
-                        'timestamp': round(time.time() * 1000),
-                        'message': ' '.join([str(i) for i in (inputs + outputs)])
-                    })
+        # the capture files are streamed and decoded in batches, concurrently,
+        # and the batches are sent one by one, in the order of the records
+        for metadata, inputs, outputs in iter_records_batches(s3_client, event['Records'], 6, PREDS_BATCH_SIZE, capture_max_workers):
+            log_data = []
+            for meta, ts_ms, values in zip(metadata, event_timestamps(metadata).tolist(), np.hstack((inputs, outputs)).tolist()):
+                # the turbines of a multi-turbine device are named as in the sensors stream
+                device_id = meta['deviceId'] if meta['turbineId'] is None else meta['turbineId']
+                log_data.append({
+                    'timestamp': ts_ms,
+                    'message': ' '.join([device_id] + [str(i) for i in values])
+                })
             put_events('preds', log_data)
     elif event.get('device_name') is not None:
         device_name = event['device_name']
         if event['msg_type'] == 'logs':
+            # columnar payloads arrive base64 encoded by the IoT rule
+            if event.get('payload') is not None:
+                event['logs'] = decode_columnar_logs(base64.b64decode(event['payload']))
             log_data = []
             for logs in event['logs']:
                 data = logs['data']
                 log_data.append({
-                    'timestamp': round(time.time() * 1000),
+                    'timestamp': to_epoch_ms(logs['ts']),
                     'message': ' '.join([logs['ts'], device_name] + [str(i) for i in data])
                 })
             put_events('sensors', log_data)
@@ -3,6 +3,11 @@
 
 # Set the following env var in your lambda:
 # ELASTIC_SEARCH_URL = https://<<YOUR_ELASTICSEARCH_DOMAIN_PREFIX_HERE>>.<<REGION>>.es.amazonaws.com
+# Optional env vars (limits of each _bulk request):
+# ES_BULK_MAX_RECORDS = 1000
+# ES_BULK_MAX_BYTES = 5242880
+# ES_BULK_MAX_RETRIES = 3
+# CAPTURE_MAX_WORKERS = 4 (capture files streamed concurrently)
 #
 # You need to create these two indices in you Elasticsearch domain (use curl or the Dev Tools console from Kibana to do this):
 # PUT wind_turbine_logs
@@ -39,14 +44,153 @@
 #   }
 # }
 import json
-import urllib.request
+import hashlib
+import http.client
+import urllib.parse
+import time
 import os
 import io
 import boto3
-from datetime import datetime
+import base64
+from capture_parser import iter_records_batches, event_timestamps, decode_columnar_logs, format_timestamp
 
 elastic_url = os.getenv("ELASTIC_SEARCH_URL")
 s3_client = boto3.client('s3')
+capture_max_workers = int(os.getenv("CAPTURE_MAX_WORKERS", 4))
+
+class BulkIndexer(object):
+    def __init__(self, url, max_records=1000, max_bytes=5*1024*1024, max_retries=3, backoff=0.5, timeout=10):
+        '''
+            Sends the documents to Elasticsearch in batches, using the _bulk
+            API (NDJSON: one action line + one document line per record).
+            A batch is sent when it reaches max_records or max_bytes, or by flush().
+            The HTTP connection is kept alive and reused by the next requests
+            (and by the next invocations of a warm lambda).
+            The items rejected with 429 or 5xx (and the whole batch, if the
+            request fails) are sent again, up to max_retries times, waiting
+            backoff * 2^attempt seconds. The other rejected items are discarded.
+            The documents are indexed with deterministic ids, so sending a batch
+            again (e.g. the request reached Elasticsearch but timed out) doesn't
+            create duplicates. A kept-alive connection closed by the server is
+            reopened once, without waiting for the backoff
+        '''
+        parsed = urllib.parse.urlparse(url)
+        self.https = parsed.scheme == 'https'
+        self.host = parsed.hostname
+        self.port = parsed.port
+        self.path = parsed.path.rstrip('/') + '/_bulk'
+        self.max_records = max_records
+        self.max_bytes = max_bytes
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.connection = None
+        self.pending = [] # (action + document) lines
+        self.pending_bytes = 0
+        self.num_requests = 0
+        self.num_indexed = 0
+        self.num_retried = 0
+        self.num_failed = 0
+        self.num_reconnects = 0 # stale kept-alive connections
+
+    def __connect__(self):
+        if self.connection is None:
+            if self.https:
+                self.connection = http.client.HTTPSConnection(self.host, self.port, timeout=self.timeout)
+            else:
+                self.connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        return self.connection
+
+    def add(self, record, type, doc_id=None):
+        '''
+            Add a record to the index wind_turbine_<type>.
+            doc_id: _id of the document (generated by Elasticsearch if None)
+        '''
+        action = {'_index': 'wind_turbine_%s' % type, '_type': 'data'}
+        if doc_id is not None:
+            action['_id'] = doc_id
+        item = '%s\n%s\n' % (json.dumps({'index': action}), json.dumps(record))
+        item = item.encode('utf-8')
+        if len(self.pending) > 0 and self.pending_bytes + len(item) > self.max_bytes:
+            self.flush()
+        self.pending.append(item)
+        self.pending_bytes += len(item)
+        if len(self.pending) >= self.max_records:
+            self.flush()
+
+    def __post__(self, body):
+        '''
+            POST a _bulk request and return the parsed response
+        '''
+        while True:
+            self.num_requests += 1
+            conn = self.__connect__()
+            reused = conn.sock is not None
+            try:
+                conn.request('POST', self.path, body=body, headers={'Content-Type': 'application/x-ndjson'})
+                resp = conn.getresponse()
+                data = resp.read() # the whole response must be read to reuse the connection
+                break
+            except ConnectionError:
+                conn.close() # reconnects in the next request
+                if not reused:
+                    raise
+                # the server closed the idle connection: try again right away
+                self.num_reconnects += 1
+            except Exception:
+                conn.close()
+                raise
+        if resp.status != 200:
+            raise Exception("Bulk request failed: %d %s" % (resp.status, data[:200]))
+        return json.loads(data)
+
+    def flush(self):
+        '''
+            Send the pending records
+        '''
+        items = self.pending
+        self.pending = []
+        self.pending_bytes = 0
+        attempt = 0
+        while len(items) > 0:
+            try:
+                resp = self.__post__(b''.join(items))
+                retry = []
+                for item, result in zip(items, resp['items']):
+                    status = result['index']['status']
+                    if status < 300:
+                        self.num_indexed += 1
+                    elif status == 429 or status >= 500:
+                        retry.append(item)
+                    else:
+                        self.num_failed += 1
+                        print(result['index'].get('error'), item)
+            except Exception as e:
+                print(e)
+                retry = items
+            if len(retry) > 0 and attempt >= self.max_retries:
+                self.num_failed += len(retry)
+                print("%d records discarded after %d retries" % (len(retry), self.max_retries))
+                break
+            if len(retry) > 0:
+                time.sleep(self.backoff * 2 ** attempt)
+                self.num_retried += len(retry)
+                attempt += 1
+            items = retry
+
+    def stats(self):
+        return {
+            'requests': self.num_requests, 'indexed': self.num_indexed,
+            'retried': self.num_retried, 'failed': self.num_failed, 'reconnects': self.num_reconnects
+        }
+
+# created once per lambda container, so the connection survives between invocations
+indexer = BulkIndexer(
+    elastic_url,
+    int(os.getenv("ES_BULK_MAX_RECORDS", 1000)),
+    int(os.getenv("ES_BULK_MAX_BYTES", 5*1024*1024)),
+    int(os.getenv("ES_BULK_MAX_RETRIES", 3))
+)
 
 # labels we want to use in the Elastic Search payload
 log_labels = [
@@ -57,47 +201,49 @@ log_labels = [
 
 pred_labels= ["roll", "pitch", "yaw", "wind_speed_rps", "rps", "voltage" ]
 
-# add a new record to elastic search
-def put_record(record, type):
-    base_url = elastic_url
-    path = '/wind_turbine_%s/data' % type
-    url = base_url + path
-    header={'Content-type': 'application/json'}
-    try:
-        data = json.dumps(record)
-        req = urllib.request.Request(url=url, headers=header, method='POST', data=data.encode('utf-8') )
-        res = urllib.request.urlopen(req, timeout=5)
-    except Exception as e:
-        print(record, type, e)
+def document_id(*parts):
+    '''
+        Deterministic _id of a document, derived from what identifies it
+    '''
+    return hashlib.sha1('/'.join(parts).encode('utf-8')).hexdigest()
+
+# add a new record to elastic search (sent in batches)
+def put_record(record, type, doc_id=None):
+    indexer.add(record, type, doc_id)
 
 def lambda_handler(event, context):
+    try:
+        process_event(event)
+    finally:
+        indexer.flush()
+
+def process_event(event):
     #print("Received event: " + json.dumps(event, indent=2))
     # get the device name and check for the message type: logs or preds
     if event.get('Records') is not None:
-        for r in event['Records']:
-            bucket = r['s3']['bucket']['name']
-            key = r['s3']['object']['key']
-            
-            with io.BytesIO() as data:
-                s3_client.download_fileobj(bucket, key, data)
-                data.seek(0)
-                log_data = []
-                for line in data.readlines():
-                    log = json.loads(line)
-                    meta = log['eventMetadata']
-                    inputs = struct.unpack('6f', base64.b64decode(log['deviceFleetInputs'][0]['data']))
-                    outputs = struct.unpack('6f', base64.b64decode(log['deviceFleetOutputs'][0]['data']))
-                    item = {
-                        "deviceId": meta['deviceId'],
-                        "eventTime": "%s+00:00" % datetime.now().strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3]
-                    }
-                    for i,d in enumerate(pred_labels):
-                        item["mean_pred_%s" % d] = str(inputs[i])
-                        item["anomaly_%s" % d] = str(outputs[i])
-                    put_record(item, 'preds')
+        # the capture files are streamed and decoded in batches, concurrently,
+        # and merged in the order of the records
+        for metadata, inputs, outputs in iter_records_batches(s3_client, event['Records'], len(pred_labels), max_workers=capture_max_workers):
+            timestamps = event_timestamps(metadata)
+            for meta, ts_ms, inputs, outputs in zip(metadata, timestamps.tolist(), inputs.tolist(), outputs.tolist()):
+                # the turbines of a multi-turbine device are named as in their logs
+                device_id = meta['deviceId'] if meta['turbineId'] is None else meta['turbineId']
+                item = {
+                    "deviceId": device_id,
+                    "turbineId": device_id.replace('jetson-', 'Turbine '),
+                    "eventTime": format_timestamp(ts_ms)
+                }
+                for i,d in enumerate(pred_labels):
+                    item["mean_pred_%s" % d] = str(inputs[i])
+                    item["anomaly_%s" % d] = str(outputs[i])
+                # bucket/key of the capture file and position of the prediction
+                put_record(item, 'preds', document_id(meta['predictionId']))
     elif event.get('device_name') is not None:
         device_name = event['device_name']
         if event['msg_type'] == 'logs':
+            # columnar payloads arrive base64 encoded by the IoT rule
+            if event.get('payload') is not None:
+                event['logs'] = decode_columnar_logs(base64.b64decode(event['payload']))
             log_data = []
             for logs in event['logs']:
                 data = logs['data']
@@ -111,7 +257,8 @@ def lambda_handler(event, context):
                 for i,d in enumerate(log_labels):
                     item[d] = data[i+2]
                 log_data.append(item)
-                put_record(item, 'logs')
+                # ts has ms resolution and a burst of readings can share it: the arduino timestamp tells them apart
+                put_record(item, 'logs', document_id(device_name, str(data[0]), logs['ts']))
 
             csv_buffer = io.BytesIO()
             csv_buffer.write(json.dumps(log_data).encode('utf-8'))
@@ -11,10 +11,10 @@ import argparse
 import time
 import requests
 import gzip
+import functools
 
 import turbine
 
-from datetime import datetime
 
 if __name__ == '__main__':
     # parse the input parameters    
@@ -22,13 +22,40 @@ if __name__ == '__main__':
 
     parser.add_argument('--test-mode', action="store_true", help="Use a dummy file as sensors readings")
     parser.add_argument('--inject-noise', action="store_true", help="Add random noise to the raw data")
+    parser.add_argument('--replay-rate', type=float, default=1.0, help="Test mode playback rate: 0 = as fast as possible, 1 = real-time, N = N x real-time")
     parser.add_argument("--debug", action="store_true", help='Enable debugging messages')    
 
     parser.add_argument('--agent-socket', type=str, default="/tmp/edge_agent", help='The unix socket path created by the agent')
+    parser.add_argument('--agent-shm', action="store_true", help='Send the input tensors to the agent through shared memory')
+    parser.add_argument('--predictions-interval', type=float, default=1.0, help='Interval in seconds between the predictions')
+    parser.add_argument('--telemetry-queue-size', type=int, default=1000, help='Max # of readings waiting to be sent to the cloud logger')
+    parser.add_argument('--telemetry-format', type=str, default="json", choices=["json", "columnar"], help='Payload format of the readings sent to the cloud')
+    parser.add_argument('--telemetry-zlib', action="store_true", help='Compress the columnar telemetry payloads with zlib')
+    parser.add_argument('--telemetry-spool-path', type=str, default=os.path.join(os.environ["SM_EDGE_AGENT_HOME"], 'telemetry_spool'), help='Dir where the telemetry is kept while the cloud is unreachable. Empty = disabled')
+    parser.add_argument('--telemetry-spool-size', type=int, default=64, help='Max size in MB of the telemetry spool. The oldest data is discarded when it is full')
+    parser.add_argument('--telemetry-drain-rate', type=int, default=32, help='Max rate in KB/s used to send the spooled telemetry, after reconnecting')
+    parser.add_argument('--capture-queue-size', type=int, default=100, help='Max # of predictions waiting to be captured by the agent')
+    parser.add_argument('--capture-batch-size', type=int, default=1, help='Max # of predictions sent to the agent in a single CaptureData request')
+    parser.add_argument('--capture-overflow', type=str, default="drop_newest", choices=["drop_newest", "drop_oldest"], help='What to discard when the capture queue is full')
+    parser.add_argument('--capture-track-status', action="store_true", help='Check the status of the captured data with the agent')
+    parser.add_argument('--capture-timeout', type=float, default=5.0, help='Max time in seconds to wait for the agent to capture a request')
+    parser.add_argument('--model-warmup-iterations', type=int, default=5, help='# of predictions used to warm up a new model before activating it')
+    parser.add_argument('--shadow-mode', action="store_true", help='Evaluate a new model on the live windows, in background, before activating it')
+    parser.add_argument('--shadow-min-windows', type=int, default=100, help='# of windows used to compare a new model with the active one')
+    parser.add_argument('--shadow-max-duration', type=float, default=3600, help='Max time in seconds to evaluate a new model. It is rejected if it does not get enough windows')
+    parser.add_argument('--shadow-max-mae-increase', type=float, default=0.1, help='Max relative increase of the p95 reconstruction MAE accepted to promote a new model')
+    parser.add_argument('--shadow-max-anomaly-rate-increase', type=float, default=0.05, help='Max absolute increase of the anomaly rate accepted to promote a new model')
+    parser.add_argument('--ota-chunk-size', type=int, default=1024, help='Size in KB of the chunks used to download and extract a new model package')
     parser.add_argument('--model-path', type=str, default=os.path.join(os.environ["SM_EDGE_AGENT_HOME"], 'models'), help='Absolute path to the model dir')
 
-    parser.add_argument('--serial-port', type=str, default="/dev/ttyUSB0", help='Path to the USB port used by the wind turbine')
+    parser.add_argument('--serial-port', type=str, nargs='+', default=["/dev/ttyUSB0"], help='Path to the USB port used by the wind turbine. Inform N ports to serve N turbines (in test mode, N replayed turbines)')
+    parser.add_argument('--turbines-config', type=str, default=None, help='Json file with the list of turbines (name, port, baud, format, device_name). It replaces --serial-port')
     parser.add_argument('--serial-baud', type=int, default=115200, help='Serial comm. speed in bits per second')
+    parser.add_argument('--serial-format', type=str, default="text", choices=["text", "binary"], help='Format of the data sent by the firmware: text lines or binary frames')
+
+    parser.add_argument('--credentials-connect-timeout', type=float, default=5.0, help='Max time in seconds to connect to the IoT credentials endpoint')
+    parser.add_argument('--credentials-read-timeout', type=float, default=10.0, help='Max time in seconds to wait for the response of the IoT credentials endpoint')
+    parser.add_argument('--credentials-max-retries', type=int, default=3, help='# of retries (with exponential backoff and jitter) of the failed requests to the IoT credentials endpoint')
 
     parser.add_argument('--sagemaker-edge-configfile-path', type=str, default=os.path.join(os.environ["SM_EDGE_AGENT_HOME"], "sagemaker_edge_config.json"), help='Path to the agent config file')
 
@@ -38,6 +65,10 @@ if __name__ == '__main__':
 
     # load sagemaker edge agent config file
     iot_params = json.loads(open(args.sagemaker_edge_configfile_path, 'r').read())
+    iot_params['credentials_endpoint'] = {
+        'connect_timeout': args.credentials_connect_timeout, 'read_timeout': args.credentials_read_timeout,
+        'max_retries': args.credentials_max_retries
+    }
 
     # retrieve the IoT thing name associated with the edge device
     iot_client = turbine.get_client('iot', iot_params)
@@ -51,7 +82,7 @@ if __name__ == '__main__':
     mqtt_port=8883
 
     # buffer size required to process timeseries data
-    PREDICTIONS_INTERVAL = 1.0 # interval in seconds between the predictions
+    STATS_INTERVAL = 60 # interval in seconds between the pipeline stats logs
     MIN_NUM_SAMPLES = 500         
     INTERVAL = 5 # seconds
     TIME_STEPS = 20 * INTERVAL
@@ -66,150 +97,223 @@ if __name__ == '__main__':
     mean = np.load('statistics/mean.npy')
     std = np.load('statistics/std.npy')
 
+    # turbines served by this process
+    if args.turbines_config:
+        turbines_config = json.loads(open(args.turbines_config, 'r').read())
+    else:
+        turbines_config = [{'port': p} for p in args.serial_port]
+    for i, t in enumerate(turbines_config):
+        t.setdefault('name', 'turbine-%d' % (i + 1))
+        if not t.get('port'):
+            raise Exception("Turbine %d (%s) of %s has no port" % (i + 1, t['name'], args.turbines_config))
+        t.setdefault('baud', args.serial_baud)
+        t.setdefault('format', args.serial_format)
+    num_turbines = len(turbines_config)
+    logging.info("Turbines: %s" % turbines_config)
+
     logging.info("Initializing...")
     # Sends the logs to the cloud via MQTT Topics
-    logger = turbine.Logger(device_name, iot_params)
+    if args.telemetry_format == 'columnar':
+        encoder = turbine.ColumnarPayloadEncoder(NUM_RAW_FEATURES, compress=args.telemetry_zlib)
+    else:
+        encoder = turbine.JsonPayloadEncoder()
+    def create_logger(t):
+        '''
+            Logger of a turbine. Each turbine publishes to its own topic
+            (device_name), but the iot-data client is shared. The spool
+            size and the drain rate are split among the turbines
+        '''
+        spool = None
+        if args.telemetry_spool_path:
+            path = args.telemetry_spool_path if num_turbines == 1 else os.path.join(args.telemetry_spool_path, t['name'])
+            spool = turbine.DiskSpool(path, args.telemetry_spool_size * 1024 * 1024 // num_turbines)
+        name = t.get('device_name', device_name if num_turbines == 1 else '%s-%s' % (device_name, t['name']))
+        return turbine.Logger(name, iot_params, encoder=encoder, spool=spool, max_drain_rate=args.telemetry_drain_rate * 1024 // num_turbines)
 
     # Initialize the Edge Manager agent
     edge_agent = turbine.EdgeAgentClient(args.agent_socket)
     
-    model_loaded = False
-    model_name = None
+    # the new models are loaded and warmed up before replacing the active one
+    active_model = turbine.ActiveModel(
+        edge_agent, (1, NUM_FEATURES, 10, 10), args.model_warmup_iterations, shm=args.agent_shm
+    )
     def model_update_callback(name, version):
-        global model_loaded, model_name
         model_version=str(version)
         model_name = "%s-%s" % (name, model_version.replace('.', '-')) 
         logging.info('New model deployed: %s - %s - %s' % (name, model_version, model_name))
-        resp = edge_agent.load_model(model_name, os.path.join(args.model_path, name, model_version))
-        if resp is None: 
-            logging.error('It was not possible to load the model. Is the agent running?')
-            return
-        model_loaded = True 
+        active_model.swap(model_name, os.path.join(args.model_path, name, model_version))
+
+    # the new models run in background, on the same windows, before replacing the active one
+    shadow = None
+    model_evaluate_callback = None
+    if args.shadow_mode:
+        shadow = turbine.ShadowEvaluator(
+            active_model, thresholds, args.shadow_min_windows, args.shadow_max_duration,
+            args.shadow_max_mae_increase, args.shadow_max_anomaly_rate_increase
+        )
+        def model_evaluate_callback(name, version, done):
+            model_version=str(version)
+            model_name = "%s-%s" % (name, model_version.replace('.', '-'))
+            logging.info('New model to evaluate: %s - %s - %s' % (name, model_version, model_name))
+            shadow.start(model_name, os.path.join(args.model_path, name, model_version), done)
 
     ## Initialize the OTA Model Manager
-    model_manager = turbine.OTAModelUpdate(device_name, iot_params, mqtt_host, mqtt_port, model_update_callback, args.model_path)
+    model_manager = turbine.OTAModelUpdate(
+        device_name, iot_params, mqtt_host, mqtt_port, model_update_callback, args.model_path, args.ota_chunk_size * 1024,
+        model_evaluate_callback, int(args.shadow_max_duration / 60) + 10
+    )
    
     ## Initialize sensors reader
     if args.test_mode:
         logging.info('Using Dummy sensors readings')
         # use a local file to simulate the raw data collected from the turbine's sensors
-        if not os.path.exists('dataset_wind.csv'):
-            req = requests.get('https://aws-ml-blog.s3.amazonaws.com/artifacts/monitor-manage-anomaly-detection-model-wind-turbine-fleet-sagemaker-neo/dataset_wind_turbine.csv.gz')
-            with gzip.GzipFile(fileobj=io.BytesIO(req.content), mode="r:gz") as f:
-                with open('dataset_wind.csv', 'w') as d: d.write(f.read().decode('utf-8'))
-
-        class DummySensors(object):
-            def __init__(self):
-                self.buffer = open('dataset_wind.csv', 'r').readlines()[1:] # skip the file header
-                self.idx = 0
-            def isOpen(self): return True
-            def close(self): pass
-            def readline(self):
-                if self.idx >= len(self.buffer): self.idx = 0
-                reading = self.buffer[self.idx].strip().split(',')[2:] # drop the first two columns
-                reading = reading[0:2] + [reading[3], reading[-1]] + reading[4:-1] # reorganize the columns
-                reading = ",".join(reading).encode('utf-8')
-                self.idx += 1
-                return reading
-
-        turbine_sensors = DummySensors()
+        # the dataset is converted (streaming) into a binary cache only once
+        if not os.path.exists('dataset_wind.npy'):
+            if os.path.exists('dataset_wind.csv'):
+                with open('dataset_wind.csv', 'r') as f:
+                    turbine.build_replay_cache(f, 'dataset_wind.npy')
+            else:
+                with requests.get('https://aws-ml-blog.s3.amazonaws.com/artifacts/monitor-manage-anomaly-detection-model-wind-turbine-fleet-sagemaker-neo/dataset_wind_turbine.csv.gz', stream=True) as req:
+                    req.raise_for_status()
+                    with io.TextIOWrapper(gzip.GzipFile(fileobj=req.raw, mode="rb"), encoding='utf-8') as f:
+                        turbine.build_replay_cache(f, 'dataset_wind.npy')
+
+        num_replay_readings = len(np.load('dataset_wind.npy', mmap_mode='r'))
     else:
-        logging.info('Reading from the sensors of the turbine')
+        logging.info('Reading from the sensors of the turbines')
+
+    def open_sensors(i, t):
+        if args.test_mode:
+            # each turbine replays the dataset from a different point
+            return turbine.SensorsReplay('dataset_wind.npy', args.replay_rate, offset=i * num_replay_readings // num_turbines)
         # Initialize the turbine program
-        turbine_sensors = serial.Serial(port=args.serial_port, baudrate=args.serial_baud)
+        sensors = serial.Serial(port=t['port'], baudrate=t['baud'])
+        if t['format'] == 'binary':
+            sensors = turbine.BinaryFrameReader(sensors)
+        return sensors
 
     logging.info("Defining parameters")
 
-    # main loop
-    samples = []
+    def read_reading(turbine_sensors):
+        '''
+            Get the next (raw) sensors reading: 20 fields
+        '''
+        if isinstance(turbine_sensors, serial.Serial):
+            data = turbine_sensors.readline().decode('utf-8').strip()
+            return np.array(data.split(','))
+        # binary frames or replay: the readings are already parsed
+        return turbine_sensors.read_sample().copy()
+
+    def parse_reading(tokens):
+        '''
+            Select the features used by the model from a raw reading and
+            compute the euler angles. Returns None if the reading is invalid
+        '''
+        # check if the format is correct
+        if len(tokens) != NUM_RAW_FEATURES:
+            print(",".join(tokens))
+            logging.error('Wrong # of features. Expected: %d, Got: %d' % ( NUM_RAW_FEATURES, len(tokens)))
+            time.sleep(1)
+            return None
+        if args.inject_noise:
+            if np.random.randint(50) == 0:
+                tokens[FEATURES_IDX[0:4]] = np.random.rand(4) * 10 # out of the radians range
+            if np.random.randint(20) == 0:
+                tokens[FEATURES_IDX[5]] = np.random.rand(1)[0] * 10 # out of the normalized wind range
+            if np.random.randint(50) == 0:
+                tokens[FEATURES_IDX[6]] = int(np.random.rand(1)[0] * 1000) # out of the normalized voltage range
+        # get only the used features
+        data = [float(tokens[i]) for i in FEATURES_IDX]
+        # compute the euler angles from the quaternion
+        roll,pitch,yaw = turbine.euler_from_quaternion(data[0],data[1],data[2],data[3])
+        return (roll,pitch,yaw, data[4], data[5], data[6])
+
+    # data capture never blocks the inference
+    capture = turbine.CaptureDataQueue(
+        edge_agent, args.capture_queue_size, args.capture_batch_size,
+        overflow=args.capture_overflow, track_status=args.capture_track_status, timeout=args.capture_timeout
+    )
+
+    # per-turbine sensors, window, preprocessing and telemetry
+    # each turbine reads its sensors continuously in a separate thread
+    channels = []
+    for i, t in enumerate(turbines_config):
+        sensors = open_sensors(i, t)
+        channels.append(turbine.TurbineChannel(
+            t['name'], sensors, functools.partial(read_reading, sensors), parse_reading, create_logger(t),
+            MIN_NUM_SAMPLES + 1, NUM_FEATURES, raw_std, args.telemetry_queue_size
+        ))
+        channels[-1].start()
+    # model input: 1 window of TIME_STEPS samples per turbine
+    x = np.empty((num_turbines, NUM_FEATURES, 10, 10), dtype=np.float32)
+
+    # main loop: runs the predictions against the latest window of each turbine
     logging.info("Starting main loop..")
+    next_prediction = time.time()
+    next_stats = next_prediction + STATS_INTERVAL
     try:
-        while turbine_sensors.isOpen(): # runs while it communicates with the arduino
-            if not model_loaded:
+        while any(c.is_running() for c in channels): # runs while it communicates with the arduinos
+            if not active_model.is_loaded():
                 logging.info("Waiting for the model...")
                 time.sleep(5)
                 continue
 
-            # get the (raw) sensors data
-            data = ""
-            try:
-                data = turbine_sensors.readline().decode('utf-8').strip()
-                tokens = np.array(data.split(','))
-
-                # check if the format is correct
-                if len(tokens) != NUM_RAW_FEATURES:
-                    print(data)
-                    logging.error('Wrong # of features. Expected: %d, Got: %d' % ( NUM_RAW_FEATURES, len(tokens)))
-                    time.sleep(1)
+            # prep the data for the model: the windows of all the turbines go in a single batch
+            ready = []
+            for c in channels:
+                data = c.window(TIME_STEPS+STEP) if c.is_running() else None
+                if data is None:
+                    if c.is_running():
+                        logging.info('Buffering [%s] %d/%d... please wait' % (c.name, len(c.samples), MIN_NUM_SAMPLES))
                     continue
-                if args.inject_noise:
-                    if np.random.randint(50) == 0:
-                        tokens[FEATURES_IDX[0:4]] = np.random.rand(4) * 10 # out of the radians range
-                    if np.random.randint(20) == 0:
-                        tokens[FEATURES_IDX[5]] = np.random.rand(1)[0] * 10 # out of the normalized wind range
-                    if np.random.randint(50) == 0:
-                        tokens[FEATURES_IDX[6]] = int(np.random.rand(1)[0] * 1000) # out of the normalized voltage range
-                # get only the used features
-                data = [float(tokens[i]) for i in FEATURES_IDX]
-            except Exception as e:
-                logging.error(e)
-                logging.error(data)
-                continue
-
-
-            # compute the euler angles from the quaternion
-            roll,pitch,yaw = turbine.euler_from_quaternion(data[0],data[1],data[2],data[3])
-            data = np.array([roll,pitch,yaw, data[4], data[5], data[6]])
-            samples.append(data)
-            
-            ts = "%s+00:00" % datetime.now().strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3]
-            # Log the reading
-            logger.publish_logs({'ts': ts, 'data': tokens.tolist()})
-
-            if len(samples) <= MIN_NUM_SAMPLES:
-                if len(samples) % 10 == 0:
-                    logging.info('Buffering %d/%d... please wait' % (len(samples), MIN_NUM_SAMPLES))
-                # buffering
+                data -= mean
+                data /= std
+                turbine.create_dataset(data, TIME_STEPS, STEP, grid=(10, 10), out=x[len(ready):len(ready)+1])
+                ready.append(c)
+            if len(ready) == 0:
+                time.sleep(1)
                 continue
+            batch = x[:len(ready)]
 
-            # prep the data for the model
-            data = np.array(samples) # create a copy
-            samples = samples[1:] # remove the oldest sample            
-            data = np.array([turbine.wavelet_denoise(data[:,i], raw_std[i], 'db6') for i in range(NUM_FEATURES)])
-
-            data = data.transpose((1,0))
-            data -= mean
-            data /= std
-            data = data[-(TIME_STEPS+STEP):]
-
-            x = turbine.create_dataset(data, TIME_STEPS, STEP)
-            x = np.transpose(x, (0, 2, 1)).reshape(x.shape[0], NUM_FEATURES, 10, 10)
             # invoke the model
-            p = edge_agent.predict(model_name, x)
-            a = x.reshape(x.shape[0], NUM_FEATURES, 100).transpose((0,2,1))
-            b = p.reshape(p.shape[0], NUM_FEATURES, 100).transpose((0,2,1))
-
-            # check the anomalies
-            pred_mae_loss = np.mean(np.abs(b - a), axis=1).transpose((1,0))
-            values = np.mean(pred_mae_loss, axis=1)
+            model_name, p = active_model.predict(batch)
+            if p is None:
+                logging.error("It was not possible to invoke the model")
+                time.sleep(1)
+                continue
+            # check the anomalies of each turbine
+            values = turbine.reconstruction_mae(batch, p)
             anomalies = (values > thresholds)
-            # capture some metrics
-            edge_agent.capture_data(model_name, values.astype(np.float32), anomalies.astype(np.float32))
+            if shadow is not None:
+                shadow.submit(batch, values)
+            for c, v, a in zip(ready, values, anomalies):
+                # capture some metrics
+                # with several turbines, each prediction is reported with the device name of its telemetry
+                capture.capture(model_name, v.astype(np.float32), a.astype(np.float32),
+                    turbine=c.logger.device_name if num_turbines > 1 else None)
+                c.record_prediction(v, a)
 
-            if anomalies.any():
-                logging.info("Anomaly detected: %s" % anomalies)
-            else:
-                logging.info("Ok")
+            now = time.time()
+            if now >= next_stats:
+                logging.info("Pipeline stats: capture=%s; model=%s; shadow=%s; credentials=%s; turbines=%s" % (
+                    capture.stats(), active_model.stats(), shadow.stats() if shadow is not None else None,
+                    turbine.get_credentials_provider(iot_params).stats(), {c.name: c.stats() for c in channels}))
+                next_stats = now + STATS_INTERVAL
 
-            time.sleep(PREDICTIONS_INTERVAL)
+            # keep the cadence, but don't try to catch up if the prediction took too long
+            next_prediction = max(next_prediction + args.predictions_interval, now)
+            time.sleep(next_prediction - now)
     except KeyboardInterrupt as e:
         pass
     except Exception as e:
         logging.error(e)
      
     logging.info("Shutting down")
-    if model_loaded: edge_agent.unload_model(model_name)
+    for c in channels:
+        c.stop()
+    capture.stop(5)
+    if shadow is not None:
+        shadow.stop(5)
+    active_model.unload()
     del model_manager
     del edge_agent
-    del logger
-    turbine_sensors.close()
@@ -0,0 +1,25 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import os
+import sys
+import time
+import pytest
+
+# run.py, the turbine package and the report lambdas aren't installed
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, os.path.join(APP_DIR, 'report'))
+
+def __wait_for__(condition, timeout=5.0):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+@pytest.fixture
+def wait_for():
+    '''
+        wait_for(condition, timeout=5.0): wait until condition() is true.
+        Returns its last value
+    '''
+    return __wait_for__
@@ -0,0 +1,122 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import ctypes
+import threading
+import time
+import grpc
+import numpy as np
+from concurrent import futures
+import turbine.agent_pb2 as agent
+import turbine.agent_pb2_grpc as agent_grpc
+from turbine.edgeagentclient import DATA_TYPES
+from turbine.sharedmemory import _libc
+
+class FakeAgent(agent_grpc.AgentServicer):
+    def __init__(self, batch_size=1, num_features=6, capture_delay=0.0, predict_delay=0.0):
+        '''
+            Stand-in for SageMaker Edge Agent, used by the tests and the
+            benchmarks. The models are not executed: Predict returns the
+            input tensor (read from byte_data or from the shared memory
+            segment) as the output of the model, so the reconstruction is
+            perfect. Models are loaded with input/output (batch_size,
+            num_features, 10, 10) float32. CaptureData requests are kept in
+            captures and take capture_delay seconds. Predict takes
+            predict_delay seconds and fails for the models in failing_models.
+            The finished predictions and the unloads are kept in events
+        '''
+        self.batch_size = batch_size
+        self.num_features = num_features
+        self.capture_delay = capture_delay
+        self.predict_delay = predict_delay
+        self.failing_models = set()
+        self.lock = threading.Lock()
+        self.models = {}
+        self.captures = []
+        self.events = [] # ('predict', model_name, batch size) and ('unload', model_name)
+        self.num_predicts = 0
+        self.num_shm_predicts = 0
+
+    def ListModels(self, request, context):
+        resp = agent.ListModelsResponse()
+        with self.lock:
+            resp.models.extend(self.models.values())
+        return resp
+
+    def LoadModel(self, request, context):
+        model = agent.Model(name=request.name, url=request.url)
+        shape = [self.batch_size, self.num_features, 10, 10]
+        for tensors, name in ((model.input_tensor_metadatas, 'input0'), (model.output_tensor_metadatas, 'output0')):
+            meta = tensors.add()
+            meta.name = name
+            meta.data_type = agent.FLOAT32
+            meta.shape.extend(shape)
+        with self.lock:
+            self.models[request.name] = model
+        return agent.LoadModelResponse(model=model)
+
+    def UnLoadModel(self, request, context):
+        with self.lock:
+            self.models.pop(request.name, None)
+            self.events.append(('unload', request.name))
+        return agent.UnLoadModelResponse()
+
+    def __read_shm__(self, handle):
+        address = _libc.shmat(handle.segment_id, None, 0)
+        if address is None or address == ctypes.c_void_p(-1).value:
+            raise Exception("Invalid shared memory segment: %d" % handle.segment_id)
+        try:
+            return bytes((ctypes.c_uint8 * handle.size).from_address(address + handle.offset))
+        finally:
+            _libc.shmdt(address)
+
+    def Predict(self, request, context):
+        with self.lock:
+            model = self.models.get(request.name)
+        if model is None:
+            context.abort(grpc.StatusCode.NOT_FOUND, "Model %s is not loaded" % request.name)
+        if request.name in self.failing_models:
+            context.abort(grpc.StatusCode.INTERNAL, "Model %s failed" % request.name)
+        if self.predict_delay > 0:
+            time.sleep(self.predict_delay)
+        tensor = request.tensors[0]
+        if tensor.HasField('shared_memory_handle'):
+            data = self.__read_shm__(tensor.shared_memory_handle)
+            self.num_shm_predicts += 1
+        else:
+            data = tensor.byte_data
+        self.num_predicts += 1
+        x = np.frombuffer(data, dtype=DATA_TYPES[tensor.tensor_metadata.data_type])
+        x = x.reshape(tensor.tensor_metadata.shape)
+
+        output = agent.Tensor()
+        output.tensor_metadata.name = model.output_tensor_metadatas[0].name
+        output.tensor_metadata.data_type = agent.FLOAT32
+        output.tensor_metadata.shape.extend(x.shape)
+        output.byte_data = x.astype(np.float32).tobytes()
+        resp = agent.PredictResponse()
+        resp.tensors.append(output)
+        with self.lock:
+            self.events.append(('predict', request.name, x.shape[0]))
+        return resp
+
+    def CaptureData(self, request, context):
+        if self.capture_delay > 0:
+            time.sleep(self.capture_delay)
+        with self.lock:
+            self.captures.append(request)
+        return agent.CaptureDataResponse()
+
+    def GetCaptureDataStatus(self, request, context):
+        return agent.GetCaptureDataStatusResponse(status=agent.SUCCESS)
+
+def serve(socket_path, servicer=None, max_workers=4):
+    '''
+        Start a FakeAgent (or servicer) on a unix socket.
+        Returns (server, servicer). Stop it with server.stop(None)
+    '''
+    servicer = FakeAgent() if servicer is None else servicer
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers))
+    agent_grpc.add_AgentServicer_to_server(servicer, server)
+    server.add_insecure_port('unix://%s' % socket_path)
+    server.start()
+    return server, servicer
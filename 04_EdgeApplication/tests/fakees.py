@@ -0,0 +1,83 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import json
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+class FakeElasticsearch(object):
+    def __init__(self):
+        '''
+            Local HTTP server that implements the _bulk API of Elasticsearch
+            (index actions only), used by the tests of the lambda.
+            Documents are stored by _id (an auto id if the action has none)
+            Failure injection:
+                reject_items: # of next items rejected with 429
+                drop_responses: # of next requests indexed, but the
+                    connection is closed without a response (client timeout)
+                close_idle: close the connection after each response,
+                    without telling the client (stale kept-alive connection)
+        '''
+        self.docs = {}
+        self.num_requests = 0
+        self.num_connections = 0
+        self.reject_items = 0
+        self.drop_responses = 0
+        self.close_idle = False
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self.__handler__())
+        self.url = 'http://127.0.0.1:%d' % self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def __bulk__(self, lines):
+        items = []
+        with self.lock:
+            self.num_requests += 1
+            for action, doc in zip(lines[0::2], lines[1::2]):
+                action = json.loads(action)['index']
+                if self.reject_items > 0:
+                    self.reject_items -= 1
+                    items.append({'index': {'status': 429, 'error': {'type': 'es_rejected_execution_exception'}}})
+                    continue
+                doc_id = action.get('_id', 'auto-%d' % len(self.docs))
+                status = 200 if doc_id in self.docs else 201
+                self.docs[doc_id] = (action['_index'], json.loads(doc))
+                items.append({'index': {'_id': doc_id, 'status': status}})
+            drop = self.drop_responses > 0
+            self.drop_responses -= 1 if drop else 0
+        return {'took': 1, 'errors': any(i['index']['status'] >= 300 for i in items), 'items': items}, drop
+
+    def __handler__(self):
+        es = self
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1' # keep-alive
+
+            def setup(self):
+                with es.lock:
+                    es.num_connections += 1
+                super().setup()
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers['Content-Length'])).decode('utf-8')
+                if self.path != '/_bulk' or self.headers['Content-Type'] != 'application/x-ndjson':
+                    self.send_error(400)
+                    return
+                resp, drop = es.__bulk__(body.splitlines())
+                if drop:
+                    self.close_connection = True
+                    return
+                data = json.dumps(resp).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+                self.close_connection = es.close_idle
+
+            def log_message(self, *args):
+                pass
+        return Handler
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,75 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import threading
+import time
+import numpy as np
+import pytest
+import turbine
+import fakeagent
+
+INPUT_SHAPE = (1, 6, 10, 10)
+
+@pytest.fixture
+def agent(tmp_path):
+    server, servicer = fakeagent.serve(str(tmp_path / 'agent.sock'))
+    yield servicer, turbine.EdgeAgentClient(str(tmp_path / 'agent.sock'))
+    server.stop(None)
+
+def test_swap(agent):
+    servicer, client = agent
+    model = turbine.ActiveModel(client, INPUT_SHAPE, warmup_iterations=3)
+    assert model.predict(np.zeros(INPUT_SHAPE, dtype=np.float32)) == (None, None)
+    model.swap('model-1', '/models/1')
+    model.swap('model-2', '/models/2')
+    assert model.name == 'model-2' and model.num_swaps == 2
+    assert sorted(servicer.models.keys()) == ['model-2']
+    assert [e for e in servicer.events if e[1] == 'model-2'] == [('predict', 'model-2', 1)] * 3 # warm-up
+    x = np.random.rand(*INPUT_SHAPE).astype(np.float32)
+    name, p = model.predict(x)
+    assert name == 'model-2'
+    np.testing.assert_array_equal(p, x)
+
+def test_failed_warmup_keeps_active_model(agent):
+    servicer, client = agent
+    model = turbine.ActiveModel(client, INPUT_SHAPE, warmup_iterations=2)
+    model.swap('model-1', '/models/1')
+    servicer.failing_models.add('model-2')
+    with pytest.raises(Exception, match='failed the warm-up'):
+        model.swap('model-2', '/models/2')
+    # the new model was unloaded and the old one is still active
+    assert model.name == 'model-1' and model.num_swaps == 1
+    assert sorted(servicer.models.keys()) == ['model-1']
+    assert ('unload', 'model-2') in servicer.events and ('unload', 'model-1') not in servicer.events
+    assert model.predict(np.zeros(INPUT_SHAPE, dtype=np.float32))[0] == 'model-1'
+
+def test_activate_waits_for_in_flight_predictions(agent):
+    servicer, client = agent
+    model = turbine.ActiveModel(client, INPUT_SHAPE, warmup_iterations=0, drain_timeout=5.0)
+    model.swap('model-1', '/models/1')
+    model.load('model-2', '/models/2')
+    servicer.predict_delay = 0.5
+    results = []
+    thread = threading.Thread(target=lambda: results.append(model.predict(np.ones(INPUT_SHAPE, dtype=np.float32))))
+    thread.start()
+    time.sleep(0.1) # the prediction is running on model-1
+    drain_time = model.activate('model-2')
+    thread.join()
+    assert drain_time >= 0.2
+    assert results[0][0] == 'model-1' and results[0][1] is not None
+    # model-1 was unloaded after its prediction finished
+    assert servicer.events.index(('predict', 'model-1', 1)) < servicer.events.index(('unload', 'model-1'))
+
+@pytest.mark.parametrize('num_windows', [1, 3, 4, 5, 9])
+def test_invoke_chunks_and_padding(agent, num_windows):
+    servicer, client = agent
+    servicer.batch_size = 4 # model compiled for 4 windows
+    model = turbine.ActiveModel(client, (4, 6, 10, 10), warmup_iterations=0)
+    model.swap('model', '/models/model')
+    assert model.batch_size() == 4
+    x = np.random.rand(num_windows, 6, 10, 10).astype(np.float32)
+    name, p = model.predict(x)
+    assert p.shape == x.shape
+    np.testing.assert_array_equal(p, x)
+    # every Predict has the batch size of the model
+    predicts = [e for e in servicer.events if e[0] == 'predict']
+    assert predicts == [('predict', 'model', 4)] * -(-num_windows // 4)
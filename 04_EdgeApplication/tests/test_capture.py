@@ -0,0 +1,60 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import json
+import time
+import numpy as np
+import pytest
+import turbine
+import fakeagent
+
+@pytest.fixture
+def agent(tmp_path):
+    servicer = fakeagent.FakeAgent()
+    server, servicer = fakeagent.serve(str(tmp_path / 'agent.sock'), servicer)
+    yield servicer, turbine.EdgeAgentClient(str(tmp_path / 'agent.sock'))
+    server.stop(None)
+
+def test_capture_batches(agent, wait_for):
+    servicer, client = agent
+    capture = turbine.CaptureDataQueue(client, batch_size=3, flush_interval=0.1)
+    for i in range(7):
+        assert capture.capture('model', np.full(6, i, dtype=np.float32), np.zeros(6, dtype=np.float32))
+    capture.stop(5)
+    assert wait_for(lambda: capture.stats()['captured'] == 7)
+    # the requests are in flight concurrently: they can reach the agent in any order
+    captures = sorted(servicer.captures, key=lambda r: np.frombuffer(r.input_tensors[0].byte_data, dtype=np.float32)[0])
+    assert [len(r.input_tensors) for r in captures] == [3, 3, 1]
+    values = [np.frombuffer(t.byte_data, dtype=np.float32)[0] for r in captures for t in r.input_tensors]
+    assert values == list(range(7))
+
+def test_capture_timeout_releases_the_slot(agent, wait_for):
+    servicer, client = agent
+    servicer.capture_delay = 1.0 # hung agent
+    capture = turbine.CaptureDataQueue(client, max_in_flight=1, flush_interval=0.0, timeout=0.1)
+    for i in range(3):
+        capture.capture('model', np.zeros(6, dtype=np.float32), np.zeros(6, dtype=np.float32))
+    start = time.time()
+    capture.stop(5)
+    assert not capture.thread.is_alive()
+    assert time.time() - start < 1.0 # it doesn't wait for the agent
+    assert wait_for(lambda: capture.stats()['in_flight'] == 0)
+    stats = capture.stats()
+    assert stats['requests'] == 3 and stats['timeouts'] == 3 and stats['failed'] == 3 and stats['captured'] == 0
+    # all the slots are free again
+    for i in range(capture.max_in_flight):
+        assert capture.in_flight.acquire(blocking=False)
+
+def test_capture_turbines(agent, wait_for):
+    servicer, client = agent
+    capture = turbine.CaptureDataQueue(client, batch_size=3, flush_interval=0.1)
+    for i in range(3):
+        capture.capture('model', np.full(6, i, dtype=np.float32), np.zeros(6, dtype=np.float32), turbine='turbine-%d' % (i + 1))
+    capture.stop(5)
+    assert wait_for(lambda: capture.stats()['captured'] == 3)
+    req = servicer.captures[0]
+    # the names of the turbines go after the input tensors of the predictions
+    assert [t.tensor_metadata.name for t in req.input_tensors] == ['input_0', 'input_1', 'input_2', 'turbines']
+    assert len(req.output_tensors) == 3
+    tensor = req.input_tensors[-1]
+    assert tensor.tensor_metadata.data_type == turbine.agent_pb2.UINT8
+    assert json.loads(tensor.byte_data) == ['turbine-1', 'turbine-2', 'turbine-3']
@@ -0,0 +1,55 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import threading
+import time
+import pytest
+from capture_parser import map_ordered
+
+def new_threads(before):
+    return [t for t in threading.enumerate() if t not in before]
+
+def test_order_when_later_items_finish_first():
+    finished = []
+    def func(item):
+        time.sleep(0.05 * (4 - item)) # the last items finish first
+        for i in range(3):
+            yield (item, i)
+        finished.append(item)
+    results = list(map_ordered(func, range(4), max_workers=4, max_pending=4))
+    assert results == [(item, i) for item in range(4) for i in range(3)]
+    assert finished[0] != 0 # they did run concurrently
+
+def test_worker_exception():
+    def func(item):
+        yield item
+        if item == 2:
+            raise ValueError("Invalid capture file: %d" % item)
+        yield item
+    before = threading.enumerate()
+    results = []
+    with pytest.raises(ValueError, match='Invalid capture file: 2'):
+        for r in map_ordered(func, range(5), max_workers=2):
+            results.append(r)
+    assert results == [0, 0, 1, 1, 2] # the results before the error, in order
+    assert new_threads(before) == []
+
+def test_early_break():
+    started = []
+    def func(item):
+        started.append(item)
+        for i in range(100):
+            yield (item, i)
+    before = threading.enumerate()
+    gen = map_ordered(func, range(10), max_workers=2, max_pending=2)
+    results = []
+    for r in gen:
+        results.append(r)
+        if len(results) == 5:
+            break
+    start = time.time()
+    gen.close() # what the consumer does when it stops iterating
+    assert time.time() - start < 2
+    assert results == [(0, i) for i in range(5)]
+    # the workers blocked on full queues and the items not started yet were stopped
+    assert new_threads(before) == []
+    assert len(started) < 10
@@ -0,0 +1,161 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import json
+import shutil
+import ssl
+import subprocess
+import threading
+import pytest
+import turbine.credentials as credentials
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+CREDENTIALS = {'credentials': {
+    'accessKeyId': 'AKID', 'secretAccessKey': 'secret', 'sessionToken': 'token', 'expiration': '2030-01-01T00:00:00Z'
+}}
+
+@pytest.fixture(scope='module')
+def certs(tmp_path_factory):
+    '''
+        CA, server (localhost) and client (device) certificates
+    '''
+    if shutil.which('openssl') is None:
+        pytest.skip('openssl is required to create the certificates')
+    path = tmp_path_factory.mktemp('certs')
+    def openssl(*args):
+        subprocess.run(('openssl',) + args, cwd=str(path), check=True, capture_output=True)
+    openssl('req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-keyout', 'ca.key', '-out', 'ca.pem', '-days', '1', '-subj', '/CN=test-ca')
+    with open(str(path / 'san.ext'), 'w') as f:
+        f.write('subjectAltName=DNS:localhost,IP:127.0.0.1\n')
+    for name in ('server', 'device'):
+        openssl('req', '-newkey', 'rsa:2048', '-nodes', '-keyout', '%s.key' % name, '-out', '%s.csr' % name, '-subj', '/CN=%s' % name)
+        openssl('x509', '-req', '-in', '%s.csr' % name, '-CA', 'ca.pem', '-CAkey', 'ca.key', '-CAcreateserial',
+                '-out', '%s.pem' % name, '-days', '1', '-extfile', 'san.ext')
+    return {n: str(path / n) for n in ('ca.pem', 'server.pem', 'server.key', 'device.pem', 'device.key')}
+
+class FakeCredentialsEndpoint(object):
+    def __init__(self, certs):
+        '''
+            mTLS server of the IoT credentials endpoint (keep-alive).
+            The next requests get the status codes in errors
+        '''
+        self.errors = []
+        self.num_requests = 0
+        self.num_connections = 0
+        endpoint = self
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def setup(self):
+                endpoint.num_connections += 1
+                super().setup()
+
+            def do_GET(self):
+                endpoint.num_requests += 1
+                status = endpoint.errors.pop(0) if len(endpoint.errors) > 0 else 200
+                data = json.dumps(CREDENTIALS if status == 200 else {'message': 'error'}).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(certs['server.pem'], certs['server.key'])
+        context.load_verify_locations(certs['ca.pem'])
+        context.verify_mode = ssl.CERT_REQUIRED # the device certificate
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.socket = context.wrap_socket(self.server.socket, server_side=True)
+        self.url = 'https://localhost:%d/role-aliases/test/credentials' % self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+@pytest.fixture
+def endpoint(certs):
+    endpoint = FakeCredentialsEndpoint(certs)
+    yield endpoint
+    endpoint.stop()
+
+def create_client(certs, **params):
+    return credentials.CredentialsEndpointClient(certs['device.pem'], certs['device.key'], certs['ca.pem'], **params)
+
+def test_connection_reused(certs, endpoint):
+    client = create_client(certs)
+    for i in range(3):
+        assert client.get(endpoint.url).json() == CREDENTIALS
+    stats = client.stats()
+    assert endpoint.num_requests == 3 and endpoint.num_connections == 1
+    assert stats['requests'] == 3 and stats['handshakes'] == 1 and stats['retries'] == 0
+    assert stats['handshake_ms']['max'] > 0 and stats['request_ms']['max'] >= stats['request_ms']['avg'] > 0
+
+def test_retry_with_jitter(certs, endpoint, monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(credentials.time, 'sleep', sleeps.append)
+    client = create_client(certs, max_retries=3, backoff_base=0.5, backoff_max=0.8)
+    endpoint.errors = [503, 429, 500]
+    assert client.get(endpoint.url).json() == CREDENTIALS
+    assert endpoint.num_requests == 4
+    assert client.stats()['retries'] == 3
+    # full jitter: random between 0 and min(backoff_max, backoff_base * 2^attempt)
+    assert len(sleeps) == 3
+    for sleep, limit in zip(sleeps, (0.5, 0.8, 0.8)):
+        assert 0 <= sleep <= limit
+
+def test_max_retries(certs, endpoint, monkeypatch):
+    monkeypatch.setattr(credentials.time, 'sleep', lambda t: None)
+    client = create_client(certs, max_retries=1)
+    endpoint.errors = [503, 503, 503]
+    with pytest.raises(Exception, match='503'):
+        client.get(endpoint.url)
+    assert endpoint.num_requests == 2
+
+def test_client_error_not_retried(certs, endpoint):
+    client = create_client(certs)
+    endpoint.errors = [403]
+    with pytest.raises(Exception, match='Error while getting the IoT credentials'):
+        client.get(endpoint.url)
+    assert endpoint.num_requests == 1 and client.stats()['retries'] == 0
+
+def test_connection_error_retried(certs, monkeypatch):
+    monkeypatch.setattr(credentials.time, 'sleep', lambda t: None)
+    client = create_client(certs, connect_timeout=0.5, max_retries=2)
+    with pytest.raises(Exception):
+        client.get('https://localhost:1/credentials') # nothing listening
+    assert client.stats()['requests'] == 3 and client.stats()['retries'] == 2
+
+@pytest.fixture
+def endpoint_clients(monkeypatch):
+    # new process-wide endpoint clients
+    monkeypatch.setattr(credentials, '__endpoint_clients', {})
+
+def test_endpoint_client_params(certs, endpoint, endpoint_clients):
+    params = {'connect_timeout': 1.0, 'read_timeout': 2.0, 'max_retries': 7}
+    metadata = credentials.fetch_aws_credentials(endpoint.url, 'thing', certs['device.pem'], certs['device.key'], certs['ca.pem'], **params)
+    assert metadata == {'access_key': 'AKID', 'secret_key': 'secret', 'token': 'token', 'expiry_time': '2030-01-01T00:00:00Z'}
+    client = credentials.get_credentials_endpoint_client(certs['device.pem'], certs['device.key'], certs['ca.pem'])
+    assert client.timeout == (1.0, 2.0) and client.max_retries == 7
+
+def test_provider_params_and_stats(certs, endpoint, endpoint_clients):
+    iot_params = {
+        'sagemaker_edge_provider_aws_iot_cred_endpoint': endpoint.url,
+        'sagemaker_edge_core_device_uuid': 'device',
+        'sagemaker_edge_provider_aws_cert_file': certs['device.pem'],
+        'sagemaker_edge_provider_aws_cert_pk_file': certs['device.key'],
+        'sagemaker_edge_provider_aws_ca_cert_file': certs['ca.pem'],
+        'sagemaker_edge_core_region': 'us-east-1',
+        'credentials_endpoint': {'read_timeout': 3.0, 'max_retries': 1}
+    }
+    provider = credentials.IoTCredentialsProvider(iot_params)
+    frozen = provider.load().get_frozen_credentials()
+    assert (frozen.access_key, frozen.secret_key, frozen.token) == ('AKID', 'secret', 'token')
+    stats = provider.stats()
+    assert stats['refreshes'] == 1 and stats['expires_in'] > 0
+    assert stats['endpoint']['requests'] == 1 and stats['endpoint']['handshakes'] == 1
+    client = credentials.get_credentials_endpoint_client(certs['device.pem'], certs['device.key'], certs['ca.pem'])
+    assert client.timeout == (5.0, 3.0) and client.max_retries == 1
@@ -0,0 +1,63 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import os
+import numpy as np
+import pytest
+import turbine
+import fakeagent
+
+def segment_exists(segment_id):
+    with open('/proc/sysvipc/shm', 'r') as f:
+        next(f) # header
+        return any(int(line.split()[1]) == segment_id for line in f)
+
+@pytest.fixture
+def agent(tmp_path):
+    server, servicer = fakeagent.serve(str(tmp_path / 'agent.sock'))
+    yield servicer, turbine.EdgeAgentClient(str(tmp_path / 'agent.sock'))
+    server.stop(None)
+
+def test_predict_byte_data_and_shm(agent):
+    servicer, client = agent
+    client.load_model('model', '/models/model')
+    x = np.random.rand(1, 6, 10, 10).astype(np.float32)
+    p = client.predict('model', x)
+    p_shm = client.predict('model', x, shm=True)
+    np.testing.assert_array_equal(p, x)
+    np.testing.assert_array_equal(p_shm, x)
+    assert servicer.num_predicts == 2 and servicer.num_shm_predicts == 1
+
+def test_shm_segment_reused_and_released(agent):
+    servicer, client = agent
+    client.load_model('model', '/models/model')
+    for i in range(3):
+        x = np.full((1, 6, 10, 10), i, dtype=np.float32)
+        np.testing.assert_array_equal(client.predict('model', x, shm=True), x)
+    assert len(client.shm_inputs['model']) == 1
+    segment, data = client.shm_inputs['model'][0]
+    assert segment.size == data.nbytes == 6 * 10 * 10 * 4
+    segment_id = segment.segment_id
+    if os.path.exists('/proc/sysvipc/shm'):
+        assert segment_exists(segment_id)
+
+    client.unload_model('model')
+    assert 'model' not in client.shm_inputs
+    assert segment.address is None
+    if os.path.exists('/proc/sysvipc/shm'):
+        assert not segment_exists(segment_id)
+    # the model is gone, so the predictions fail without allocating a new segment
+    assert client.predict('model', x, shm=True) is None
+    assert 'model' not in client.shm_inputs
+
+def test_shm_segments_released_with_the_client(agent):
+    servicer, client = agent
+    for name in ('model-1', 'model-2'):
+        client.load_model(name, '/models/%s' % name)
+        client.predict(name, np.zeros((1, 6, 10, 10), dtype=np.float32), shm=True)
+    segments = [s for inputs in client.shm_inputs.values() for s, d in inputs]
+    assert len(segments) == 2
+    client.__del__()
+    assert client.shm_inputs == {}
+    assert all(s.address is None for s in segments)
+    if os.path.exists('/proc/sysvipc/shm'):
+        assert not any(segment_exists(s.segment_id) for s in segments)
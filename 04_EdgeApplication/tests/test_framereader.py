@@ -0,0 +1,107 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import binascii
+import numpy as np
+import pytest
+import turbine
+from turbine.framereader import FRAME_DTYPE, FRAME_SIZE, FRAME_PAYLOAD_SIZE
+
+class FakeSerialPort(object):
+    '''
+        Serial port that returns the given chunks of bytes, one per read
+        (as they arrive from the turbine) and keeps what is written
+    '''
+    def __init__(self, chunks):
+        self.chunks = [bytes(c) for c in chunks]
+        self.writes = []
+
+    @property
+    def in_waiting(self):
+        return len(self.chunks[0]) if len(self.chunks) > 0 else 0
+
+    def read(self, size):
+        if len(self.chunks) == 0:
+            raise EOFError("No more data")
+        data, self.chunks[0] = self.chunks[0][:size], self.chunks[0][size:]
+        if len(self.chunks[0]) == 0:
+            self.chunks.pop(0)
+        return data
+
+    def write(self, data):
+        self.writes.append(data)
+
+    def isOpen(self):
+        return True
+
+    def close(self):
+        pass
+
+def frame(i):
+    f = np.zeros(1, dtype=FRAME_DTYPE)
+    f['sync'] = 0x5AA5
+    f['length'] = FRAME_PAYLOAD_SIZE
+    f['arduino_timestamp'] = 1000 + i
+    f['free_memory'] = 500
+    f['readings'] = np.arange(18) + i * 0.5
+    data = bytearray(f.tobytes())
+    data[-2:] = binascii.crc_hqx(bytes(data[2:-2]), 0xFFFF).to_bytes(2, 'little')
+    return bytes(data)
+
+def sample(i):
+    return np.concatenate(([1000 + i, 500], np.arange(18, dtype=np.float32) + i * 0.5))
+
+def read_samples(reader, n):
+    return np.array([reader.read_sample() for i in range(n)])
+
+def test_frames():
+    reader = turbine.BinaryFrameReader(FakeSerialPort([frame(0) + frame(1) + frame(2)]))
+    assert reader.port.writes == [b'b']
+    np.testing.assert_array_equal(read_samples(reader, 3), [sample(i) for i in range(3)])
+    assert reader.num_frames == 3 and reader.num_corrupted_frames == 0 and reader.num_discarded_bytes == 0
+
+def test_garbage_before_sync():
+    garbage = b'12.3 45.6 \xa5\x00 text\n'
+    reader = turbine.BinaryFrameReader(FakeSerialPort([garbage + frame(0) + frame(1)]))
+    np.testing.assert_array_equal(read_samples(reader, 2), [sample(0), sample(1)])
+    assert reader.num_discarded_bytes == len(garbage)
+    assert reader.num_corrupted_frames == 0
+
+def test_corrupted_frame_between_valid_ones():
+    corrupted = bytearray(frame(1))
+    corrupted[20] ^= 0xFF # bad crc
+    reader = turbine.BinaryFrameReader(FakeSerialPort([frame(0) + bytes(corrupted) + frame(2)]))
+    np.testing.assert_array_equal(read_samples(reader, 2), [sample(0), sample(2)])
+    assert reader.num_corrupted_frames == 1
+    assert reader.num_discarded_bytes == FRAME_SIZE
+    assert reader.num_frames == 2
+
+def test_frame_split_across_reads():
+    data = frame(0) + frame(1)
+    reader = turbine.BinaryFrameReader(FakeSerialPort([data[:10], data[10:FRAME_SIZE + 5], data[FRAME_SIZE + 5:]]))
+    np.testing.assert_array_equal(read_samples(reader, 2), [sample(0), sample(1)])
+    assert reader.num_discarded_bytes == 0 and reader.num_corrupted_frames == 0
+
+def test_trailing_lone_sync_byte():
+    # the first byte of the sync word arrives at the end of a read
+    second = frame(1)
+    reader = turbine.BinaryFrameReader(FakeSerialPort([frame(0) + second[:1], second[1:]]))
+    np.testing.assert_array_equal(reader.read_frames(), [sample(0)])
+    assert bytes(reader.buffer) == second[:1]
+    np.testing.assert_array_equal(reader.read_frames(), [sample(1)])
+    assert reader.num_discarded_bytes == 0
+
+def test_switch_command_sent_again():
+    # the turbine restarted and it sends text: no valid frame in 4 * FRAME_SIZE bytes
+    text = b'x' * FRAME_SIZE
+    reader = turbine.BinaryFrameReader(FakeSerialPort([text] * 4 + [text, frame(0)]))
+    np.testing.assert_array_equal(read_samples(reader, 1), [sample(0)])
+    assert reader.port.writes == [b'b', b'b']
+    assert reader.num_discarded_bytes == 5 * FRAME_SIZE
+
+def test_no_switch_command_before_limit():
+    text = b'x' * FRAME_SIZE
+    reader = turbine.BinaryFrameReader(FakeSerialPort([text] * 4 + [frame(0)]))
+    read_samples(reader, 1)
+    assert reader.port.writes == [b'b']
+    with pytest.raises(EOFError):
+        reader.read_sample()
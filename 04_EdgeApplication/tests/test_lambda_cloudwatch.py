@@ -0,0 +1,162 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import json
+import base64
+import importlib
+from datetime import datetime, timedelta, timezone
+import boto3
+import numpy as np
+import pytest
+from botocore.stub import Stubber
+from moto import mock_aws
+
+LOG_GROUP = '/wind-turbine-farm'
+
+def recent(seconds):
+    # CloudWatch rejects the events older than 14 days
+    ts = datetime.now(timezone.utc).replace(microsecond=0) - timedelta(hours=1) + timedelta(seconds=seconds)
+    return ts.isoformat()
+
+@pytest.fixture
+def lam(monkeypatch):
+    monkeypatch.setenv('AWS_DEFAULT_REGION', 'us-east-1')
+    with mock_aws():
+        import lambda_ingest_logs_cloudwatch as lam
+        yield importlib.reload(lam) # new clients and shipper for each test
+
+@pytest.fixture
+def log_group(lam):
+    '''
+        The log group of the lambda (moto) with a counter of the API calls
+    '''
+    lam.logs_client.create_log_group(logGroupName=LOG_GROUP)
+    for stream in ('preds', 'sensors'):
+        lam.logs_client.create_log_stream(logGroupName=LOG_GROUP, logStreamName=stream)
+    calls = {'PutLogEvents': 0, 'DescribeLogStreams': 0}
+    def count(event_name, **kwargs):
+        calls[event_name.split('.')[-1]] += 1
+    for op in calls.keys():
+        lam.logs_client.meta.events.register('before-call.logs.%s' % op, count)
+    return calls
+
+@pytest.fixture
+def stubbed(lam):
+    client = boto3.client('logs', region_name='us-east-1', aws_access_key_id='x', aws_secret_access_key='x')
+    with Stubber(client) as stubber:
+        yield lam.LogShipper(client, 'g'), stubber
+        stubber.assert_no_pending_responses()
+
+def stream_events(lam, stream):
+    return lam.logs_client.get_log_events(logGroupName=LOG_GROUP, logStreamName=stream, startFromHead=True)['events']
+
+def test_batches_max_bytes(lam):
+    events = [{'timestamp': 1000 + i, 'message': 'x' * 1000} for i in range(3000)]
+    batches = list(lam.LogShipper(None, 'g').batches(events))
+    assert len(batches) == 3
+    assert sum(len(b) for b in batches) == len(events)
+    for b in batches:
+        assert sum(len(e['message'].encode('utf-8')) + lam.EVENT_OVERHEAD for e in b) <= lam.MAX_BATCH_BYTES
+    # the size is computed in bytes, not in characters
+    events = [{'timestamp': 1000 + i, 'message': 'é' * 1000} for i in range(1500)]
+    for b in lam.LogShipper(None, 'g').batches(events):
+        assert sum(len(e['message'].encode('utf-8')) + lam.EVENT_OVERHEAD for e in b) <= lam.MAX_BATCH_BYTES
+
+def test_batches_max_events(lam):
+    events = [{'timestamp': 1000, 'message': 'm'} for i in range(lam.MAX_BATCH_EVENTS + 1)]
+    assert [len(b) for b in lam.LogShipper(None, 'g').batches(events)] == [lam.MAX_BATCH_EVENTS, 1]
+
+def test_batches_sorted_within_24h(lam):
+    hour = 3600 * 1000
+    events = [{'timestamp': i * hour, 'message': 'm'} for i in range(50, 0, -1)]
+    batches = list(lam.LogShipper(None, 'g').batches(events))
+    assert [len(b) for b in batches] == [24, 24, 2]
+    for b in batches:
+        assert b[-1]['timestamp'] - b[0]['timestamp'] < lam.MAX_BATCH_SPAN
+        assert all(e1['timestamp'] <= e2['timestamp'] for e1, e2 in zip(b, b[1:]))
+
+def test_capture_file_put_log_events(lam, log_group):
+    num_predictions = 25000
+    tensor = base64.b64encode(np.arange(6, dtype='<f4').tobytes()).decode('utf-8')
+    lines = [json.dumps({
+        'eventMetadata': {'deviceId': 'jetson-1', 'inferenceTime': recent(i // 1000)},
+        'deviceFleetInputs': [{'data': tensor}], 'deviceFleetOutputs': [{'data': tensor}]
+    }) for i in range(num_predictions)]
+    lam.s3_client.create_bucket(Bucket='captures')
+    lam.s3_client.put_object(Bucket='captures', Key='capture.jsonl', Body='\n'.join(lines).encode('utf-8'))
+    lam.lambda_handler({'Records': [{'s3': {'bucket': {'name': 'captures'}, 'object': {'key': 'capture.jsonl'}}}]}, None)
+
+    # one call per batch of parsed predictions; no DescribeLogStreams
+    assert log_group == {'PutLogEvents': -(-num_predictions // lam.PREDS_BATCH_SIZE), 'DescribeLogStreams': 0}
+    assert lam.shipper.stats()['events'] == num_predictions
+    events = stream_events(lam, 'preds')
+    assert events[0]['message'] == ' '.join(['jetson-1'] + ['0.0', '1.0', '2.0', '3.0', '4.0', '5.0'] * 2)
+
+def test_capture_turbines(lam, log_group):
+    tensors = [{'data': base64.b64encode(np.full(6, i, dtype='<f4').tobytes()).decode('utf-8')} for i in range(2)]
+    names = {'data': base64.b64encode(json.dumps(['jetson-1-turbine-1', 'jetson-1-turbine-2']).encode('utf-8')).decode('utf-8')}
+    body = json.dumps({'eventMetadata': {'deviceId': 'jetson-1', 'inferenceTime': recent(0)},
+        'deviceFleetInputs': tensors + [names], 'deviceFleetOutputs': tensors})
+    lam.s3_client.create_bucket(Bucket='captures')
+    lam.s3_client.put_object(Bucket='captures', Key='capture.jsonl', Body=body.encode('utf-8'))
+    lam.lambda_handler({'Records': [{'s3': {'bucket': {'name': 'captures'}, 'object': {'key': 'capture.jsonl'}}}]}, None)
+    messages = sorted(e['message'] for e in stream_events(lam, 'preds'))
+    assert messages == [' '.join(['jetson-1-turbine-1'] + ['0.0'] * 12), ' '.join(['jetson-1-turbine-2'] + ['1.0'] * 12)]
+
+def test_logs_sequence_token_cached(lam, log_group):
+    event = {'device_name': 'jetson-1', 'msg_type': 'logs', 'logs': [
+        {'ts': recent(i), 'data': list(range(20))} for i in range(10)
+    ]}
+    for i in range(5): # warm lambda
+        lam.lambda_handler(event, None)
+    assert log_group == {'PutLogEvents': 5, 'DescribeLogStreams': 0}
+    assert lam.shipper.stats() == {'calls': 5, 'events': 50, 'rejected_batches': 0}
+    assert len(stream_events(lam, 'sensors')) == 50
+
+def test_invalid_token_uses_expected_token(stubbed):
+    shipper, stubber = stubbed
+    events = [{'timestamp': 1, 'message': 'a'}]
+    params = {'logGroupName': 'g', 'logStreamName': 's', 'logEvents': events}
+    stubber.add_client_error('put_log_events', 'InvalidSequenceTokenException', 'invalid', 400,
+        modeled_fields={'expectedSequenceToken': 'T1'})
+    stubber.add_response('put_log_events', {'nextSequenceToken': 'T2'}, dict(params, sequenceToken='T1'))
+    stubber.add_response('put_log_events', {'nextSequenceToken': 'T3'}, dict(params, sequenceToken='T2'))
+    shipper.put_events('s', events)
+    shipper.put_events('s', events)
+    assert shipper.sequence_tokens['s'] == 'T3'
+    assert shipper.stats() == {'calls': 3, 'events': 2, 'rejected_batches': 0}
+
+def test_invalid_token_describes_stream(stubbed):
+    shipper, stubber = stubbed
+    events = [{'timestamp': 1, 'message': 'a'}]
+    stubber.add_client_error('put_log_events', 'InvalidSequenceTokenException', 'invalid', 400)
+    stubber.add_response('describe_log_streams', {'logStreams': [
+        {'logStreamName': 's-old', 'uploadSequenceToken': 'X'},
+        {'logStreamName': 's', 'uploadSequenceToken': 'T1'}
+    ]}, {'logGroupName': 'g', 'logStreamNamePrefix': 's'})
+    stubber.add_response('put_log_events', {'nextSequenceToken': 'T2'},
+        {'logGroupName': 'g', 'logStreamName': 's', 'logEvents': events, 'sequenceToken': 'T1'})
+    shipper.put_events('s', events)
+    assert shipper.sequence_tokens['s'] == 'T2'
+
+def test_data_already_accepted(stubbed):
+    shipper, stubber = stubbed
+    events = [{'timestamp': 1, 'message': 'a'}]
+    stubber.add_client_error('put_log_events', 'DataAlreadyAcceptedException', 'duplicated', 400,
+        modeled_fields={'expectedSequenceToken': 'T1'})
+    shipper.put_events('s', events)
+    assert shipper.sequence_tokens['s'] == 'T1'
+    assert shipper.stats()['calls'] == 1 and shipper.stats()['events'] == 0
+
+def test_invalid_token_max_retries(stubbed):
+    shipper, stubber = stubbed
+    for i in range(shipper.max_retries + 1):
+        stubber.add_client_error('put_log_events', 'InvalidSequenceTokenException', 'invalid', 400,
+            modeled_fields={'expectedSequenceToken': 'T%d' % i})
+    with pytest.raises(Exception, match='Invalid sequence token after 3 retries'):
+        shipper.put_events('s', [{'timestamp': 1, 'message': 'a'}])
+
+def test_rejected_events(stubbed):
+    shipper, stubber = stubbed
+    stubber.add_response('put_log_events', {'nextSequenceToken': 'T1', 'rejectedLogEventsInfo': {'tooOldLogEventEndIndex': 1}})
+    shipper.put_events('s', [{'timestamp': 1, 'message': 'a'}, {'timestamp': 2, 'message': 'b'}])
+    assert shipper.stats() == {'calls': 1, 'events': 2, 'rejected_batches': 1}
@@ -0,0 +1,131 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import json
+import time
+import base64
+import importlib
+import numpy as np
+import pytest
+from moto import mock_aws
+import fakees
+
+NUM_PREDICTIONS = 2500
+
+@pytest.fixture
+def es():
+    es = fakees.FakeElasticsearch()
+    yield es
+    es.stop()
+
+@pytest.fixture
+def lam(es, monkeypatch):
+    monkeypatch.setenv('AWS_DEFAULT_REGION', 'us-east-1')
+    monkeypatch.setenv('ELASTIC_SEARCH_URL', es.url)
+    monkeypatch.setenv('ES_BULK_MAX_RECORDS', '1000')
+    with mock_aws():
+        import lambda_ingest_logs_elasticsearch as lam
+        lam = importlib.reload(lam) # new indexer for each test
+        lam.indexer.backoff = 0.01
+        yield lam
+
+def capture_file(num_predictions):
+    lines = []
+    for i in range(num_predictions):
+        tensor = base64.b64encode(np.full(6, i, dtype='<f4').tobytes()).decode('utf-8')
+        lines.append(json.dumps({
+            'eventMetadata': {'deviceId': 'jetson-1', 'inferenceTime': '2021-01-01T00:00:00.%03dZ' % (i % 1000)},
+            'deviceFleetInputs': [{'data': tensor}], 'deviceFleetOutputs': [{'data': tensor}]
+        }))
+    return '\n'.join(lines).encode('utf-8')
+
+def batched_capture_file(turbines):
+    # one capture with a prediction per turbine, as sent by the multi-turbine mode
+    tensors = [{'data': base64.b64encode(np.full(6, i, dtype='<f4').tobytes()).decode('utf-8')} for i in range(len(turbines))]
+    names = {'data': base64.b64encode(json.dumps(turbines).encode('utf-8')).decode('utf-8')}
+    return json.dumps({
+        'eventMetadata': {'deviceId': 'jetson-1', 'inferenceTime': '2021-01-01T00:00:00.000Z'},
+        'deviceFleetInputs': tensors + [names], 'deviceFleetOutputs': tensors
+    }).encode('utf-8')
+
+def s3_event(lam, key, num_predictions, body=None):
+    lam.s3_client.create_bucket(Bucket='captures')
+    lam.s3_client.put_object(Bucket='captures', Key=key, Body=capture_file(num_predictions) if body is None else body)
+    return {'Records': [{'s3': {'bucket': {'name': 'captures'}, 'object': {'key': key}}}]}
+
+def logs_event(num_logs):
+    return {'device_name': 'jetson-1', 'msg_type': 'logs', 'logs': [
+        {'ts': '2021-01-01T00:00:%02d.000+00:00' % i, 'data': list(range(20))} for i in range(num_logs)
+    ]}
+
+def test_capture_file_bulk_requests(es, lam):
+    event = s3_event(lam, 'capture.jsonl', NUM_PREDICTIONS)
+    lam.lambda_handler(event, None)
+    assert es.num_requests == 3 # 1000 + 1000 + 500
+    assert es.num_connections == 1
+    assert len(es.docs) == NUM_PREDICTIONS
+    assert lam.indexer.stats()['indexed'] == NUM_PREDICTIONS
+    # the same file again (e.g. the lambda was retried): no duplicates
+    lam.lambda_handler(event, None)
+    assert es.num_requests == 6 and es.num_connections == 1
+    assert len(es.docs) == NUM_PREDICTIONS
+
+def test_capture_turbines(es, lam):
+    turbines = ['jetson-1-turbine-1', 'jetson-1-turbine-2', 'jetson-1-turbine-3']
+    lam.lambda_handler(s3_event(lam, 'batched.jsonl', 0, batched_capture_file(turbines)), None)
+    lam.lambda_handler(s3_event(lam, 'single.jsonl', 1), None) # single turbine, without turbines
+    docs = sorted((doc['deviceId'], doc['turbineId'], doc['mean_pred_roll']) for index, doc in es.docs.values())
+    assert docs == [
+        ('jetson-1', 'Turbine 1', '0.0'),
+        ('jetson-1-turbine-1', 'Turbine 1-turbine-1', '0.0'),
+        ('jetson-1-turbine-2', 'Turbine 1-turbine-2', '1.0'),
+        ('jetson-1-turbine-3', 'Turbine 1-turbine-3', '2.0')
+    ]
+    # the logs of a turbine have the same ids
+    lam.lambda_handler(dict(logs_event(1), device_name='jetson-1-turbine-2'), None)
+    doc = [doc for index, doc in es.docs.values() if index == 'wind_turbine_logs'][0]
+    assert (doc['deviceId'], doc['turbineId']) == ('jetson-1-turbine-2', 'Turbine 1-turbine-2')
+
+def test_logs_bulk_request(es, lam):
+    lam.lambda_handler(logs_event(10), None)
+    lam.lambda_handler(logs_event(10), None)
+    assert es.num_requests == 2 and es.num_connections == 1 # warm lambda: connection reused
+    assert len(es.docs) == 10
+    index, doc = next(iter(es.docs.values()))
+    assert index == 'wind_turbine_logs' and doc['deviceId'] == 'jetson-1'
+
+def test_logs_same_timestamp(es, lam):
+    # a burst of readings (backlog of the serial port, replay without rate) with the same ts
+    event = {'device_name': 'jetson-1', 'msg_type': 'logs', 'logs': [
+        {'ts': '2021-01-01T00:00:00.000+00:00', 'data': [1000 + i] + list(range(19))} for i in range(10)
+    ]}
+    lam.lambda_handler(event, None)
+    assert len(es.docs) == 10
+    lam.lambda_handler(event, None) # sent again: no duplicates
+    assert len(es.docs) == 10
+
+def test_retry_rejected_items(es, lam):
+    es.reject_items = 3
+    lam.lambda_handler(logs_event(10), None)
+    assert es.num_requests == 2 # the 2nd one has only the 3 rejected items
+    assert len(es.docs) == 10
+    assert lam.indexer.stats() == {'requests': 2, 'indexed': 10, 'retried': 3, 'failed': 0, 'reconnects': 0}
+
+def test_retry_lost_response_without_duplicates(es, lam):
+    es.drop_responses = 1 # indexed, but the lambda doesn't get the response
+    lam.lambda_handler(logs_event(10), None)
+    assert es.num_requests == 2
+    assert len(es.docs) == 10
+    assert lam.indexer.stats()['retried'] == 10 and lam.indexer.stats()['indexed'] == 10
+
+def test_stale_connection_reconnects_once(es, lam):
+    lam.lambda_handler(logs_event(5), None)
+    es.close_idle = True # the connection kept by the warm lambda is closed by the server
+    lam.lambda_handler(logs_event(5), None) # reused (stale) connection
+    lam.indexer.backoff = 10 # a backoff would fail the test
+    start = time.time()
+    lam.lambda_handler(logs_event(10), None)
+    assert time.time() - start < 2
+    stats = lam.indexer.stats()
+    assert stats['reconnects'] == 1 and stats['retried'] == 0 and stats['failed'] == 0
+    assert es.num_connections == 2
+    assert len(es.docs) == 10
@@ -0,0 +1,119 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import os
+import errno
+import time
+import pytest
+import turbine
+import turbine.util
+
+class FakeIoTDataClient(object):
+    def __init__(self):
+        self.online = True
+        self.payloads = []
+
+    def publish(self, topic, payload):
+        if not self.online:
+            raise Exception("Could not connect to the endpoint URL")
+        self.payloads.append((topic, payload))
+
+class FaultySpool(turbine.DiskSpool):
+    '''
+        DiskSpool whose next append/peek calls fail with an I/O error
+    '''
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.failing_appends = 0
+        self.failing_peeks = 0
+
+    def append(self, data):
+        if self.failing_appends > 0:
+            self.failing_appends -= 1
+            raise OSError(errno.ENOSPC, os.strerror(errno.ENOSPC))
+        super().append(data)
+
+    def peek(self):
+        if self.failing_peeks > 0:
+            self.failing_peeks -= 1
+            raise OSError(errno.EIO, os.strerror(errno.EIO))
+        return super().peek()
+
+@pytest.fixture
+def client(monkeypatch):
+    client = FakeIoTDataClient()
+    monkeypatch.setattr(turbine.util, 'get_client', lambda service_name, iot_params: client)
+    return client
+
+def create_logger(spool):
+    return turbine.Logger('device', {}, max_batch_records=1, flush_interval=0.05, spool=spool,
+                          initial_backoff=0.05, max_backoff=0.05)
+
+def test_spool_append_error(client, tmp_path, wait_for):
+    spool = FaultySpool(str(tmp_path))
+    logger = create_logger(spool)
+    client.online = False
+    spool.failing_appends = 1
+    logger.publish_logs({'ts': time.time(), 'data': [1.0] * 20})
+    assert wait_for(lambda: logger.stats()['failed'] == 1)
+    assert logger.stats()['spool_errors'] == 1
+    assert logger.cloud_log_sync_job.is_alive()
+
+    # the next batches are spooled and drained when the cloud is back
+    logger.publish_logs({'ts': time.time(), 'data': [2.0] * 20})
+    assert wait_for(lambda: logger.stats()['spooled'] == 1)
+    client.online = True
+    logger.publish_logs({'ts': time.time(), 'data': [3.0] * 20})
+    assert wait_for(lambda: logger.stats()['delivered'] == 2)
+    stats = logger.stats()
+    assert stats['drained'] >= 1 and stats['drained'] == stats['spooled'] and stats['failed'] == 1
+    logger.stop(5)
+    assert not logger.cloud_log_sync_job.is_alive()
+
+def test_spool_peek_error(client, tmp_path, wait_for):
+    spool = FaultySpool(str(tmp_path))
+    logger = create_logger(spool)
+    client.online = False
+    for i in range(3):
+        logger.publish_logs({'ts': time.time(), 'data': [float(i)] * 20})
+    assert wait_for(lambda: logger.stats()['spooled'] + logger.stats()['failed'] == 3)
+    assert logger.stats()['spooled'] >= 2 # the first one may fail before the backoff
+    spool.failing_peeks = 2
+    client.online = True
+    assert wait_for(lambda: logger.stats()['spool_records'] == 0)
+    assert logger.stats()['spool_errors'] == 2
+    assert logger.cloud_log_sync_job.is_alive()
+    logger.stop(5)
+
+def test_spool_peek_truncated_segment(tmp_path):
+    spool = turbine.DiskSpool(str(tmp_path))
+    spool.append(b'a' * 10)
+    spool.append(b'b' * 10)
+    spool.sync()
+    # the segment loses the end of the file while the spool is open
+    segment = os.path.join(str(tmp_path), sorted(os.listdir(str(tmp_path)))[0])
+    with open(segment, 'r+b') as f:
+        f.truncate(18 + 4) # 1st record + half of the header of the 2nd one
+    assert spool.peek() == b'a' * 10
+    spool.pop()
+    assert spool.peek() is None
+    assert len(spool) == 0
+    assert spool.stats()['corrupted_bytes'] == 18
+    spool.close()
+
+def test_publish_retry(monkeypatch, wait_for):
+    client = FakeIoTDataClient()
+    calls = []
+    monkeypatch.setattr(turbine.util, 'get_client', lambda service_name, iot_params: calls.append(service_name) or client)
+    publish = client.publish
+    failures = [Exception("Connection reset")]
+    def flaky_publish(topic, payload):
+        if len(failures) > 0:
+            raise failures.pop()
+        publish(topic, payload)
+    client.publish = flaky_publish
+    logger = create_logger(None)
+    logger.publish_logs({'ts': time.time(), 'data': [1.0] * 20})
+    assert wait_for(lambda: logger.stats()['delivered'] == 1)
+    assert logger.stats()['retried'] == 1 and logger.stats()['failed'] == 0
+    assert calls == ['iot-data'] # the cached client is reused by the retry
+    logger.stop(5)
@@ -0,0 +1,81 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import io
+import os
+import tarfile
+import pytest
+import turbine
+
+def package(files, links=()):
+    '''
+        In-memory tar.gz with files {name: bytes} and links [(name, target, type)]
+    '''
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode='w:gz') as tar:
+        for name, data in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+        for name, target, link_type in links:
+            info = tarfile.TarInfo(name)
+            info.type = link_type
+            info.linkname = target
+            tar.addfile(info)
+    buf.seek(0)
+    return buf
+
+class FakeMqttClient(object):
+    def loop_stop(self): pass
+    def disconnect(self): pass
+
+@pytest.fixture
+def ota(tmp_path):
+    # only the attributes used by the extraction (no mqtt connection)
+    ota = object.__new__(turbine.OTAModelUpdate)
+    ota.model_path = str(tmp_path / 'models')
+    ota.chunk_size = 1024
+    ota.mqttc = FakeMqttClient()
+    return ota
+
+def listdir(path):
+    return sorted(os.path.relpath(os.path.join(root, f), path) for root, dirs, files in os.walk(path) for f in files)
+
+def test_extract_package(ota):
+    ota.__extract_package__(package({'compiled.so': b'model', 'meta/compiled.meta': b'{}'}), 'wind-turbine', '1.0')
+    model_dir = os.path.join(ota.model_path, 'wind-turbine')
+    assert os.listdir(model_dir) == ['1.0'] # no staging dir left
+    assert listdir(os.path.join(model_dir, '1.0')) == ['compiled.so', os.path.join('meta', 'compiled.meta')]
+    with open(os.path.join(model_dir, '1.0', 'compiled.so'), 'rb') as f:
+        assert f.read() == b'model'
+
+@pytest.mark.parametrize('files,links', [
+    ({'compiled.so': b'model', '../x': b'evil'}, ()),
+    ({'compiled.so': b'model', 'meta/../../x': b'evil'}, ()),
+    ({'/tmp/x': b'evil'}, ()),
+    ({'compiled.so': b'model'}, [('link', '/etc/passwd', tarfile.SYMTYPE)]),
+    ({'compiled.so': b'model'}, [('hardlink', 'compiled.so', tarfile.LNKTYPE)]),
+])
+def test_invalid_package(ota, tmp_path, files, links):
+    with pytest.raises(Exception, match='Invalid file in the model package'):
+        ota.__extract_package__(package(files, links), 'wind-turbine', '1.0')
+    # nothing was written outside the model dir, and the staging dir was removed
+    assert os.listdir(os.path.join(ota.model_path, 'wind-turbine')) == []
+    assert not os.path.exists(str(tmp_path / 'x'))
+
+def test_extract_existing_version(ota):
+    ota.__extract_package__(package({'compiled.so': b'old', 'stale.txt': b'stale'}), 'wind-turbine', '1.0')
+    ota.__extract_package__(package({'compiled.so': b'new'}), 'wind-turbine', '1.0')
+    model_dir = os.path.join(ota.model_path, 'wind-turbine')
+    assert os.listdir(model_dir) == ['1.0'] # the old dir was removed
+    assert listdir(os.path.join(model_dir, '1.0')) == ['compiled.so']
+    with open(os.path.join(model_dir, '1.0', 'compiled.so'), 'rb') as f:
+        assert f.read() == b'new'
+
+def test_invalid_package_keeps_existing_version(ota):
+    ota.__extract_package__(package({'compiled.so': b'old'}), 'wind-turbine', '1.0')
+    with pytest.raises(Exception):
+        ota.__extract_package__(package({'compiled.so': b'new', '../x': b'evil'}), 'wind-turbine', '1.0')
+    model_dir = os.path.join(ota.model_path, 'wind-turbine')
+    assert os.listdir(model_dir) == ['1.0']
+    with open(os.path.join(model_dir, '1.0', 'compiled.so'), 'rb') as f:
+        assert f.read() == b'old'
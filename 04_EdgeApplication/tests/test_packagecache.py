@@ -0,0 +1,111 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import os
+import hashlib
+import pytest
+import turbine
+
+class FakeBody(object):
+    def __init__(self, data, fail_at=None):
+        self.data = data
+        self.pos = 0
+        self.fail_at = fail_at # the connection is lost after fail_at bytes
+
+    def read(self, size):
+        if self.fail_at is not None and self.pos >= self.fail_at:
+            raise ConnectionResetError("Connection reset by peer")
+        end = self.pos + size if self.fail_at is None else min(self.pos + size, self.fail_at)
+        chunk, self.pos = self.data[self.pos:end], end
+        return chunk
+
+class FakeS3Client(object):
+    '''
+        head_object/get_object of a single object, with the failures of
+        the next get_object calls given in fail_at (# of bytes sent)
+    '''
+    def __init__(self, data, etag=None, **head):
+        self.data = data
+        self.etag = hashlib.md5(data).hexdigest() if etag is None else etag
+        self.head = head
+        self.fail_at = []
+        self.ranges = []
+
+    def head_object(self, Bucket, Key):
+        return dict(self.head, ETag='"%s"' % self.etag, ContentLength=len(self.data))
+
+    def get_object(self, Bucket, Key, Range, IfMatch):
+        assert IfMatch == self.etag
+        self.ranges.append(Range)
+        offset = int(Range[len('bytes='):-1])
+        fail_at = self.fail_at.pop(0) if len(self.fail_at) > 0 else None
+        return {'Body': FakeBody(self.data[offset:], fail_at)}
+
+DATA = os.urandom(10 * 1024)
+SHA256 = hashlib.sha256(DATA).hexdigest()
+
+@pytest.fixture
+def cache(tmp_path):
+    return turbine.ModelPackageCache(str(tmp_path), chunk_size=1024, sync_interval=1024, initial_backoff=0.0)
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+def test_resume_download(cache):
+    s3 = FakeS3Client(DATA)
+    s3.fail_at = [4096]
+    path = cache.fetch(lambda: s3, 'bucket', 'model.tar.gz', SHA256)
+    assert s3.ranges == ['bytes=0-', 'bytes=4096-']
+    assert read(path) == DATA
+    assert os.path.basename(path) == SHA256
+    assert os.listdir(cache.partial_dir) == []
+
+def test_resume_after_restart(tmp_path):
+    s3 = FakeS3Client(DATA)
+    s3.fail_at = [3072, 0] # no progress after the retry
+    cache = turbine.ModelPackageCache(str(tmp_path), chunk_size=1024, sync_interval=1024, max_retries=1, initial_backoff=0.0)
+    with pytest.raises(ConnectionResetError):
+        cache.fetch(lambda: s3, 'bucket', 'model.tar.gz', SHA256)
+    # the process restarts: the download continues from the partial file
+    cache = turbine.ModelPackageCache(str(tmp_path), chunk_size=1024, sync_interval=1024, initial_backoff=0.0)
+    path = cache.fetch(lambda: s3, 'bucket', 'model.tar.gz', SHA256)
+    assert s3.ranges == ['bytes=0-', 'bytes=3072-', 'bytes=3072-']
+    assert read(path) == DATA
+
+def test_cache_hit(cache):
+    s3 = FakeS3Client(DATA)
+    path = cache.fetch(lambda: s3, 'bucket', 'model.tar.gz', SHA256)
+    assert len(s3.ranges) == 1
+    # by sha256: S3 isn't used at all
+    def no_client():
+        raise Exception("S3 shouldn't be used")
+    assert cache.fetch(no_client, 'bucket', 'model.tar.gz', SHA256) == path
+    # by etag (index)
+    assert cache.fetch(no_client, 'bucket', 'model.tar.gz', etag='"%s"' % s3.etag) == path
+    # without sha256/etag: only head_object
+    assert cache.fetch(lambda: s3, 'bucket', 'model.tar.gz') == path
+    assert len(s3.ranges) == 1
+
+def test_sha256_mismatch_removes_partial(cache):
+    s3 = FakeS3Client(DATA)
+    with pytest.raises(Exception, match='Expected SHA-256'):
+        cache.fetch(lambda: s3, 'bucket', 'model.tar.gz', '0' * 64)
+    assert os.listdir(cache.partial_dir) == []
+    assert os.listdir(cache.packages_dir) == []
+
+def test_md5_mismatch(cache):
+    s3 = FakeS3Client(DATA, etag='0' * 32)
+    with pytest.raises(Exception, match='Expected MD5'):
+        cache.fetch(lambda: s3, 'bucket', 'model.tar.gz')
+    assert os.listdir(cache.partial_dir) == []
+
+@pytest.mark.parametrize('head', [
+    {'ServerSideEncryption': 'aws:kms', 'SSEKMSKeyId': 'key'},
+    {'ServerSideEncryption': 'aws:kms:dsse'},
+    {'SSECustomerAlgorithm': 'AES256'},
+])
+def test_encrypted_objects_skip_md5(cache, head):
+    # the ETag of these objects isn't the md5 of the data
+    s3 = FakeS3Client(DATA, etag='0' * 32, **head)
+    path = cache.fetch(lambda: s3, 'bucket', 'model.tar.gz', SHA256)
+    assert read(path) == DATA
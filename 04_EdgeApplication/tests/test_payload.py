@@ -0,0 +1,32 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import json
+import numpy as np
+import pytest
+import turbine
+from capture_parser import decode_columnar_logs
+
+def encode(encoder, records):
+    return encoder.encode([encoder.encode_record(r)[0] for r in records])
+
+def test_json_float_readings():
+    data = np.array([123456789, 1024, 0.1, 1.0 / 3, -2.5, 1e-8] + [0.0] * 14, dtype=np.float64)
+    data[2:] = data[2:].astype(np.float32)
+    logs = json.loads(encode(turbine.JsonPayloadEncoder(), [{'ts': 0.0, 'data': data}]))['logs']
+    assert logs[0]['ts'] == '1970-01-01T00:00:00.000+00:00'
+    assert logs[0]['data'][:6] == [123456789, 1024, 0.1, 0.3333333, -2.5, 1e-8]
+    # 7 significant digits: within 1 ulp of the float32 readings
+    np.testing.assert_allclose(logs[0]['data'], data, rtol=2e-7, atol=0)
+
+def test_json_text_readings():
+    tokens = np.array(['1', '2', '0.100'] + ['0'] * 17)
+    logs = json.loads(encode(turbine.JsonPayloadEncoder(), [{'ts': 1.5, 'data': tokens}]))['logs']
+    assert logs[0]['data'] == tokens.tolist()
+
+@pytest.mark.parametrize('compress', [False, True])
+def test_columnar_matches_json(compress):
+    records = [{'ts': 1600000000.0 + i * 0.05, 'data': np.random.rand(20).astype(np.float32)} for i in range(50)]
+    expected = json.loads(encode(turbine.JsonPayloadEncoder(), records))['logs']
+    logs = decode_columnar_logs(encode(turbine.ColumnarPayloadEncoder(20, compress=compress), records))
+    assert [l['ts'] for l in logs] == [l['ts'] for l in expected]
+    assert [l['data'] for l in logs] == [l['data'] for l in expected]
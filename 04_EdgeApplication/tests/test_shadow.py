@@ -0,0 +1,113 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import time
+import threading
+import numpy as np
+import turbine
+
+class FakeEdgeAgent(object):
+    def __init__(self):
+        self.unloaded = []
+
+    def unload_model(self, model_name):
+        self.unloaded.append(model_name)
+
+class FakeActiveModel(object):
+    '''
+        ActiveModel whose models return x * scale[model] (no agent)
+    '''
+    def __init__(self):
+        self.edge_agent = FakeEdgeAgent()
+        self.name = 'model-1'
+        self.scale = {'model-1': 1.1}
+        self.activated = []
+
+    def is_loaded(self):
+        return self.name is not None
+
+    def load(self, model_name, model_path):
+        self.scale.setdefault(model_name, 1.1)
+        return 0.0, 0.0
+
+    def invoke(self, model_name, x):
+        return x * self.scale[model_name]
+
+    def activate(self, model_name):
+        self.activated.append(model_name)
+        self.name = model_name
+        return 0.0
+
+class Results(object):
+    def __init__(self):
+        self.results = []
+        self.event = threading.Event()
+
+    def __call__(self, promoted, details):
+        self.results.append((promoted, details))
+        self.event.set()
+
+def submit_windows(shadow, active_model, num_windows):
+    for i in range(num_windows):
+        x = np.random.rand(1, 6, 10, 10).astype(np.float32) + 1
+        p = active_model.invoke(active_model.name, x)
+        shadow.submit(x, turbine.reconstruction_mae(x, p))
+        time.sleep(0.005) # the worker drops the windows if it is busy
+
+def test_promoted():
+    active_model = FakeActiveModel()
+    shadow = turbine.ShadowEvaluator(active_model, np.full(6, 10.0), min_windows=20, max_duration=10)
+    results = Results()
+    shadow.start('model-2', '/models/model-2', results)
+    submit_windows(shadow, active_model, 40)
+    assert results.event.wait(5)
+    assert results.results[0][0] is True
+    assert active_model.activated == ['model-2'] and active_model.edge_agent.unloaded == []
+    assert not shadow.is_running()
+    shadow.stop(1)
+
+def test_rejected_mae():
+    active_model = FakeActiveModel()
+    active_model.scale['model-2'] = 1.5
+    shadow = turbine.ShadowEvaluator(active_model, np.full(6, 10.0), min_windows=20, max_duration=10)
+    results = Results()
+    shadow.start('model-2', '/models/model-2', results)
+    submit_windows(shadow, active_model, 40)
+    assert results.event.wait(5)
+    assert results.results[0][0] is False and 'MAE increased' in results.results[0][1]
+    assert active_model.activated == [] and active_model.edge_agent.unloaded == ['model-2']
+    shadow.stop(1)
+
+def test_timeout_without_windows():
+    active_model = FakeActiveModel()
+    shadow = turbine.ShadowEvaluator(active_model, np.full(6, 10.0), min_windows=20, max_duration=0.2)
+    results = Results()
+    start = time.time()
+    shadow.start('model-2', '/models/model-2', results)
+    # no windows arrive (e.g. the sensors stalled)
+    assert results.event.wait(5)
+    assert time.time() - start < 1.0
+    assert results.results == [(False, "Only 0/20 windows evaluated in 0.2s")]
+    assert active_model.edge_agent.unloaded == ['model-2']
+    assert not shadow.is_running()
+    # a new evaluation can start
+    results = Results()
+    shadow.start('model-3', '/models/model-3', results)
+    assert shadow.is_running()
+    shadow.stop(1)
+    assert active_model.edge_agent.unloaded == ['model-2', 'model-3']
+    time.sleep(0.3) # the timer was cancelled
+    assert results.results == []
+
+def test_finished_once():
+    active_model = FakeActiveModel()
+    shadow = turbine.ShadowEvaluator(active_model, np.full(6, 10.0), min_windows=20, max_duration=10)
+    results = Results()
+    shadow.start('model-2', '/models/model-2', results)
+    threads = [threading.Thread(target=shadow.__finish__, args=('model-2', False, 'rejected')) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert results.results == [(False, 'rejected')]
+    assert active_model.edge_agent.unloaded == ['model-2']
+    shadow.stop(1)
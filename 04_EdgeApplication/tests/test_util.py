@@ -0,0 +1,150 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import math
+import numpy as np
+import pytest
+import turbine
+
+def euler_from_quaternion_math(x, y, z, w):
+    # original scalar implementation
+    t0 = +2.0 * (w * x + y * z)
+    t1 = +1.0 - 2.0 * (x * x + y * y)
+    roll_x = math.atan2(t0, t1)
+
+    t2 = +2.0 * (w * y - z * x)
+    t2 = +1.0 if t2 > +1.0 else t2
+    t2 = -1.0 if t2 < -1.0 else t2
+    pitch_y = math.asin(t2)
+
+    t3 = +2.0 * (w * z + x * y)
+    t4 = +1.0 - 2.0 * (y * y + z * z)
+    yaw_z = math.atan2(t3, t4)
+
+    return roll_x, pitch_y, yaw_z
+
+def create_dataset_loop(X, time_steps=1, step=1):
+    # original implementation (python loop)
+    Xs = []
+    for i in range(0, len(X) - time_steps, step):
+        Xs.append(X[i:(i + time_steps)])
+    return np.array(Xs)
+
+def test_create_dataset_matches_loop():
+    X = np.random.rand(110, 6)
+    expected = create_dataset_loop(X, 100, 10)
+    np.testing.assert_array_equal(turbine.create_dataset(X, 100, 10), expected)
+    x = turbine.create_dataset(X, 100, 10, grid=(10, 10))
+    np.testing.assert_array_equal(x, expected.transpose((0, 2, 1)).reshape(-1, 6, 10, 10).astype(np.float32))
+
+def test_create_dataset_out():
+    X = np.random.rand(110, 6)
+    x = np.zeros((3, 6, 10, 10), dtype=np.float32)
+    out = turbine.create_dataset(X, 100, 10, grid=(10, 10), out=x[1:2])
+    assert np.shares_memory(out, x)
+    np.testing.assert_array_equal(x[1:2], turbine.create_dataset(X, 100, 10, grid=(10, 10)))
+    assert not x[0].any() and not x[2].any()
+
+@pytest.mark.parametrize('out', [
+    np.zeros((3, 6, 10, 10), dtype=np.float32)[:, :1], # not contiguous
+    np.zeros((3, 6, 10, 10), dtype=np.float32)[:1, :, ::-1],
+    np.zeros((1, 6, 10, 10), dtype=np.float64),
+    np.zeros((2, 6, 10, 10), dtype=np.float32),
+])
+def test_create_dataset_invalid_out(out):
+    with pytest.raises(ValueError):
+        turbine.create_dataset(np.random.rand(110, 6), 100, 10, grid=(10, 10), out=out)
+
+def test_create_dataset_invalid_grid():
+    with pytest.raises(ValueError):
+        turbine.create_dataset(np.random.rand(110, 6), 100, 10, grid=(5, 10))
+
+def test_euler_from_quaternions_matches_math():
+    q = np.random.uniform(-1, 1, (1000, 4))
+    q /= np.linalg.norm(q, axis=1, keepdims=True)
+    expected = np.array([euler_from_quaternion_math(*r) for r in q])
+    np.testing.assert_allclose(turbine.euler_from_quaternions(q), expected, rtol=0, atol=1e-12)
+
+@pytest.mark.parametrize('q', [
+    (0.0, math.sqrt(0.5), 0.0, math.sqrt(0.5)), # pitch = +pi/2
+    (0.0, -math.sqrt(0.5), 0.0, math.sqrt(0.5)), # pitch = -pi/2
+    (0.0, 0.8, 0.0, 0.8), # not normalized: 2(wy - zx) = 1.28 > 1
+    (0.0, -0.8, 0.0, 0.8), # 2(wy - zx) = -1.28 < -1
+    (0.3, 0.9, -0.2, 0.9),
+])
+def test_euler_from_quaternions_pitch_clamp(q):
+    expected = euler_from_quaternion_math(*q)
+    angles = turbine.euler_from_quaternions(np.array([q]))[0]
+    assert not np.isnan(angles).any()
+    np.testing.assert_allclose(angles, expected, rtol=0, atol=1e-12)
+    assert abs(angles[1]) <= math.pi / 2
+    np.testing.assert_allclose(turbine.euler_from_quaternion(*q), expected, rtol=0, atol=1e-12)
+
+def test_euler_from_quaternion_matches_vectorized():
+    q = np.random.uniform(-1, 1, (100, 4))
+    angles = [turbine.euler_from_quaternion(*r) for r in q.tolist()]
+    assert all(type(a) is float for r in angles for a in r)
+    np.testing.assert_allclose(angles, turbine.euler_from_quaternions(q), rtol=0, atol=1e-12)
+
+def test_euler_from_quaternions_out():
+    q = np.random.uniform(-1, 1, (10, 4))
+    out = np.empty((10, 3))
+    assert turbine.euler_from_quaternions(q, out=out) is out
+    np.testing.assert_allclose(out, [euler_from_quaternion_math(*r) for r in q], rtol=0, atol=1e-12)
+
+def test_ringbuffer_wrap_around():
+    samples = turbine.RingBuffer(5, 2)
+    for i in range(12):
+        samples.append((i, -i))
+    assert len(samples) == 5 and samples.is_full() and samples.num_appended == 12
+    np.testing.assert_array_equal(samples.last(), [(i, -i) for i in range(7, 12)])
+    np.testing.assert_array_equal(samples.last(3), [(i, -i) for i in range(9, 12)])
+    assert samples.last().base is samples.buffer # zero-copy view
+
+def test_ringbuffer_last_more_than_count():
+    samples = turbine.RingBuffer(5, 2)
+    assert samples.last(3).shape == (0, 2)
+    for i in range(3):
+        samples.append((i, i))
+    assert len(samples) == 3 and not samples.is_full()
+    np.testing.assert_array_equal(samples.last(10), [(0, 0), (1, 1), (2, 2)])
+
+def test_ringbuffer_clear():
+    samples = turbine.RingBuffer(5, 2)
+    for i in range(7):
+        samples.append((i, i))
+    samples.clear()
+    assert len(samples) == 0 and not samples.is_full()
+    assert samples.last().shape == (0, 2)
+    samples.append((100, 100))
+    np.testing.assert_array_equal(samples.last(), [(100, 100)])
+
+def test_wavelet_denoiser_matches_wavelet_denoise():
+    np.random.seed(7)
+    raw_std = np.random.rand(6) * 0.1 + 0.01
+    samples = turbine.RingBuffer(501, 6)
+    denoiser = turbine.WaveletDenoiser(samples, raw_std, 'db6')
+    readings = np.random.rand(501 + 150, 6)
+    for r in readings: # past the wrap-around
+        samples.append(r)
+    window = readings[-501:]
+    expected = np.array([turbine.wavelet_denoise(window[:,i], raw_std[i], 'db6') for i in range(6)]).T
+    denoised = denoiser.denoise()
+    assert denoised.shape == expected.shape == (502, 6) # waverec pads an odd window by one row
+    assert np.abs(denoised - expected).max() < 1e-9
+    np.testing.assert_array_equal(denoiser.denoise(110), denoised[-110:])
+
+def test_wavelet_denoiser_cache():
+    samples = turbine.RingBuffer(501, 6)
+    denoiser = turbine.WaveletDenoiser(samples, np.full(6, 0.05), 'db6')
+    with pytest.raises(Exception, match='not full'):
+        denoiser.denoise()
+    for r in np.random.rand(501, 6):
+        samples.append(r)
+    first = denoiser.denoise()
+    assert denoiser.denoise() is first # cached
+    samples.append(np.ones(6))
+    second = denoiser.denoise()
+    assert second is not first
+    window = samples.last()
+    expected = np.array([turbine.wavelet_denoise(window[:,i], 0.05, 'db6') for i in range(6)]).T
+    assert np.abs(second - expected).max() < 1e-9
@@ -1,6 +1,18 @@
 # Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
 # SPDX-License-Identifier: MIT-0
 from turbine.edgeagentclient import EdgeAgentClient
+from turbine.activemodel import ActiveModel
+from turbine.shadow import ShadowEvaluator
 from turbine.ota import OTAModelUpdate
+from turbine.packagecache import ModelPackageCache
 from turbine.logger import Logger
+from turbine.payload import JsonPayloadEncoder, ColumnarPayloadEncoder
+from turbine.spool import DiskSpool
+from turbine.ringbuffer import RingBuffer
+from turbine.framereader import BinaryFrameReader
+from turbine.replay import SensorsReplay, build_replay_cache
+from turbine.pipeline import BackgroundWorker, SensorsIngestion
+from turbine.capture import CaptureDataQueue
+from turbine.channel import TurbineChannel
+from turbine.credentials import IoTCredentialsProvider, get_credentials_provider
 from turbine.util import *
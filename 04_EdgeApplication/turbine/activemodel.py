@@ -0,0 +1,149 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import threading
+import collections
+import logging
+import time
+import numpy as np
+
+class ActiveModel(object):
+    def __init__(self, edge_agent, input_shape, warmup_iterations=5, drain_timeout=10.0, shm=False):
+        '''
+            Model used by the predictions, swapped without downtime:
+                1. the new model is loaded alongside the active one
+                2. it is warmed up with warmup_iterations predictions
+                   of a synthetic input_shape tensor
+                3. the predictions are switched to it atomically
+                4. the old model is unloaded after its in-flight
+                   predictions finish (or after drain_timeout seconds)
+            The predictions accept any # of windows (leading dim of the input)
+            and are sent in chunks of the batch size the model was compiled for,
+            so a model compiled for N windows gets N turbines in a single Predict.
+            shm: send the input tensors through shared memory
+        '''
+        self.edge_agent = edge_agent
+        self.input_shape = input_shape
+        self.warmup_iterations = warmup_iterations
+        self.drain_timeout = drain_timeout
+        self.shm = shm
+        self.name = None
+        self.condition = threading.Condition()
+        self.swap_lock = threading.Lock() # one swap at a time
+        self.in_flight = collections.Counter() # model_name: # of predictions running
+        self.num_swaps = 0
+        self.last_swap = None
+
+    def is_loaded(self):
+        return self.name is not None
+
+    def batch_size(self, model_name=None):
+        '''
+            # of windows of each Predict of a (the active) model
+        '''
+        meta = self.edge_agent.model_map.get(self.name if model_name is None else model_name)
+        return int(meta['in'][0].shape[0]) if meta is not None else 1
+
+    def invoke(self, model_name, x):
+        '''
+            Invoke a model with x (N windows), in chunks of its batch size.
+            The last chunk is padded by repeating its last window.
+            Returns the predictions of the N windows or None if it fails
+        '''
+        batch_size = self.batch_size(model_name)
+        if len(x) == batch_size:
+            return self.edge_agent.predict(model_name, x, shm=self.shm)
+        outputs = []
+        for i in range(0, len(x), batch_size):
+            chunk = x[i:i + batch_size]
+            if len(chunk) < batch_size:
+                chunk = np.concatenate((chunk, np.repeat(chunk[-1:], batch_size - len(chunk), axis=0)))
+            p = self.edge_agent.predict(model_name, chunk, shm=self.shm)
+            if p is None:
+                return None
+            outputs.append(p[:len(x) - i])
+        return np.concatenate(outputs)
+
+    def predict(self, x):
+        '''
+            Invoke the active model with x (N windows). Returns
+            (model_name, predictions) or (None, None) if there is no model
+        '''
+        with self.condition:
+            name = self.name
+            if name is None:
+                return None, None
+            self.in_flight[name] += 1
+        try:
+            return name, self.invoke(name, x)
+        finally:
+            with self.condition:
+                self.in_flight[name] -= 1
+                if self.in_flight[name] == 0:
+                    del self.in_flight[name]
+                    self.condition.notify_all()
+
+    def warmup(self, model_name):
+        '''
+            Run the first (slow) predictions of a model
+        '''
+        for i in range(self.warmup_iterations):
+            x = np.random.rand(*self.input_shape).astype(np.float32)
+            if self.invoke(model_name, x) is None:
+                raise Exception("Model %s failed the warm-up" % model_name)
+
+    def load(self, model_name, model_path):
+        '''
+            Load and warm up a model, without activating it.
+            Returns the load and the warm-up times in seconds
+        '''
+        start = time.time()
+        if self.edge_agent.load_model(model_name, model_path) is None:
+            raise Exception('It was not possible to load the model %s. Is the agent running?' % model_name)
+        loaded = time.time()
+        try:
+            self.warmup(model_name)
+        except Exception:
+            if model_name != self.name:
+                self.edge_agent.unload_model(model_name)
+            raise
+        return loaded - start, time.time() - loaded
+
+    def activate(self, model_name):
+        '''
+            Switch the predictions to a loaded model and unload the previous one
+            after its in-flight predictions. Returns the drain time in seconds
+        '''
+        with self.condition:
+            old_name, self.name = self.name, model_name
+            if old_name is None or old_name == model_name:
+                return 0.0
+            start = time.time()
+            if not self.condition.wait_for(lambda: self.in_flight[old_name] == 0, self.drain_timeout):
+                logging.error("Model %s still has predictions running. Unloading it anyway" % old_name)
+            drain_time = time.time() - start
+        self.edge_agent.unload_model(old_name)
+        return drain_time
+
+    def swap(self, model_name, model_path):
+        '''
+            Load, warm up and activate a new model
+        '''
+        with self.swap_lock:
+            start = time.time()
+            load_time, warmup_time = self.load(model_name, model_path)
+            drain_time = self.activate(model_name)
+            self.num_swaps += 1
+            self.last_swap = {
+                'model': model_name, 'load_ms': load_time * 1000, 'warmup_ms': warmup_time * 1000,
+                'drain_ms': drain_time * 1000, 'total_ms': (time.time() - start) * 1000
+            }
+            logging.info("Model %s activated: %s" % (model_name, self.last_swap))
+
+    def unload(self):
+        with self.condition:
+            name, self.name = self.name, None
+        if name is not None:
+            self.edge_agent.unload_model(name)
+
+    def stats(self):
+        return {'model': self.name, 'swaps': self.num_swaps, 'last_swap': self.last_swap}
@@ -0,0 +1,201 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import threading
+import logging
+import collections
+import time
+import grpc
+import turbine.agent_pb2 as agent
+
+class CaptureDataQueue(object):
+    def __init__(self, edge_agent, max_queue_size=100, batch_size=1, flush_interval=1.0,
+                 overflow='drop_newest', max_in_flight=4, track_status=False, status_interval=10.0,
+                 timeout=5.0):
+        '''
+            Asynchronous CaptureData. The predictions are enqueued without
+            blocking and a worker thread sends them to the agent with the
+            grpc future API, so a slow agent never adds latency to the caller.
+            Up to batch_size predictions of the same model are sent in a single
+            request (one input/output tensor pair per prediction). A partial
+            batch is sent flush_interval seconds after its oldest prediction.
+            overflow: what to do when the queue is full
+                drop_newest: discard the new prediction
+                drop_oldest: discard the oldest prediction of the queue
+            max_in_flight: max # of requests waiting for the agent. When it is
+                reached, the worker waits and the queue fills up (backpressure)
+            timeout: max time in seconds to wait for the agent. A request that
+                takes longer fails (DEADLINE_EXCEEDED) and frees its in-flight
+                slot, so a hung agent can't block the worker forever
+            track_status: check the sent captures with GetCaptureDataStatus
+                every status_interval seconds
+        '''
+        if overflow not in ('drop_newest', 'drop_oldest'):
+            raise Exception("Invalid overflow policy: %s" % overflow)
+        self.edge_agent = edge_agent
+        self.max_queue_size = max_queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow = overflow
+        self.max_in_flight = max_in_flight
+        self.track_status = track_status
+        self.status_interval = status_interval
+        self.timeout = timeout
+
+        self.queue = collections.deque()
+        self.condition = threading.Condition()
+        self.in_flight = threading.BoundedSemaphore(max_in_flight)
+        self.pending_status = collections.OrderedDict() # capture_id: # of predictions
+        self.last_status_check = time.time()
+
+        self.num_enqueued = 0
+        self.num_dropped = 0
+        self.num_requests = 0
+        self.num_in_flight = 0
+        self.num_captured = 0
+        self.num_failed = 0
+        self.num_timeouts = 0
+        self.num_status = {'success': 0, 'failure': 0, 'not_found': 0}
+
+        self.running = True
+        self.thread = threading.Thread(target=self.__run__, name='capture-data', daemon=True)
+        self.thread.start()
+
+    def capture(self, model_name, input_data, output_data, timestamp=None, turbine=None):
+        '''
+            Enqueue a prediction to be captured. It never blocks.
+            turbine: name of the turbine of the prediction, sent with the
+                capture so the predictions of several turbines can be told apart
+            Returns False if the new prediction was dropped
+        '''
+        timestamp = time.time() if timestamp is None else timestamp
+        with self.condition:
+            if len(self.queue) >= self.max_queue_size:
+                self.num_dropped += 1
+                if self.overflow == 'drop_newest':
+                    return False
+                self.queue.popleft()
+            self.queue.append((model_name, input_data, output_data, timestamp, turbine))
+            self.num_enqueued += 1
+            self.condition.notify()
+        return True
+
+    def __next_batch__(self):
+        '''
+            Wait for a full batch, the flush interval of the oldest
+            prediction or the end of the worker
+        '''
+        with self.condition:
+            while self.running and len(self.queue) < self.batch_size:
+                if len(self.queue) > 0:
+                    timeout = self.queue[0][3] + self.flush_interval - time.time()
+                    if timeout <= 0:
+                        break
+                elif self.track_status:
+                    timeout = self.status_interval
+                else:
+                    timeout = None
+                self.condition.wait(timeout)
+                if self.track_status and len(self.queue) == 0:
+                    return []
+
+            batch = []
+            while len(self.queue) > 0 and len(batch) < self.batch_size:
+                if len(batch) > 0 and self.queue[0][0] != batch[0][0]:
+                    break # a request has tensors of a single model
+                batch.append(self.queue.popleft())
+            return batch
+
+    def __send__(self, batch):
+        self.in_flight.acquire()
+        try:
+            turbines = [b[4] for b in batch] if any(b[4] is not None for b in batch) else None
+            req = self.edge_agent.create_capture_request(
+                batch[0][0], [b[1] for b in batch], [b[2] for b in batch], batch[0][3], turbines)
+            future = self.edge_agent.capture_data_future(req, self.timeout)
+        except Exception as e:
+            self.in_flight.release()
+            with self.condition:
+                self.num_failed += len(batch)
+            logging.error(e)
+            return
+        with self.condition:
+            self.num_requests += 1
+            self.num_in_flight += 1
+        future.add_done_callback(lambda f: self.__on_capture_done__(f, req.capture_id, len(batch)))
+
+    def __on_capture_done__(self, future, capture_id, num_predictions):
+        self.in_flight.release()
+        error = future.exception()
+        with self.condition:
+            self.num_in_flight -= 1
+            if error is not None:
+                self.num_failed += num_predictions
+                if isinstance(error, grpc.RpcError) and error.code() == grpc.StatusCode.DEADLINE_EXCEEDED:
+                    self.num_timeouts += 1
+            else:
+                self.num_captured += num_predictions
+                if self.track_status:
+                    self.pending_status[capture_id] = num_predictions
+                    while len(self.pending_status) > self.max_queue_size:
+                        self.pending_status.popitem(last=False)
+        if error is not None:
+            logging.error(error)
+
+    def __check_status__(self):
+        '''
+            Ask the agent for the status of the captures sent so far
+        '''
+        if time.time() - self.last_status_check < self.status_interval:
+            return
+        self.last_status_check = time.time()
+        with self.condition:
+            capture_ids = list(self.pending_status.keys())
+        for capture_id in capture_ids:
+            try:
+                future = self.edge_agent.get_capture_data_status_future(capture_id, self.timeout)
+                future.add_done_callback(lambda f, c=capture_id: self.__on_status__(f, c))
+            except Exception as e:
+                logging.error(e)
+
+    def __on_status__(self, future, capture_id):
+        if future.exception() is not None:
+            return
+        status = future.result().status
+        if status == agent.IN_PROGRESS:
+            return
+        key = {agent.SUCCESS: 'success', agent.FAILURE: 'failure'}.get(status, 'not_found')
+        with self.condition:
+            if self.pending_status.pop(capture_id, None) is not None:
+                self.num_status[key] += 1
+
+    def __run__(self):
+        while True:
+            batch = self.__next_batch__()
+            if len(batch) > 0:
+                self.__send__(batch)
+            if self.track_status:
+                self.__check_status__()
+            with self.condition:
+                if not self.running and len(self.queue) == 0:
+                    break
+
+    def stop(self, timeout=None):
+        '''
+            Send the pending predictions and stop the worker
+        '''
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        self.thread.join(timeout)
+
+    def stats(self):
+        with self.condition:
+            stats = {
+                'queue_size': len(self.queue), 'in_flight': self.num_in_flight,
+                'enqueued': self.num_enqueued, 'dropped': self.num_dropped,
+                'requests': self.num_requests, 'captured': self.num_captured, 'failed': self.num_failed,
+                'timeouts': self.num_timeouts
+            }
+            if self.track_status:
+                stats['status'] = dict(self.num_status, pending=len(self.pending_status))
+        return stats
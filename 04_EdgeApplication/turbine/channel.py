@@ -0,0 +1,82 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import time
+import logging
+import numpy as np
+from turbine.ringbuffer import RingBuffer
+from turbine.pipeline import BackgroundWorker, SensorsIngestion
+from turbine.util import WaveletDenoiser
+
+class TurbineChannel(object):
+    def __init__(self, name, sensors, read_reading, parse_reading, logger, num_samples, num_features,
+                 noise_sigma, telemetry_queue_size=1000):
+        '''
+            Per-turbine state of the application: the sensors (serial port or
+            replay) drained by their own ingestion thread, the window of samples
+            and its wavelet denoiser, the telemetry sent to the cloud by its
+            Logger and the prediction metrics of the turbine. The edge agent,
+            the model and the cloud clients are shared by all the turbines.
+            read_reading(): next raw reading of the sensors
+            parse_reading(reading): sample used by the model or None if invalid
+        '''
+        self.name = name
+        self.sensors = sensors
+        self.logger = logger
+        self.samples = RingBuffer(num_samples, num_features)
+        self.denoiser = WaveletDenoiser(self.samples, noise_sigma, 'db6')
+        # telemetry never blocks the ingestion/inference
+        self.telemetry_worker = BackgroundWorker(self.__publish_reading__, telemetry_queue_size, 'telemetry-%s' % name)
+        self.ingestion = SensorsIngestion(
+            sensors, read_reading, parse_reading, self.samples,
+            on_reading=lambda tokens: self.telemetry_worker.submit((time.time(), tokens))
+        )
+        self.num_predictions = 0
+        self.num_anomalies = np.zeros(num_features, dtype=np.int64) # per feature
+        self.last_mae = None
+
+    def __publish_reading__(self, item):
+        ts, tokens = item
+        self.logger.publish_logs({'ts': ts, 'data': tokens})
+
+    def start(self):
+        self.ingestion.start()
+
+    def is_running(self):
+        return self.ingestion.running
+
+    def window(self, last):
+        '''
+            Copy of the last rows of the denoised window
+            or None if the window isn't full yet
+        '''
+        with self.ingestion.samples_lock:
+            if not self.samples.is_full():
+                return None
+            return self.denoiser.denoise(last).copy()
+
+    def record_prediction(self, mae, anomalies):
+        '''
+            Update the metrics with the result of a prediction:
+            MAE and anomalies of each feature
+        '''
+        self.num_predictions += 1
+        self.num_anomalies += anomalies
+        self.last_mae = mae
+        if anomalies.any():
+            logging.info("Anomaly detected [%s]: %s" % (self.name, anomalies))
+        else:
+            logging.info("Ok [%s]" % self.name)
+
+    def stats(self):
+        return {
+            'ingestion': self.ingestion.stats(), 'telemetry': self.telemetry_worker.stats(),
+            'logger': self.logger.stats(), 'predictions': self.num_predictions,
+            'anomalies': self.num_anomalies.tolist(),
+            'last_mae': self.last_mae.round(4).tolist() if self.last_mae is not None else None
+        }
+
+    def stop(self):
+        self.ingestion.stop(1)
+        self.telemetry_worker.stop(5)
+        self.logger.stop(10)
+        self.sensors.close()
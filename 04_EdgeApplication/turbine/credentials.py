@@ -0,0 +1,259 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import threading
+import logging
+import time
+import random
+import ssl
+import requests
+from requests.adapters import HTTPAdapter
+import boto3
+import botocore.session
+from botocore.credentials import RefreshableCredentials, CredentialProvider, CredentialResolver
+from botocore.utils import parse_timestamp
+from datetime import datetime, timezone
+
+# botocore starts refreshing the credentials 15min before the expiration (advisory
+# refresh), so the background refresh is scheduled just inside that window
+REFRESH_BEFORE_EXPIRATION = 14 * 60
+MIN_REFRESH_INTERVAL = 30
+
+class HandshakeTimingContext(ssl.SSLContext):
+    '''
+        SSLContext that measures the TLS handshakes (done by wrap_socket)
+    '''
+    def wrap_socket(self, *args, **kwargs):
+        start = time.time()
+        sock = super(HandshakeTimingContext, self).wrap_socket(*args, **kwargs)
+        elapsed = time.time() - start
+        self.num_handshakes = getattr(self, 'num_handshakes', 0) + 1
+        self.handshake_time = getattr(self, 'handshake_time', 0.0) + elapsed
+        self.max_handshake_time = max(getattr(self, 'max_handshake_time', 0.0), elapsed)
+        return sock
+
+class ClientCertAdapter(HTTPAdapter):
+    def __init__(self, ssl_context, **kwargs):
+        '''
+            HTTPAdapter that uses an SSLContext with the client certificate
+            already loaded, instead of loading it for each new connection
+        '''
+        self.ssl_context = ssl_context
+        super(ClientCertAdapter, self).__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs['ssl_context'] = self.ssl_context
+        return super(ClientCertAdapter, self).init_poolmanager(*args, **kwargs)
+
+    def proxy_manager_for(self, *args, **kwargs):
+        kwargs['ssl_context'] = self.ssl_context
+        return super(ClientCertAdapter, self).proxy_manager_for(*args, **kwargs)
+
+class CredentialsEndpointClient(object):
+    def __init__(self, cert_file, key_file, ca_file, connect_timeout=5.0, read_timeout=10.0,
+                 max_retries=3, backoff_base=0.5, backoff_max=8.0):
+        '''
+            mTLS client of the IoT credentials endpoint. The client certificate
+            is loaded once and the connection is kept alive between the
+            requests, so only the first request (or a request after the server
+            closed the connection) pays for the TCP+TLS handshake.
+            Connection errors, timeouts, 429 and 5xx are retried max_retries
+            times, waiting a random time (full jitter) between 0 and
+            backoff_base * 2^attempt seconds (up to backoff_max)
+        '''
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self.ssl_context = HandshakeTimingContext(ssl.PROTOCOL_TLS_CLIENT) # verifies the server and the hostname
+        self.ssl_context.load_default_certs()
+        self.ssl_context.load_cert_chain(cert_file, key_file)
+        if ca_file:
+            self.ssl_context.load_verify_locations(ca_file)
+        self.adapter = ClientCertAdapter(self.ssl_context, pool_connections=1, pool_maxsize=1)
+        self.session = requests.Session()
+        self.session.mount('https://', self.adapter)
+        self.lock = threading.Lock() # a single connection, shared by all threads
+
+        self.num_requests = 0
+        self.num_retries = 0
+        self.request_time = 0.0
+        self.max_request_time = 0.0
+
+    def get(self, url):
+        '''
+            GET url and return the response (2xx)
+        '''
+        with self.lock:
+            attempt = 0
+            while True:
+                num_handshakes = getattr(self.ssl_context, 'num_handshakes', 0)
+                start = time.time()
+                try:
+                    resp = self.session.get(url, timeout=self.timeout)
+                    error = None if resp.status_code < 500 and resp.status_code != 429 else Exception(
+                        'Error while getting the IoT credentials: %d' % resp.status_code)
+                except (requests.ConnectionError, requests.Timeout) as e:
+                    error = e
+                elapsed = time.time() - start
+                self.num_requests += 1
+                self.request_time += elapsed
+                self.max_request_time = max(self.max_request_time, elapsed)
+                logging.debug("IoT credentials endpoint: %.1fms (%s connection)" % (elapsed * 1000,
+                    'new' if getattr(self.ssl_context, 'num_handshakes', 0) > num_handshakes else 'reused'))
+
+                if error is None:
+                    if not resp:
+                        raise Exception('Error while getting the IoT credentials: ', resp)
+                    return resp
+                if attempt >= self.max_retries:
+                    raise error
+                logging.error(error)
+                time.sleep(random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt)))
+                attempt += 1
+                self.num_retries += 1
+
+    def stats(self):
+        with self.lock:
+            num_handshakes = getattr(self.ssl_context, 'num_handshakes', 0)
+            return {
+                'requests': self.num_requests, 'retries': self.num_retries, 'handshakes': num_handshakes,
+                'request_ms': {
+                    'avg': self.request_time / max(self.num_requests, 1) * 1000, 'max': self.max_request_time * 1000
+                },
+                'handshake_ms': {
+                    'avg': getattr(self.ssl_context, 'handshake_time', 0.0) / max(num_handshakes, 1) * 1000,
+                    'max': getattr(self.ssl_context, 'max_handshake_time', 0.0) * 1000
+                }
+            }
+
+__endpoint_clients = {}
+__endpoint_clients_lock = threading.Lock()
+
+def get_credentials_endpoint_client(cert_file, key_file, ca_file, **params):
+    '''
+        Process-wide CredentialsEndpointClient of a device certificate.
+        params (timeouts and retries, see CredentialsEndpointClient) are
+        used when the client is created, by the first call
+    '''
+    key = (cert_file, key_file, ca_file)
+    with __endpoint_clients_lock:
+        client = __endpoint_clients.get(key)
+        if client is None:
+            client = CredentialsEndpointClient(cert_file, key_file, ca_file, **params)
+            __endpoint_clients[key] = client
+        return client
+
+def fetch_aws_credentials(cred_endpoint, thing_name, cert_file, key_file, ca_file, **params):
+    '''
+        Invoke SageMaker Edge Manager endpoint to exchange the certificates
+        by temp credentials. Returns the credentials in the botocore metadata
+        format: access_key, secret_key, token, expiry_time
+        params: settings of the endpoint client (see get_credentials_endpoint_client)
+    '''
+    resp = get_credentials_endpoint_client(cert_file, key_file, ca_file, **params).get(cred_endpoint)
+    credentials = resp.json()['credentials']
+    return {
+        'access_key': credentials['accessKeyId'],
+        'secret_key': credentials['secretAccessKey'],
+        'token': credentials['sessionToken'],
+        'expiry_time': credentials['expiration']
+    }
+
+class IoTCredentialsProvider(CredentialProvider):
+    METHOD = 'iot-credentials-endpoint'
+
+    def __init__(self, iot_params):
+        '''
+            Caches the temp credentials exchanged by the device certificates
+            and shares them with all the boto3 clients. The credentials are
+            botocore RefreshableCredentials, renewed by a background thread
+            before they expire, so the clients never wait for the credentials
+            endpoint. The clients are created once per service and reused.
+            iot_params['credentials_endpoint'] (optional): timeouts and retries
+            of the endpoint client (connect_timeout, read_timeout, max_retries,
+            backoff_base, backoff_max)
+        '''
+        self.iot_params = iot_params
+        self.endpoint_params = iot_params.get('credentials_endpoint', {})
+        self.num_refreshes = 0
+        self.expiration = None
+        self.credentials = RefreshableCredentials.create_from_metadata(
+            metadata=self.__fetch__(),
+            refresh_using=self.__fetch__,
+            method=self.METHOD
+        )
+        session = botocore.session.get_session()
+        session.register_component('credential_provider', CredentialResolver([self]))
+        self.session = boto3.Session(botocore_session=session, region_name=iot_params['sagemaker_edge_core_region'])
+        self.clients = {}
+        self.clients_lock = threading.Lock()
+        self.refresher = threading.Thread(target=self.__run_refresher__, name='credentials-refresher', daemon=True)
+        self.refresher.start()
+
+    def __fetch__(self):
+        metadata = fetch_aws_credentials(
+            self.iot_params['sagemaker_edge_provider_aws_iot_cred_endpoint'],
+            self.iot_params['sagemaker_edge_core_device_uuid'],
+            self.iot_params['sagemaker_edge_provider_aws_cert_file'],
+            self.iot_params['sagemaker_edge_provider_aws_cert_pk_file'],
+            self.iot_params['sagemaker_edge_provider_aws_ca_cert_file'],
+            **self.endpoint_params
+        )
+        self.expiration = parse_timestamp(metadata['expiry_time'])
+        self.num_refreshes += 1
+        logging.info("New IoT credentials. Expiration: %s" % metadata['expiry_time'])
+        return metadata
+
+    def load(self):
+        '''
+            CredentialProvider interface, used by the botocore session
+        '''
+        return self.credentials
+
+    def seconds_to_expiration(self):
+        return (self.expiration - datetime.now(timezone.utc)).total_seconds()
+
+    def __run_refresher__(self):
+        while True:
+            time.sleep(max(self.seconds_to_expiration() - REFRESH_BEFORE_EXPIRATION, MIN_REFRESH_INTERVAL))
+            try:
+                # inside the advisory window: botocore calls __fetch__
+                self.credentials.get_frozen_credentials()
+            except Exception as e:
+                logging.error(e)
+
+    def stats(self):
+        endpoint = get_credentials_endpoint_client(
+            self.iot_params['sagemaker_edge_provider_aws_cert_file'],
+            self.iot_params['sagemaker_edge_provider_aws_cert_pk_file'],
+            self.iot_params['sagemaker_edge_provider_aws_ca_cert_file'],
+            **self.endpoint_params
+        )
+        return {'refreshes': self.num_refreshes, 'expires_in': self.seconds_to_expiration(), 'endpoint': endpoint.stats()}
+
+    def get_client(self, service_name):
+        '''
+            Return the (cached) boto3 client of a given service
+        '''
+        with self.clients_lock:
+            client = self.clients.get(service_name)
+            if client is None:
+                client = self.session.client(service_name)
+                self.clients[service_name] = client
+            return client
+
+__providers = {}
+__providers_lock = threading.Lock()
+
+def get_credentials_provider(iot_params):
+    '''
+        Process-wide IoTCredentialsProvider of a device
+    '''
+    key = (iot_params['sagemaker_edge_provider_aws_iot_cred_endpoint'], iot_params['sagemaker_edge_core_device_uuid'])
+    with __providers_lock:
+        provider = __providers.get(key)
+        if provider is None:
+            provider = IoTCredentialsProvider(iot_params)
+            __providers[key] = provider
+        return provider
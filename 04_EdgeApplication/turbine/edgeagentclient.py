@@ -1,13 +1,20 @@
 # Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
 # SPDX-License-Identifier: MIT-0
 import grpc
+import json
 import logging
 import turbine.agent_pb2 as agent
 import turbine.agent_pb2_grpc as agent_grpc
+from turbine.sharedmemory import SharedMemorySegment
 import struct
 import numpy as np
 import uuid
 
+DATA_TYPES = {
+    agent.UINT8: np.uint8, agent.INT16: np.int16, agent.INT32: np.int32, agent.INT64: np.int64,
+    agent.FLOAT16: np.float16, agent.FLOAT32: np.float32, agent.FLOAT64: np.float64
+}
+
 class EdgeAgentClient(object):
     """ Helper class that uses the Edge Agent stubs to
         communicate with the SageMaker Edge Agent through unix socket.
@@ -25,6 +32,7 @@ class EdgeAgentClient(object):
         self.channel = grpc.insecure_channel('unix://%s' % channel_path )
         self.agent = agent_grpc.AgentStub(self.channel)
         self.model_map = {}
+        self.shm_inputs = {} # model_name: [(segment, ndarray), ...] one per input tensor
         self.__update_models_list__()            
     
     def __update_models_list__(self):
@@ -32,17 +40,71 @@ class EdgeAgentClient(object):
         self.model_map = {m.name:{'in': m.input_tensor_metadatas, 'out': m.output_tensor_metadatas} for m in models_list.models}
         return self.model_map
     
+    def create_capture_request(self, model_name, inputs, outputs, timestamp=None, turbines=None):
+        """
+        Build a CaptureDataRequest with one input/output tensor pair
+        for each element of inputs/outputs. timestamp (seconds since epoch)
+        is the inference timestamp. turbines is the optional list with the
+        name of the turbine of each prediction: it is sent as an extra input
+        tensor (UINT8, json list) after the input tensors of the predictions
+        """
+        req = agent.CaptureDataRequest()
+        req.model_name = model_name
+        req.capture_id = str(uuid.uuid4())
+        if timestamp is not None:
+            req.inference_timestamp.seconds = int(timestamp)
+            req.inference_timestamp.nanos = int((timestamp % 1) * 1e9)
+        suffix = len(inputs) > 1
+        for i, (input_data, output_data) in enumerate(zip(inputs, outputs)):
+            req.input_tensors.append( self.create_tensor(input_data, 'input_%d' % i if suffix else 'input') )
+            req.output_tensors.append( self.create_tensor(output_data, 'output_%d' % i if suffix else 'output') )
+        if turbines is not None:
+            tensor = agent.Tensor()
+            tensor.tensor_metadata.name = 'turbines'
+            tensor.tensor_metadata.data_type = agent.UINT8
+            tensor.byte_data = json.dumps(turbines).encode('utf-8')
+            tensor.tensor_metadata.shape.append(len(tensor.byte_data))
+            req.input_tensors.append(tensor)
+        return req
+
     def capture_data(self, model_name, input_data, output_data):
         try:
-            req = agent.CaptureDataRequest()
-            req.model_name = model_name
-            req.capture_id = str(uuid.uuid4())
-            req.input_tensors.append( self.create_tensor(input_data, 'input') )
-            req.output_tensors.append( self.create_tensor(output_data, 'output' ) )
+            req = self.create_capture_request(model_name, [input_data], [output_data])
             resp = self.agent.CaptureData(req)
         except Exception as e:
             logging.error(e)
 
+    def capture_data_future(self, req, timeout=None):
+        """ Send a CaptureDataRequest without blocking. Returns a grpc future
+            that fails with DEADLINE_EXCEEDED after timeout seconds"""
+        return self.agent.CaptureData.future(req, timeout=timeout)
+
+    def get_capture_data_status_future(self, capture_id, timeout=None):
+        """ Check the status of a capture without blocking. Returns a grpc future"""
+        req = agent.GetCaptureDataStatusRequest()
+        req.capture_id = capture_id
+        return self.agent.GetCaptureDataStatus.future(req, timeout=timeout)
+
+    def __get_shm_inputs__(self, model_name):
+        '''
+            Shared memory segments used to send the input tensors of a given model.
+            They are allocated once and reused by all the predictions
+            until the model is unloaded
+        '''
+        if self.shm_inputs.get(model_name) is None:
+            inputs = []
+            for meta in self.model_map[model_name]['in']:
+                dtype = np.dtype(DATA_TYPES[meta.data_type])
+                shape = tuple(meta.shape)
+                segment = SharedMemorySegment(int(np.prod(shape)) * dtype.itemsize)
+                inputs.append((segment, segment.ndarray(shape, dtype)))
+            self.shm_inputs[model_name] = inputs
+        return self.shm_inputs[model_name]
+
+    def __release_shm_inputs__(self, model_name):
+        for segment, data in self.shm_inputs.pop(model_name, []):
+            segment.close()
+
     def create_tensor(self, x, tensor_name):
         if (x.dtype != np.float32):
             raise Exception( "It only supports numpy float32 arrays for this tensor" )
@@ -56,6 +118,9 @@ class EdgeAgentClient(object):
     def predict(self, model_name, x, shm=False):
         """
         Invokes the model and get the predictions
+        If shm is True, the input is written into a shared memory segment
+        instead of being serialized into the request. The agent always
+        returns the outputs in the response message
         """
         try:
             if self.model_map.get(model_name) is None:
@@ -71,8 +136,11 @@ class EdgeAgentClient(object):
             for s in meta.shape: tensor.tensor_metadata.shape.append(s)
             
             if shm:
+                segment, data = self.__get_shm_inputs__(model_name)[0]
+                np.copyto(data, x.reshape(data.shape), casting='same_kind')
+                tensor.shared_memory_handle.size = data.nbytes
                 tensor.shared_memory_handle.offset = 0
-                tensor.shared_memory_handle.segment_id = x
+                tensor.shared_memory_handle.segment_id = segment.segment_id
             else:
                 tensor.byte_data = x.astype(np.float32).tobytes()
 
@@ -84,7 +152,7 @@ class EdgeAgentClient(object):
             # Parse the output
             meta = self.model_map[model_name]['out'][0]
             tensor = resp.tensors[0]
-            data = np.fromstring(tensor.byte_data, dtype=np.float32)
+            data = np.frombuffer(tensor.byte_data, dtype=np.float32)
             return data.reshape(tensor.tensor_metadata.shape)
         except Exception as e:
             print(e)        
@@ -119,9 +187,13 @@ class EdgeAgentClient(object):
             req = agent.UnLoadModelRequest()
             req.name = model_name
             resp = self.agent.UnLoadModel(req)
+            self.__release_shm_inputs__(model_name)
             
             return self.__update_models_list__()
         except Exception as e:
             logging.error(e)        
             return None
 
+    def __del__(self):
+        for model_name in list(self.shm_inputs.keys()):
+            self.__release_shm_inputs__(model_name)
@@ -0,0 +1,133 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import binascii
+import logging
+import numpy as np
+
+# Binary frame sent by the firmware (02_Firmware) when BINARY_FRAMES is enabled.
+# All the fields are little-endian:
+#   sync (0xA5 0x5A) | length (payload size) | payload | crc16 (CCITT-FALSE of length + payload)
+# The payload has the same 20 fields of the text mode, in the same order
+FRAME_SYNC = b'\xa5\x5a'
+FRAME_DTYPE = np.dtype([
+    ('sync', '<u2'),
+    ('length', 'u1'),
+    ('arduino_timestamp', '<u4'),
+    ('free_memory', '<u4'),
+    ('readings', '<f4', (18,)), # rps, wind_speed_rps, voltage, qw, qx, qy, qz, gx, gy, gz, ax, ay, az, mputemp, temp, humidity, pressure, gas
+    ('crc', '<u2')
+])
+FRAME_SIZE = FRAME_DTYPE.itemsize
+FRAME_PAYLOAD_SIZE = FRAME_SIZE - 5
+NUM_FRAME_FIELDS = 20
+
+class BinaryFrameReader(object):
+    def __init__(self, port, switch_command=b'b'):
+        '''
+            Reads the binary frames sent by the turbine firmware through
+            a serial port. The available bytes are read in a single call and
+            all the complete frames are decoded at once with np.frombuffer.
+            Corrupted frames (bad sync word, length or crc) are discarded
+            and the reader resyncs on the next sync word.
+            The firmware switches to the binary mode when it receives
+            switch_command, so it is sent again while only garbage is received
+            (i.e. the turbine was restarted and it is sending text again).
+        '''
+        self.port = port
+        self.switch_command = switch_command
+        self.buffer = bytearray()
+        self.samples = np.empty((0, NUM_FRAME_FIELDS), dtype=np.float64)
+        self.samples_idx = 0
+        self.num_frames = 0 # valid frames decoded so far
+        self.num_corrupted_frames = 0
+        self.num_discarded_bytes = 0
+        self.bytes_since_last_frame = 0
+        self.__request_binary_frames__()
+
+    def __request_binary_frames__(self):
+        if self.switch_command is not None:
+            self.port.write(self.switch_command)
+        self.bytes_since_last_frame = 0
+
+    def isOpen(self):
+        return self.port.isOpen()
+
+    def close(self):
+        self.port.close()
+
+    def __decode__(self):
+        '''
+            Decode all the complete frames of the buffer and
+            return them as a (N, 20) array
+        '''
+        data = bytes(self.buffer)
+        decoded = []
+        start = 0
+        while True:
+            idx = data.find(FRAME_SYNC, start)
+            if idx < 0:
+                # keep the last byte, it can be the first half of the sync word
+                end = len(data) - 1 if data.endswith(FRAME_SYNC[:1]) else len(data)
+                self.num_discarded_bytes += max(0, end - start)
+                start = max(start, end)
+                break
+            self.num_discarded_bytes += idx - start
+            num_frames = (len(data) - idx) // FRAME_SIZE
+            if num_frames == 0:
+                start = idx
+                break
+            frames = np.frombuffer(data, dtype=FRAME_DTYPE, count=num_frames, offset=idx)
+            valid = (frames['sync'] == 0x5AA5) & (frames['length'] == FRAME_PAYLOAD_SIZE)
+            num_valid = 0
+            for i in range(num_frames):
+                offset = idx + i * FRAME_SIZE
+                if not valid[i] or binascii.crc_hqx(data[offset+2:offset+FRAME_SIZE-2], 0xFFFF) != frames['crc'][i]:
+                    break
+                num_valid += 1
+            if num_valid > 0:
+                decoded.append(frames[:num_valid])
+            start = idx + num_valid * FRAME_SIZE
+            if num_valid < num_frames:
+                # skip the sync word of the corrupted frame and resync
+                self.num_corrupted_frames += 1
+                self.num_discarded_bytes += 1
+                start += 1
+        del self.buffer[:start]
+
+        if len(decoded) == 0:
+            return np.empty((0, NUM_FRAME_FIELDS), dtype=np.float64)
+        frames = np.concatenate(decoded)
+        samples = np.empty((len(frames), NUM_FRAME_FIELDS), dtype=np.float64)
+        samples[:,0] = frames['arduino_timestamp']
+        samples[:,1] = frames['free_memory']
+        samples[:,2:] = frames['readings']
+        return samples
+
+    def read_frames(self):
+        '''
+            Block until at least one valid frame is received and
+            return all the decoded frames as a (N, 20) array
+        '''
+        while True:
+            chunk = self.port.read(max(FRAME_SIZE, self.port.in_waiting))
+            self.buffer += chunk
+            samples = self.__decode__()
+            if len(samples) > 0:
+                self.num_frames += len(samples)
+                self.bytes_since_last_frame = 0
+                return samples
+            self.bytes_since_last_frame += len(chunk)
+            if self.bytes_since_last_frame > 4 * FRAME_SIZE:
+                logging.debug("No valid frames received. Requesting binary frames again")
+                self.__request_binary_frames__()
+
+    def read_sample(self):
+        '''
+            Return the next sample (20 fields) received from the turbine
+        '''
+        if self.samples_idx >= len(self.samples):
+            self.samples = self.read_frames()
+            self.samples_idx = 0
+        sample = self.samples[self.samples_idx]
+        self.samples_idx += 1
+        return sample
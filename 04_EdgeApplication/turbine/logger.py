@@ -1,67 +1,276 @@
 # Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
 # SPDX-License-Identifier: MIT-0
 import threading
-import json
+import collections
+import time
+import struct
 import logging
 import turbine.util as util
+from turbine.payload import JsonPayloadEncoder
 
-class Logger(object):    
-    def __init__(self, device_name, iot_params):
+SPOOL_RECORD = struct.Struct('<IH') # # of logs, topic length (+ topic + payload)
+
+class Logger(object):
+    def __init__(self, device_name, iot_params, max_buffer_size=10000, overflow='drop_oldest',
+                 max_batch_records=500, max_batch_bytes=120*1024, flush_interval=2.0, encoder=None,
+                 spool=None, max_drain_rate=32*1024, initial_backoff=1.0, max_backoff=300.0):
         '''
             This class is responsible for sending application logs
-            to the cloud via MQTT and IoT Topics
+            to the cloud via MQTT and IoT Topics.
+            The logs are double-buffered: the application appends to the
+            current buffer and a single long-lived uploader thread swaps it
+            by an empty one in O(1), so the network calls never hold the lock
+            used by the application.
+            A batch of logs is sent when it reaches max_batch_records or
+            max_batch_bytes, or when its oldest log is flush_interval seconds old.
+            encoder: encodes the batches (payload format and topic).
+                Default: JsonPayloadEncoder
+            spool: DiskSpool that keeps the batches that couldn't be sent.
+                After a failure, the uploader waits initial_backoff seconds
+                (doubled after each new failure, up to max_backoff) before
+                using the network again and then sends the spooled batches
+                at max_drain_rate bytes/s, at most. Without a spool, the
+                batches that couldn't be sent are lost. The batches that
+                can't be written to the spool (I/O errors) are lost too
+            max_buffer_size: max # of logs waiting for the uploader
+            overflow: what to discard when the buffer is full
+                drop_oldest: the oldest log of the buffer
+                drop_newest: the new log
         '''
+        if overflow not in ('drop_newest', 'drop_oldest'):
+            raise Exception("Invalid overflow policy: %s" % overflow)
         self.device_name = device_name
         logging.info("Device Name: %s" % self.device_name)
         self.iot_params = iot_params
+        self.max_buffer_size = max_buffer_size
+        self.overflow = overflow
+        self.max_batch_records = max_batch_records
+        self.max_batch_bytes = max_batch_bytes
+        self.flush_interval = flush_interval
+        self.encoder = JsonPayloadEncoder() if encoder is None else encoder
+        self.spool = spool
+        self.max_drain_rate = max_drain_rate
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.backoff = 0
+        self.backoff_until = 0
+        self.drain_budget = 0
+        self.last_drain = time.time()
+
+        # the client is shared by the process and its credentials are
+        # refreshed in background by the IoTCredentialsProvider
+        self.iot_data_client = util.get_client('iot-data', self.iot_params)
 
-        self.__update_credentials()
+        self.logs_buffer = self.__new_buffer__()
+        self.__log_condition = threading.Condition() # protects only the logs buffer (append/swap)
 
-        self.logs_buffer = []
-        self.__log_lock = threading.Lock()
+        self.num_logs = 0 # logs received from the application
+        self.num_pending = 0 # logs taken by the uploader, not sent yet
+        self.num_delivered = 0
+        self.num_dropped = 0 # discarded because the buffer was full
+        self.num_retried = 0 # sent again after an error
+        self.num_failed = 0 # lost after the retry (or not encoded)
+        self.num_spooled = 0 # saved to the spool after a failure
+        self.num_drained = 0 # delivered from the spool
+        self.num_spool_errors = 0 # spool I/O errors
+        self.num_bytes = 0 # payload bytes delivered
 
-    def __update_credentials(self):
+        self.running = True
+        self.cloud_log_sync_job = threading.Thread(target=self.__run_logs_upload_job__, name='cloud-log-uploader', daemon=True)
+        self.cloud_log_sync_job.start()
+
+    def __new_buffer__(self):
+        # with maxlen the deque discards the oldest log by itself
+        return collections.deque(maxlen=self.max_buffer_size if self.overflow == 'drop_oldest' else None)
+
+    def __run_logs_upload_job__(self):
         '''
-            Get new temp credentials
+            Uploader thread: takes the buffered logs, groups them
+            into batches and sends the batches to the cloud
         '''
-        logging.info("Getting the IoT Credentials")
-        self.iot_data_client = util.get_client('iot-data', self.iot_params)
+        pending = [] # encoded logs
+        pending_sizes = []
+        pending_bytes = 0
+        pending_since = None
+        while True:
+            with self.__log_condition:
+                if self.running and len(self.logs_buffer) < self.max_batch_records:
+                    # wake up often enough to honour the time threshold
+                    self.__log_condition.wait(self.flush_interval / 4)
+                logs = self.logs_buffer
+                self.logs_buffer = self.__new_buffer__() # swap the buffers
+                running = self.running
 
-    def __run_logs_upload_job__(self):        
+            for log in logs:
+                try:
+                    encoded, size = self.encoder.encode_record(log)
+                except Exception as e:
+                    logging.error(e)
+                    self.num_failed += 1
+                    continue
+                pending.append(encoded)
+                pending_sizes.append(size)
+                pending_bytes += size
+            if len(pending) > 0 and pending_since is None:
+                pending_since = time.time()
+            self.num_pending = len(pending)
+
+            while len(pending) > 0 and (not running or len(pending) >= self.max_batch_records or
+                    pending_bytes >= self.max_batch_bytes or time.time() - pending_since >= self.flush_interval):
+                # get as many logs as possible, respecting the limits
+                num_logs, num_bytes = 0, self.encoder.overhead
+                while num_logs < len(pending) and num_logs < self.max_batch_records:
+                    if num_logs > 0 and num_bytes + pending_sizes[num_logs] > self.max_batch_bytes:
+                        break
+                    num_bytes += pending_sizes[num_logs]
+                    num_logs += 1
+                self.__upload_logs__(pending[:num_logs])
+                del pending[:num_logs]
+                del pending_sizes[:num_logs]
+                pending_bytes -= num_bytes - self.encoder.overhead
+                pending_since = time.time() if len(pending) > 0 else None
+                self.num_pending = len(pending)
+
+            self.__drain_spool__()
+            if not running:
+                if self.spool is not None:
+                    try:
+                        self.spool.close()
+                    except Exception as e:
+                        logging.error(e)
+                        self.num_spool_errors += 1
+                break
+
+    def __publish__(self, topic, payload):
+        self.iot_data_client.publish( topic=topic, payload=payload )
+
+    def __send__(self, topic, payload, num_logs):
         '''
-            Launch a thread that will read the logs buffer
-            prepare a json document and send the logs
+            Publish a payload. If it fails, try again once (there is no need
+            to get new credentials: the client's credentials are refreshed
+            before they expire). Raises an exception if the second attempt fails
         '''
-        self.cloud_log_sync_job = threading.Thread(target=self.__upload_logs__)
-        self.cloud_log_sync_job.start()
-        
-    def __upload_logs__(self):
+        try:
+            self.__publish__(topic, payload)
+        except Exception as e:
+            logging.error("Publish failed, retrying: %s" % e)
+            self.num_retried += num_logs
+            self.__publish__(topic, payload)
+        self.num_delivered += num_logs
+        self.num_bytes += len(payload)
+        # connectivity is back
+        self.backoff = 0
+        self.backoff_until = 0
+
+    def __set_backoff__(self):
+        self.backoff = self.initial_backoff if self.backoff == 0 else min(self.backoff * 2, self.max_backoff)
+        self.backoff_until = time.time() + self.backoff
+        logging.info("Cloud unreachable. Next attempt in %.1fs" % self.backoff)
+
+    def __upload_logs__(self, logs):
+        '''
+            Publish a batch of encoded logs. If it fails or the
+            uploader is waiting for the backoff, the batch is spooled
+        '''
+        f = self.encoder.encode(logs)
+        topic = self.encoder.topic % self.device_name
+        if time.time() >= self.backoff_until or self.spool is None:
+            try:
+                self.__send__(topic, f, len(logs))
+                logging.info("New log file uploaded. len: %d" % len(f))
+                return
+            except Exception as e:
+                logging.error(e)
+                self.__set_backoff__()
+        if self.spool is None:
+            self.num_failed += len(logs)
+            return
+        topic = topic.encode('utf-8')
+        try:
+            self.spool.append(SPOOL_RECORD.pack(len(logs), len(topic)) + topic + f)
+        except Exception as e:
+            # e.g. disk full (ENOSPC) or I/O error: the batch is lost
+            logging.error("Spool error: %s" % e)
+            self.num_spool_errors += 1
+            self.num_failed += len(logs)
+            return
+        self.num_spooled += len(logs)
+
+    def __drain_spool__(self):
         '''
-            Invoked by the thread to publish the latest logs
+            Send the spooled batches, without exceeding max_drain_rate
         '''
-        self.__log_lock.acquire(True)
-        f = json.dumps({'logs': self.logs_buffer})
-        self.logs_buffer = [] # clean the buffer
+        if self.spool is None:
+            return
         try:
-            self.iot_data_client.publish( topic='wind-turbine/logs/%s' % self.device_name, payload=f.encode('utf-8') )
+            self.spool.sync(force=False)
         except Exception as e:
-            logging.error(e)
-            self.__update_credentials()
-            self.iot_data_client.publish( topic='wind-turbine/logs/%s' % self.device_name, payload=f.encode('utf-8') )
+            logging.error("Spool error: %s" % e)
+            self.num_spool_errors += 1
+        now = time.time()
+        # token bucket: up to 1s of burst
+        self.drain_budget = min(self.max_drain_rate, self.drain_budget + (now - self.last_drain) * self.max_drain_rate)
+        self.last_drain = now
+        while self.drain_budget > 0 and time.time() >= self.backoff_until:
+            try:
+                record = self.spool.peek()
+            except Exception as e:
+                # the record stays in the spool and it is read again in the next round
+                logging.error("Spool error: %s" % e)
+                self.num_spool_errors += 1
+                break
+            if record is None:
+                break
+            num_logs, topic_len = SPOOL_RECORD.unpack_from(record)
+            topic = record[SPOOL_RECORD.size:SPOOL_RECORD.size + topic_len].decode('utf-8')
+            payload = record[SPOOL_RECORD.size + topic_len:]
+            try:
+                self.__send__(topic, payload, num_logs)
+            except Exception as e:
+                logging.error(e)
+                self.__set_backoff__()
+                break
+            self.num_drained += num_logs
+            self.drain_budget -= len(record)
+            try:
+                self.spool.pop()
+            except Exception as e:
+                # the cursor wasn't saved: the record may be sent again
+                logging.error("Spool error: %s" % e)
+                self.num_spool_errors += 1
+                break
 
-        logging.info("New log file uploaded. len: %d" % len(f))
-        self.__log_lock.release()
- 
     def publish_logs(self, data):
         '''
-            Invoked by the application, it buffers the logs            
+            Invoked by the application, it buffers the logs
+            data: {'ts': epoch seconds, 'data': sensors reading}
         '''
-        buffer_len = 0
-        if self.__log_lock.acquire(False):
+        with self.__log_condition:
+            if len(self.logs_buffer) >= self.max_buffer_size:
+                self.num_dropped += 1
+                if self.overflow == 'drop_newest':
+                    return
             self.logs_buffer.append(data)
-            buffer_len = len(self.logs_buffer)
-            self.__log_lock.release()
-        # else: job is running, discard the new data
-        if buffer_len > 10:
-            # run the sync job
-            self.__run_logs_upload_job__()
+            self.num_logs += 1
+            if len(self.logs_buffer) >= self.max_batch_records:
+                self.__log_condition.notify()
+
+    def stop(self, timeout=None):
+        '''
+            Flush the buffered logs and stop the uploader thread
+        '''
+        with self.__log_condition:
+            self.running = False
+            self.__log_condition.notify()
+        self.cloud_log_sync_job.join(timeout)
+
+    def stats(self):
+        return {
+            'logs': self.num_logs, 'buffered': len(self.logs_buffer) + self.num_pending,
+            'delivered': self.num_delivered, 'dropped': self.num_dropped,
+            'retried': self.num_retried, 'failed': self.num_failed, 'bytes': self.num_bytes,
+            'spooled': self.num_spooled, 'drained': self.num_drained,
+            'spool_records': len(self.spool) if self.spool is not None else 0,
+            'spool_errors': self.num_spool_errors,
+            'spool_evicted': self.spool.num_evicted if self.spool is not None else 0
+        }
@@ -5,29 +5,44 @@ import paho.mqtt.client as mqtt
 import logging
 import json
 import os
-import io
 import time
-import requests
-import boto3
 import tarfile
 import glob
+import shutil
 import threading
 import turbine
 
 class OTAModelUpdate(object):
-    def __init__(self, device_name, iot_params, mqtt_host, mqtt_port, update_callback, model_path):
+    def __init__(self, device_name, iot_params, mqtt_host, mqtt_port, update_callback, model_path, chunk_size=1024*1024,
+                 evaluate_callback=None, evaluation_timeout=60):
         '''
             This class is responsible for listening to IoT topics and receiving
             a Json document with the metadata of a new model. This module also
             downloads the SageMaker Edge Manager deployment package, unpacks it to
             a local dir and also controls versioning.
+            The packages are downloaded to a local cache (model_path/.packages),
+            resuming interrupted downloads, and verified before they are
+            extracted, chunk_size bytes at a time.
+            The job document can inform the expected model_package_sha256
+            and/or model_package_etag of the package.
+            evaluate_callback(model_name, model_version, done): if informed,
+            it is invoked instead of update_callback to evaluate a new model
+            before deploying it. It must invoke done(promoted, details) when
+            it decides, so the job is reported as SUCCEEDED or FAILED (and the
+            rejected model is removed). Meanwhile the job is IN_PROGRESS with
+            a step timeout of evaluation_timeout minutes.
         '''
         if model_path is None or update_callback is None:
             raise Exception("You need to inform a model_path and an update_callback methods")
         self.device_name = device_name
         self.model_path = model_path
         self.update_callback = update_callback
+        self.evaluate_callback = evaluate_callback
+        self.evaluation_timeout = evaluation_timeout
+        self.evaluating_job = None
         self.iot_params = iot_params
+        self.chunk_size = chunk_size
+        self.package_cache = turbine.ModelPackageCache(os.path.join(model_path, '.packages'), chunk_size)
 
         ## initialize an mqtt client
         self.mqttc = mqtt.Client()
@@ -48,6 +63,10 @@ class OTAModelUpdate(object):
             tokens = f.split(os.path.sep)
             assert(len(tokens) > 3)
             name = tokens[-3]
+            if os.path.exists(self.__pending_marker__(name, tokens[-2])):
+                # its evaluation was interrupted: the job will evaluate it again
+                logging.info("Model %s version %s wasn't promoted yet. Ignoring it" % (name, tokens[-2]))
+                continue
             version = float(tokens[-2])
             if self.model_meta['model_name'] != name or self.model_meta['model_version'] < version:
                 self.model_meta['model_name'] = name
@@ -55,7 +74,10 @@ class OTAModelUpdate(object):
         logging.info("Model meta", self.model_meta)
 
         if self.model_meta['model_name'] is not None:
-            self.update_callback(self.model_meta['model_name'], self.model_meta['model_version'])
+            try:
+                self.update_callback(self.model_meta['model_name'], self.model_meta['model_version'])
+            except Exception as e:
+                logging.error(e)
         
         self.processing_lock = threading.Lock()
         self.processed_jobs = []
@@ -134,7 +156,7 @@ class OTAModelUpdate(object):
         self.mqttc.loop_stop()
         self.mqttc.disconnect()
         
-    def __update_job_status__(self, job_id, status, details):
+    def __update_job_status__(self, job_id, status, details, step_timeout=2):
         '''
             After receiving a new signal that there is a model to be deployed
             Update the IoT Job to inform the user the current status of this
@@ -145,11 +167,60 @@ class OTAModelUpdate(object):
             "statusDetails": {"info": details },
             "includeJobExecutionState": False,
             "includeJobDocument": False,
-            "stepTimeoutInMinutes": 2,
+            "stepTimeoutInMinutes": step_timeout,
         })
         logging.info("Updating IoT job status: %s" % details)
         self.mqttc.publish('$aws/things/%s/jobs/%s/update' % ( self.device_name, job_id), payload)
         
+    def __pending_marker__(self, model_name, model_version):
+        return os.path.join(self.model_path, model_name, '.pending-%s' % model_version)
+
+    def __evaluation_done__(self, job_id, model_name, model_version, promoted, details):
+        '''
+            Invoked by the application when it decides to promote or
+            reject a model informed to evaluate_callback
+        '''
+        marker = self.__pending_marker__(model_name, model_version)
+        self.evaluating_job = None
+        if promoted:
+            self.model_meta['model_name'] = model_name
+            self.model_meta['model_version'] = float(model_version)
+            os.remove(marker)
+            self.__update_job_status__(job_id, 'SUCCEEDED', 'Model deployed. %s' % details)
+        else:
+            shutil.rmtree(os.path.join(self.model_path, model_name, model_version), ignore_errors=True)
+            os.remove(marker)
+            self.__update_job_status__(job_id, 'FAILED', 'Model rejected. %s' % details)
+
+    def __extract_package__(self, fileobj, model_name, model_version):
+        '''
+            Extract a (compressed) tar stream into a staging dir and then
+            rename it to model_path/model_name/model_version, so the agent
+            never sees a partially extracted model
+        '''
+        model_dir = os.path.join(self.model_path, model_name)
+        target_dir = os.path.join(model_dir, model_version)
+        staging_dir = os.path.join(model_dir, '.staging-%s' % model_version)
+        os.makedirs(model_dir, exist_ok=True)
+        shutil.rmtree(staging_dir, ignore_errors=True) # left by an interrupted update
+        try:
+            with tarfile.open(fileobj=fileobj, mode='r|*', bufsize=self.chunk_size) as p:
+                for member in p:
+                    # the package can't write outside the staging dir
+                    if os.path.isabs(member.name) or '..' in member.name.split('/') or member.issym() or member.islnk():
+                        raise Exception("Invalid file in the model package: %s" % member.name)
+                    p.extract(member, staging_dir)
+            if os.path.exists(target_dir):
+                old_dir = os.path.join(model_dir, '.old-%s' % model_version)
+                shutil.rmtree(old_dir, ignore_errors=True)
+                os.rename(target_dir, old_dir)
+                os.rename(staging_dir, target_dir)
+                shutil.rmtree(old_dir, ignore_errors=True)
+            else:
+                os.rename(staging_dir, target_dir)
+        except Exception:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+            raise
 
     def __process_job__(self, job_id, msg):
         '''
@@ -157,7 +228,7 @@ class OTAModelUpdate(object):
                 1. validate the new model version
                 2. download the model package
                 3. unpack it to a local dir
-                4. notify the main application
+                4. notify the main application (or start its evaluation)
         '''
         self.processing_lock.acquire()
         if job_id in self.processed_jobs:
@@ -184,21 +255,45 @@ class OTAModelUpdate(object):
                         self.processing_lock.release()
                         return
 
+                if self.evaluating_job is not None:
+                    msg = "Another model is being evaluated (job: %s)" % self.evaluating_job
+                    logging.info(msg)
+                    self.__update_job_status__(job_id, 'FAILED', msg)
+                    self.processing_lock.release()
+                    return
+
                 logging.info("Downloading new model package")
-                s3_client = turbine.get_client('s3', self.iot_params)
-                
-                package = io.BytesIO(s3_client.get_object(
-                    Bucket=msg['model_package_bucket'], 
-                    Key=msg['model_package_key'])['Body'].read()
+                package_path = self.package_cache.fetch(
+                    lambda: turbine.get_client('s3', self.iot_params),
+                    msg['model_package_bucket'], msg['model_package_key'],
+                    msg.get('model_package_sha256'), msg.get('model_package_etag')
                 )
                 logging.info("Unpacking model package")
-                with tarfile.open(fileobj=package) as p:
-                    p.extractall(os.path.join(self.model_path, msg['model_name'], msg['model_version']))
+                if self.evaluate_callback is not None:
+                    # the model is ignored by a restart until it is promoted
+                    os.makedirs(os.path.join(self.model_path, model_name), exist_ok=True)
+                    open(self.__pending_marker__(model_name, msg['model_version']), 'w').close()
+                with open(package_path, 'rb') as package:
+                    self.__extract_package__(package, msg['model_name'], msg['model_version'])
+                if self.evaluate_callback is not None:
+                    self.__update_job_status__(job_id, 'IN_PROGRESS', 'Evaluating the model', self.evaluation_timeout)
+                    version_dir = msg['model_version']
+                    self.evaluating_job = job_id
+                    try:
+                        self.evaluate_callback(model_name, model_version, lambda promoted, details: self.__evaluation_done__(
+                            job_id, model_name, version_dir, promoted, details))
+                    except Exception:
+                        self.evaluating_job = None
+                        shutil.rmtree(os.path.join(self.model_path, model_name, version_dir), ignore_errors=True)
+                        os.remove(self.__pending_marker__(model_name, version_dir))
+                        raise
+                else:
+                    # the application loads the new model; it raises an exception if it fails
+                    self.update_callback(msg['model_name'], model_version)
                     self.model_meta['model_name'] = msg['model_name']
                     self.model_meta['model_version'] = model_version
-                                
-                self.__update_job_status__(job_id, 'SUCCEEDED', 'Model deployed')
-                self.update_callback(self.model_meta['model_name'], self.model_meta['model_version'])                
+
+                    self.__update_job_status__(job_id, 'SUCCEEDED', 'Model deployed')
             else:
                 logging.info("Model '%s' version '%f' is the current one or it is obsolete" % (self.model_metadata['model_name'], self.model_metadata['model_version']))
         except Exception as e:
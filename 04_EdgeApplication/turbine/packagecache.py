@@ -0,0 +1,192 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import os
+import time
+import json
+import hashlib
+import logging
+
+class ModelPackageCache(object):
+    def __init__(self, cache_dir, chunk_size=1024*1024, max_packages=5, sync_interval=8*1024*1024,
+                 max_retries=5, initial_backoff=1.0, max_backoff=30.0):
+        '''
+            Content-addressed store of model packages:
+                cache_dir/sha256/<hex digest>: verified packages
+                cache_dir/index.json: 'bucket/key@etag' -> hex digest
+                cache_dir/partial/<id>.part + .json: interrupted downloads
+            The packages are downloaded with HTTP Range requests, so a download
+            interrupted by a network error (or by a restart) continues from the
+            last byte synced to disk (every sync_interval bytes), retrying up to
+            max_retries times with exponential backoff.
+            Only the max_packages most recently used packages are kept
+        '''
+        self.cache_dir = cache_dir
+        self.chunk_size = chunk_size
+        self.max_packages = max_packages
+        self.sync_interval = sync_interval
+        self.max_retries = max_retries
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.packages_dir = os.path.join(cache_dir, 'sha256')
+        self.partial_dir = os.path.join(cache_dir, 'partial')
+        self.index_path = os.path.join(cache_dir, 'index.json')
+        os.makedirs(self.packages_dir, exist_ok=True)
+        os.makedirs(self.partial_dir, exist_ok=True)
+        self.index = {}
+        if os.path.exists(self.index_path):
+            try:
+                with open(self.index_path, 'r') as f:
+                    self.index = json.loads(f.read())
+            except Exception as e:
+                logging.error(e)
+
+    def __save_index__(self):
+        with open(self.index_path + '.tmp', 'w') as f:
+            f.write(json.dumps(self.index))
+        os.replace(self.index_path + '.tmp', self.index_path)
+
+    def __package_path__(self, sha256):
+        return os.path.join(self.packages_dir, sha256)
+
+    def __hash_file__(self, path, sha256, md5):
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(self.chunk_size), b''):
+                sha256.update(chunk)
+                md5.update(chunk)
+
+    def get(self, sha256):
+        '''
+            Path of a cached package or None
+        '''
+        path = self.__package_path__(sha256) if sha256 is not None else None
+        if path is None or not os.path.exists(path):
+            return None
+        os.utime(path) # most recently used
+        return path
+
+    def fetch(self, get_s3_client, bucket, key, sha256=None, etag=None):
+        '''
+            Return the path of the package s3://bucket/key, downloading it only
+            if it isn't in the cache. get_s3_client is only invoked to download.
+            sha256: expected hex digest of the package
+            etag: expected ETag of the S3 object
+        '''
+        sha256 = sha256.lower() if sha256 is not None else None
+        etag = etag.strip('"') if etag is not None else None
+        path = self.get(sha256)
+        if path is None and sha256 is None and etag is not None:
+            path = self.get(self.index.get('%s/%s@%s' % (bucket, key, etag)))
+        if path is not None:
+            logging.info("Model package found in the local cache: %s" % path)
+            return path
+
+        s3_client = get_s3_client()
+        head = s3_client.head_object(Bucket=bucket, Key=key)
+        object_etag = head['ETag'].strip('"')
+        if etag is not None and etag != object_etag:
+            raise Exception("The model package was modified. Expected ETag: %s, got: %s" % (etag, object_etag))
+        path = self.get(self.index.get('%s/%s@%s' % (bucket, key, object_etag)))
+        if path is not None and (sha256 is None or os.path.basename(path) == sha256):
+            logging.info("Model package found in the local cache: %s" % path)
+            return path
+
+        part_path = self.__download__(s3_client, bucket, key, object_etag, head['ContentLength'])
+        # verify the package
+        digest, md5 = hashlib.sha256(), hashlib.md5()
+        self.__hash_file__(part_path, digest, md5)
+        digest = digest.hexdigest()
+        try:
+            if sha256 is not None and digest != sha256:
+                raise Exception("Invalid model package. Expected SHA-256: %s, got: %s" % (sha256, digest))
+            # the ETag is the md5 of the object only for single part uploads
+            # stored without encryption or with SSE-S3 (not SSE-KMS or SSE-C)
+            etag_is_md5 = '-' not in object_etag and not head.get('ServerSideEncryption', '').startswith('aws:kms') and \
+                head.get('SSECustomerAlgorithm') is None
+            if etag_is_md5 and md5.hexdigest() != object_etag:
+                raise Exception("Invalid model package. Expected MD5: %s, got: %s" % (object_etag, md5.hexdigest()))
+        except Exception:
+            self.__remove_partial__(part_path)
+            raise
+
+        path = self.__package_path__(digest)
+        os.replace(part_path, path)
+        self.__remove_partial__(part_path)
+        self.index['%s/%s@%s' % (bucket, key, object_etag)] = digest
+        self.__evict__(path)
+        self.__save_index__()
+        return path
+
+    def __remove_partial__(self, part_path):
+        for p in (part_path, part_path[:-len('.part')] + '.json'):
+            if os.path.exists(p):
+                os.remove(p)
+
+    def __download__(self, s3_client, bucket, key, etag, size):
+        '''
+            Download (or resume the download of) an object into a partial file
+        '''
+        download_id = hashlib.sha256(('%s/%s' % (bucket, key)).encode('utf-8')).hexdigest()
+        part_path = os.path.join(self.partial_dir, '%s.part' % download_id)
+        state_path = os.path.join(self.partial_dir, '%s.json' % download_id)
+        state = {'bucket': bucket, 'key': key, 'etag': etag, 'size': size}
+        if os.path.exists(state_path):
+            with open(state_path, 'r') as f:
+                if json.loads(f.read()) != state:
+                    # the object changed since the interrupted download
+                    self.__remove_partial__(part_path)
+        if not os.path.exists(state_path):
+            with open(state_path, 'w') as f:
+                f.write(json.dumps(state))
+
+        start_time = time.time()
+        num_bytes = 0
+        attempt = 0
+        with open(part_path, 'ab') as f:
+            while True:
+                offset = f.tell()
+                if offset >= size:
+                    break
+                if offset > 0 and num_bytes == 0:
+                    logging.info("Resuming the download of the model package at byte %d/%d" % (offset, size))
+                try:
+                    resp = s3_client.get_object(Bucket=bucket, Key=key, Range='bytes=%d-' % offset, IfMatch=etag)
+                    unsynced = 0
+                    for chunk in iter(lambda: resp['Body'].read(self.chunk_size), b''):
+                        f.write(chunk)
+                        num_bytes += len(chunk)
+                        unsynced += len(chunk)
+                        if unsynced >= self.sync_interval:
+                            f.flush()
+                            os.fsync(f.fileno())
+                            unsynced = 0
+                        attempt = 0
+                    f.flush()
+                    os.fsync(f.fileno())
+                    if f.tell() < size:
+                        raise Exception("Connection closed at byte %d/%d" % (f.tell(), size))
+                except Exception as e:
+                    f.flush()
+                    if attempt >= self.max_retries:
+                        raise
+                    backoff = min(self.initial_backoff * 2 ** attempt, self.max_backoff)
+                    logging.error("Error while downloading the model package: %s. Retrying in %.1fs" % (e, backoff))
+                    time.sleep(backoff)
+                    attempt += 1
+        elapsed = time.time() - start_time
+        logging.info("Model package downloaded: %d bytes in %.1fs (%.2f MB/s)" % (
+            num_bytes, elapsed, num_bytes / max(elapsed, 1e-6) / (1024 * 1024)))
+        return part_path
+
+    def __evict__(self, keep):
+        '''
+            Remove the least recently used packages
+        '''
+        packages = sorted((os.path.join(self.packages_dir, p) for p in os.listdir(self.packages_dir)),
+                          key=os.path.getmtime, reverse=True)
+        for path in packages[self.max_packages:]:
+            if path == keep:
+                continue
+            logging.info("Removing model package from the cache: %s" % path)
+            os.remove(path)
+            digest = os.path.basename(path)
+            self.index = {k: v for k,v in self.index.items() if v != digest}
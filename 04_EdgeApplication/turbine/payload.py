@@ -0,0 +1,88 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import json
+import struct
+import zlib
+import numpy as np
+from datetime import datetime
+
+# columnar payload: header + [zlib](time deltas + float32 columns)
+COLUMNAR_MAGIC = b'WTLC'
+COLUMNAR_VERSION = 1
+COLUMNAR_FLAG_ZLIB = 0x01
+COLUMNAR_HEADER = struct.Struct('<4sBBHqI') # magic, version, flags, num_fields, base_ts (ms), num_records
+
+def format_timestamp(ts):
+    '''
+        Epoch seconds to the ISO format used in the logs
+    '''
+    return "%s+00:00" % datetime.utcfromtimestamp(ts).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3]
+
+class JsonPayloadEncoder(object):
+    content_type = 'application/json'
+    topic = 'wind-turbine/logs/%s'
+    overhead = len('{"logs": []}')
+
+    def __init__(self):
+        '''
+            Original format of the logs: {"logs": [{"ts": "...", "data": [...]}, ...]}
+        '''
+        pass
+
+    def encode_record(self, record):
+        '''
+            record: {'ts': epoch seconds, 'data': sensors reading}
+            Returns the encoded record and its size in bytes in the payload
+        '''
+        data = np.asarray(record['data']).tolist()
+        if len(data) > 0 and isinstance(data[0], float):
+            # the readings have float32 precision: 7 significant digits (0.1), like
+            # the columnar decoder, instead of the float64 expansion of a float32
+            # (0.10000000149011612). Integers (e.g. arduino_timestamp) are kept
+            data = [v if v.is_integer() else float('%.7g' % v) for v in data]
+        encoded = json.dumps({'ts': format_timestamp(record['ts']), 'data': data})
+        return encoded, len(encoded) + 2
+
+    def encode(self, records):
+        return ('{"logs": [%s]}' % ', '.join(records)).encode('utf-8')
+
+class ColumnarPayloadEncoder(object):
+    content_type = 'application/x-wind-turbine-columnar'
+    topic = 'wind-turbine/logs-columnar/%s'
+    overhead = COLUMNAR_HEADER.size
+
+    def __init__(self, num_fields=20, compress=False, compress_level=6):
+        '''
+            Binary format of the logs. After the header:
+                int32 x N: delta (ms) between the timestamp of each record
+                    and the previous one (the first one is relative to base_ts)
+                    timestamps are truncated to ms, like in the json format
+                float32 x num_fields x N: one column per field
+            The body is zlib compressed when compress is True.
+            A payload has ~4 + 4 x num_fields bytes per record, instead of
+            the ~400 bytes of the json format.
+        '''
+        self.num_fields = num_fields
+        self.compress = compress
+        self.compress_level = compress_level
+
+    def encode_record(self, record):
+        data = np.asarray(record['data'], dtype=np.float32)
+        if data.shape != (self.num_fields,):
+            raise Exception("Invalid record. Expected %d fields, got: %s" % (self.num_fields, data.shape))
+        return (record['ts'], data), 4 + 4 * self.num_fields
+
+    def encode(self, records):
+        ts_ms = np.floor(np.array([r[0] for r in records]) * 1000).astype(np.int64)
+        base_ts = int(ts_ms[0])
+        deltas = np.diff(ts_ms, prepend=base_ts).astype('<i4')
+        columns = np.empty((self.num_fields, len(records)), dtype='<f4')
+        for i, r in enumerate(records):
+            columns[:, i] = r[1]
+        body = deltas.tobytes() + columns.tobytes()
+        flags = 0
+        if self.compress:
+            body = zlib.compress(body, self.compress_level)
+            flags |= COLUMNAR_FLAG_ZLIB
+        header = COLUMNAR_HEADER.pack(COLUMNAR_MAGIC, COLUMNAR_VERSION, flags, self.num_fields, base_ts, len(records))
+        return header + body
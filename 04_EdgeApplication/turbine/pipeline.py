@@ -0,0 +1,110 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import threading
+import logging
+import queue
+
+class BackgroundWorker(object):
+    __STOP__ = object()
+
+    def __init__(self, handler, max_queue_size=100, name=None):
+        '''
+            Runs handler(item) in a dedicated thread for each submitted item.
+            The queue is bounded: when it is full, new items are dropped
+            (and counted) instead of blocking the producer
+        '''
+        self.handler = handler
+        self.queue = queue.Queue(max_queue_size)
+        self.num_processed = 0
+        self.num_dropped = 0
+        self.num_failed = 0
+        self.thread = threading.Thread(target=self.__run__, name=name, daemon=True)
+        self.thread.start()
+
+    def submit(self, item):
+        '''
+            Enqueue a new item without blocking. Returns False if it was dropped
+        '''
+        try:
+            self.queue.put_nowait(item)
+            return True
+        except queue.Full:
+            self.num_dropped += 1
+            return False
+
+    def __run__(self):
+        while True:
+            item = self.queue.get()
+            if item is self.__STOP__:
+                break
+            try:
+                self.handler(item)
+                self.num_processed += 1
+            except Exception as e:
+                self.num_failed += 1
+                logging.error(e)
+
+    def stop(self, timeout=None):
+        '''
+            Process the pending items and stop the thread
+        '''
+        self.queue.put(self.__STOP__)
+        self.thread.join(timeout)
+
+    def stats(self):
+        return {
+            'queue_size': self.queue.qsize(), 'processed': self.num_processed,
+            'dropped': self.num_dropped, 'failed': self.num_failed
+        }
+
+class SensorsIngestion(object):
+    def __init__(self, sensors, read_reading, parse_reading, samples, on_reading=None):
+        '''
+            Drains the turbine sensors continuously in a dedicated thread,
+            so the readings don't pile up in the OS buffer while the model
+            is invoked. Each reading is converted by parse_reading into a
+            sample (or None if it is invalid) and appended to the samples
+            RingBuffer. Use samples_lock to read the buffer from other threads.
+            on_reading(reading) is invoked for each valid reading and must not block
+        '''
+        self.sensors = sensors
+        self.read_reading = read_reading
+        self.parse_reading = parse_reading
+        self.samples = samples
+        self.on_reading = on_reading
+        self.samples_lock = threading.Lock()
+        self.num_readings = 0
+        self.num_invalid_readings = 0
+        self.running = False
+        self.thread = threading.Thread(target=self.__run__, name='sensors-ingestion', daemon=True)
+
+    def start(self):
+        self.running = True
+        self.thread.start()
+
+    def __run__(self):
+        while self.running and self.sensors.isOpen():
+            try:
+                reading = self.read_reading()
+                sample = self.parse_reading(reading)
+            except Exception as e:
+                if not self.running:
+                    break
+                logging.error(e)
+                sample = None
+            if sample is None:
+                self.num_invalid_readings += 1
+                continue
+            with self.samples_lock:
+                self.samples.append(sample)
+            self.num_readings += 1
+            if self.on_reading is not None:
+                self.on_reading(reading)
+        self.running = False
+
+    def stop(self, timeout=None):
+        self.running = False
+        self.thread.join(timeout)
+
+    def stats(self):
+        return {'readings': self.num_readings, 'invalid_readings': self.num_invalid_readings}
@@ -0,0 +1,106 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import os
+import time
+import shutil
+import logging
+import itertools
+import numpy as np
+
+NUM_REPLAY_FIELDS = 20
+
+def build_replay_cache(csv_file, cache_path, chunk_size=65536):
+    '''
+        Convert the wind turbine dataset (CSV text file object) into a .npy
+        float32 file with the same 20 columns (and order) sent by the firmware.
+        The CSV is parsed in chunks of chunk_size lines, so the memory usage
+        doesn't depend on the size of the dataset.
+
+        Dataset columns: nanoId, turbineId, arduino_timestamp, nanoFreemem, eventTime,
+        rps, voltage, qw, qx, qy, qz, gx, gy, gz, ax, ay, az, gearboxtemp, ambtemp,
+        humidity, pressure, gas, wind_speed_rps
+    '''
+    num_cols = len(csv_file.readline().split(','))
+    # firmware order: arduino_timestamp, nanoFreemem, rps, wind_speed_rps, voltage, qw, ..., gas
+    usecols = [2, 3, 5, num_cols - 1] + list(range(6, num_cols - 1))
+
+    raw_path = cache_path + '.raw'
+    num_samples = 0
+    with open(raw_path, 'wb') as raw:
+        while True:
+            lines = list(itertools.islice(csv_file, chunk_size))
+            if len(lines) == 0:
+                break
+            samples = np.genfromtxt(lines, delimiter=',', usecols=usecols, dtype=np.float32, ndmin=2)
+            # incomplete readings would be rejected by the parser of the text mode
+            samples = samples[~np.isnan(samples).any(axis=1)]
+            raw.write(samples.astype('<f4').tobytes())
+            num_samples += len(samples)
+
+    # the .npy header needs the final shape, so it is written after parsing the whole file
+    tmp_path = cache_path + '.tmp'
+    with open(tmp_path, 'wb') as f, open(raw_path, 'rb') as raw:
+        np.lib.format.write_array_header_1_0(f, {
+            'descr': '<f4', 'fortran_order': False, 'shape': (num_samples, NUM_REPLAY_FIELDS)
+        })
+        shutil.copyfileobj(raw, f)
+    os.remove(raw_path)
+    os.rename(tmp_path, cache_path)
+    logging.info("Replay cache created: %s (%d readings)" % (cache_path, num_samples))
+
+class SensorsReplay(object):
+    def __init__(self, cache_path, rate=0.0, sample_interval=0.05, offset=0):
+        '''
+            Replays the wind turbine dataset as if it was read from the sensors.
+            The dataset is memory-mapped from the cache created by
+            build_replay_cache, so it starts instantly and the resident memory
+            doesn't grow with the dataset. The readings are handed out without
+            any text processing.
+            rate: 0 = as fast as possible, 1 = real-time, N = N x real-time
+            sample_interval: interval in seconds between two readings in real-time
+            offset: index of the first reading (wraps around the dataset)
+        '''
+        self.rate = rate
+        self.sample_interval = sample_interval
+        self.samples = np.load(cache_path, mmap_mode='r')
+        self.idx = offset % len(self.samples)
+        self.num_replayed = 0
+        self.start_time = None
+        logging.info("Replaying %d readings from %s" % (len(self.samples), cache_path))
+
+    def isOpen(self): return True
+    def close(self): pass
+
+    def __wait__(self, num_samples):
+        '''
+            Sleep until num_samples more readings are due, given the playback rate
+        '''
+        if self.rate <= 0:
+            return
+        if self.start_time is None:
+            self.start_time = time.time()
+        due = self.start_time + (self.num_replayed + num_samples) * self.sample_interval / self.rate
+        delay = due - time.time()
+        if delay > 0:
+            time.sleep(delay)
+
+    def read_batch(self, num_samples):
+        '''
+            Return the next num_samples readings (N, 20). It is a view
+            of the dataset, unless the batch wraps around its end
+        '''
+        self.__wait__(num_samples)
+        end = self.idx + num_samples
+        if end <= len(self.samples):
+            batch = self.samples[self.idx:end]
+        else:
+            batch = np.take(self.samples, np.arange(self.idx, end), axis=0, mode='wrap')
+        self.idx = end % len(self.samples)
+        self.num_replayed += num_samples
+        return batch
+
+    def read_sample(self):
+        '''
+            Return the next reading (20 fields)
+        '''
+        return self.read_batch(1)[0]
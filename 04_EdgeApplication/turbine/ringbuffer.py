@@ -0,0 +1,50 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import numpy as np
+
+class RingBuffer(object):
+    def __init__(self, capacity, num_features, dtype=np.float64):
+        '''
+            Preallocated circular buffer for the sensors readings.
+            Each sample is written twice (idx and idx + capacity), so the
+            latest N samples are always a contiguous, chronologically
+            ordered slice of the storage and can be read without copies.
+            Appending doesn't allocate any memory.
+        '''
+        self.capacity = capacity
+        self.num_features = num_features
+        self.buffer = np.zeros((2 * capacity, num_features), dtype=dtype)
+        self.head = 0
+        self.count = 0
+        self.num_appended = 0 # total number of samples appended so far
+
+    def __len__(self):
+        return self.count
+
+    def is_full(self):
+        return self.count >= self.capacity
+
+    def append(self, sample):
+        '''
+            Add a new sample (one value per feature) and
+            discard the oldest one when the buffer is full
+        '''
+        self.buffer[self.head] = sample
+        self.buffer[self.head + self.capacity] = sample
+        self.head = (self.head + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+        self.num_appended += 1
+
+    def last(self, n=None):
+        '''
+            Zero-copy view of the last n samples, from the oldest to the newest.
+            The view is overwritten by the next appends, so copy it if you
+            need to keep the data
+        '''
+        n = self.count if n is None else min(n, self.count)
+        end = self.head + self.capacity
+        return self.buffer[end - n:end]
+
+    def clear(self):
+        self.head = 0
+        self.count = 0
@@ -0,0 +1,173 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import threading
+import logging
+import time
+import numpy as np
+from turbine.pipeline import BackgroundWorker
+from turbine.util import reconstruction_mae
+
+class ShadowEvaluator(object):
+    def __init__(self, active_model, thresholds, min_windows=100, max_duration=3600.0,
+                 max_mae_increase=0.1, max_anomaly_rate_increase=0.05, quantile=0.95, queue_size=10):
+        '''
+            Evaluates a new model (candidate) in shadow mode before activating it.
+            The candidate is loaded and warmed up alongside the active model and
+            invoked by a background worker with the same windows the active model
+            received, so the predictions loop never waits for it (the windows are
+            dropped if the worker is busy). After min_windows windows the
+            reconstruction errors of both models are compared and the candidate is
+                promoted (activated by the ActiveModel) if:
+                    - the quantile of its MAE (mean of the features) is at most
+                      max_mae_increase (relative) above the active model's
+                    - its anomaly rate (windows with any feature above the
+                      thresholds) is at most max_anomaly_rate_increase (absolute)
+                      above the active model's
+                rejected (unloaded) otherwise, or if it fails to predict or
+                doesn't get min_windows windows within max_duration seconds
+                (enforced by a timer, so it also ends if no windows arrive)
+            If there is no active model, the candidate is activated directly
+        '''
+        self.active_model = active_model
+        self.thresholds = thresholds
+        self.min_windows = min_windows
+        self.max_duration = max_duration
+        self.max_mae_increase = max_mae_increase
+        self.max_anomaly_rate_increase = max_anomaly_rate_increase
+        self.quantile = quantile
+        self.lock = threading.Lock()
+        self.candidate = None
+        self.on_result = None
+        self.started = None
+        self.mae = None # windows x (active, candidate)
+        self.anomalies = None
+        self.num_windows = 0
+        self.num_evaluations = 0
+        self.num_promoted = 0
+        self.num_rejected = 0
+        self.last_result = None
+        self.timer = None
+        self.worker = BackgroundWorker(self.__evaluate__, queue_size, 'shadow-evaluator')
+
+    def is_running(self):
+        return self.candidate is not None
+
+    def start(self, model_name, model_path, on_result):
+        '''
+            Load a candidate and start its evaluation.
+            on_result(promoted, details) is invoked with the decision
+        '''
+        with self.lock:
+            if self.candidate is not None:
+                raise Exception("Model %s is already being evaluated" % self.candidate)
+        if not self.active_model.is_loaded():
+            self.active_model.swap(model_name, model_path)
+            on_result(True, 'There is no active model to compare with. Model activated')
+            return
+        load_time, warmup_time = self.active_model.load(model_name, model_path)
+        with self.lock:
+            self.mae = np.empty((self.min_windows, 2), dtype=np.float64)
+            self.anomalies = np.empty((self.min_windows, 2), dtype=bool)
+            self.num_windows = 0
+            self.on_result = on_result
+            self.started = time.time()
+            self.candidate = model_name
+            self.num_evaluations += 1
+            self.timer = threading.Timer(self.max_duration, self.__timeout__, (model_name,))
+            self.timer.daemon = True
+            self.timer.start()
+        logging.info("Evaluating model %s in shadow mode (loaded in %.1fms, warmed up in %.1fms)" % (
+            model_name, load_time * 1000, warmup_time * 1000))
+
+    def submit(self, x, active_mae):
+        '''
+            Invoked by the predictions loop with the input windows and the
+            MAE (windows x features) of the active model. It never blocks
+        '''
+        candidate = self.candidate
+        if candidate is not None:
+            self.worker.submit((candidate, x.copy(), active_mae))
+
+    def __evaluate__(self, item):
+        candidate, x, active_mae = item
+        if candidate != self.candidate:
+            return # the evaluation already finished
+        p = self.active_model.invoke(candidate, x)
+        if p is None:
+            self.__finish__(candidate, False, "It was not possible to invoke the model")
+            return
+        mae = reconstruction_mae(x, p)
+        n = min(len(x), self.min_windows - self.num_windows)
+        window = slice(self.num_windows, self.num_windows + n)
+        self.mae[window, 0] = np.mean(active_mae[:n], axis=1)
+        self.mae[window, 1] = np.mean(mae[:n], axis=1)
+        self.anomalies[window, 0] = (active_mae[:n] > self.thresholds).any(axis=1)
+        self.anomalies[window, 1] = (mae[:n] > self.thresholds).any(axis=1)
+        self.num_windows += n
+        if self.num_windows >= self.min_windows:
+            self.__decide__(candidate)
+
+    def __timeout__(self, candidate):
+        self.__finish__(candidate, False, "Only %d/%d windows evaluated in %gs" % (
+            self.num_windows, self.min_windows, self.max_duration))
+
+    def __decide__(self, candidate):
+        active_mae, candidate_mae = np.quantile(self.mae, self.quantile, axis=0)
+        active_rate, candidate_rate = np.mean(self.anomalies, axis=0)
+        details = "p%d MAE: %.4f (active: %.4f); anomaly rate: %.1f%% (active: %.1f%%); %d windows" % (
+            self.quantile * 100, candidate_mae, active_mae, candidate_rate * 100, active_rate * 100, self.num_windows)
+        reasons = []
+        if candidate_mae > active_mae * (1 + self.max_mae_increase):
+            reasons.append("MAE increased more than %.1f%%" % (self.max_mae_increase * 100))
+        if candidate_rate > active_rate + self.max_anomaly_rate_increase:
+            reasons.append("Anomaly rate increased more than %.1f%%" % (self.max_anomaly_rate_increase * 100))
+        if len(reasons) > 0:
+            details = "%s. %s" % ("; ".join(reasons), details)
+        self.__finish__(candidate, len(reasons) == 0, details)
+
+    def __finish__(self, candidate, promoted, details):
+        '''
+            End the evaluation of candidate. It runs once per evaluation:
+            the worker and the timer may try to finish it at the same time
+        '''
+        with self.lock:
+            if candidate is None or candidate != self.candidate:
+                return
+            self.candidate = None
+            on_result, self.on_result = self.on_result, None
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+        if promoted:
+            drain_time = self.active_model.activate(candidate)
+            self.num_promoted += 1
+            logging.info("Model %s promoted (drained in %.1fms): %s" % (candidate, drain_time * 1000, details))
+        else:
+            self.active_model.edge_agent.unload_model(candidate)
+            self.num_rejected += 1
+            logging.info("Model %s rejected: %s" % (candidate, details))
+        self.last_result = {'model': candidate, 'promoted': promoted, 'details': details}
+        try:
+            on_result(promoted, details)
+        except Exception as e:
+            logging.error(e)
+
+    def stop(self, timeout=None):
+        '''
+            Abort the current evaluation (the candidate is unloaded) and stop the worker
+        '''
+        self.worker.stop(timeout)
+        with self.lock:
+            candidate, self.candidate = self.candidate, None
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+        if candidate is not None:
+            self.active_model.edge_agent.unload_model(candidate)
+
+    def stats(self):
+        return {
+            'candidate': self.candidate, 'windows': self.num_windows, 'evaluations': self.num_evaluations,
+            'promoted': self.num_promoted, 'rejected': self.num_rejected, 'dropped': self.worker.num_dropped,
+            'last_result': self.last_result
+        }
@@ -0,0 +1,64 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import os
+import ctypes
+import ctypes.util
+import numpy as np
+
+IPC_PRIVATE = 0
+IPC_CREAT = 0o1000
+IPC_RMID = 0
+
+_libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+_libc.shmget.argtypes = [ctypes.c_int, ctypes.c_size_t, ctypes.c_int]
+_libc.shmget.restype = ctypes.c_int
+_libc.shmat.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_int]
+_libc.shmat.restype = ctypes.c_void_p
+_libc.shmdt.argtypes = [ctypes.c_void_p]
+_libc.shmdt.restype = ctypes.c_int
+_libc.shmctl.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_void_p]
+_libc.shmctl.restype = ctypes.c_int
+
+class SharedMemorySegment(object):
+    def __init__(self, size, mode=0o600):
+        '''
+            SysV shared memory segment, the IPC mechanism used by
+            SageMaker Edge Agent to receive tensors without serializing
+            them into the protobuf message. The segment id is what goes
+            into SharedMemoryHandle.segment_id.
+        '''
+        self.size = size
+        self.address = None
+        self.segment_id = _libc.shmget(IPC_PRIVATE, size, IPC_CREAT | mode)
+        if self.segment_id < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, "shmget: %s" % os.strerror(err))
+        address = _libc.shmat(self.segment_id, None, 0)
+        if address is None or address == ctypes.c_void_p(-1).value:
+            err = ctypes.get_errno()
+            _libc.shmctl(self.segment_id, IPC_RMID, None)
+            raise OSError(err, "shmat: %s" % os.strerror(err))
+        self.address = address
+        self.buffer = (ctypes.c_uint8 * size).from_address(address)
+
+    def ndarray(self, shape, dtype):
+        '''
+            Numpy array (shape, dtype) that writes directly into the segment
+        '''
+        count = int(np.prod(shape))
+        return np.frombuffer(self.buffer, dtype=dtype, count=count).reshape(shape)
+
+    def close(self):
+        '''
+            Detach and remove the segment. Any array returned by ndarray
+            becomes invalid after that
+        '''
+        if self.address is None:
+            return
+        self.buffer = None
+        _libc.shmdt(self.address)
+        _libc.shmctl(self.segment_id, IPC_RMID, None)
+        self.address = None
+
+    def __del__(self):
+        self.close()
@@ -0,0 +1,252 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+import os
+import time
+import struct
+import zlib
+import logging
+import collections
+
+RECORD_HEADER = struct.Struct('<II') # length, crc32
+CURSOR = struct.Struct('<QQ') # segment, offset
+
+class DiskSpool(object):
+    def __init__(self, path, max_size=64*1024*1024, segment_size=4*1024*1024, fsync_interval=1.0):
+        '''
+            Persistent FIFO of records (bytes), stored in append-only segment files:
+                [length (uint32), crc32 (uint32), data] ...
+            A new segment is created when the current one reaches segment_size.
+            When the spool reaches max_size, the oldest segment is evicted.
+            The writes are fsync'ed at most every fsync_interval seconds and the
+            read position is kept in a cursor file, so the records survive a
+            restart of the application (after a crash, a record can be read
+            twice, but a synced record is never lost).
+            Not thread-safe: use it from a single thread.
+        '''
+        self.path = path
+        self.max_size = max_size
+        self.segment_size = segment_size
+        self.fsync_interval = fsync_interval
+        os.makedirs(path, exist_ok=True)
+
+        self.segments = collections.OrderedDict() # seq: [size in bytes, # of records]
+        self.num_records = 0 # unread records
+        self.num_evicted = 0 # unread records discarded to respect max_size
+        self.num_corrupted = 0 # bytes discarded (torn or corrupted records)
+
+        self.write_seq = None
+        self.write_file = None
+        self.dirty = False
+        self.last_sync = time.time()
+
+        self.read_seq = 0
+        self.read_offset = 0
+        self.read_index = 0 # records already read from the read segment
+        self.read_file = None
+        self.next_offset = None
+        self.__recover__()
+
+    def __segment_path__(self, seq):
+        return os.path.join(self.path, 'spool-%020d.seg' % seq)
+
+    def __cursor_path__(self):
+        return os.path.join(self.path, 'cursor')
+
+    def __scan__(self, seq, end=None):
+        '''
+            Walk the valid records of a segment, until the offset end.
+            Returns (size, # of records)
+        '''
+        size, num_records = 0, 0
+        with open(self.__segment_path__(seq), 'rb') as f:
+            while end is None or size < end:
+                header = f.read(RECORD_HEADER.size)
+                if len(header) < RECORD_HEADER.size:
+                    break
+                length, crc = RECORD_HEADER.unpack(header)
+                data = f.read(length)
+                if len(data) < length or zlib.crc32(data) != crc:
+                    break
+                size += RECORD_HEADER.size + length
+                num_records += 1
+        return size, num_records
+
+    def __recover__(self):
+        '''
+            Load the segments and the cursor left by a previous execution
+        '''
+        seqs = sorted(int(name[6:-4]) for name in os.listdir(self.path)
+                      if name.startswith('spool-') and name.endswith('.seg'))
+        for seq in seqs:
+            size, num_records = self.__scan__(seq)
+            file_size = os.path.getsize(self.__segment_path__(seq))
+            if size < file_size:
+                # torn write (power loss): drop the incomplete tail
+                self.num_corrupted += file_size - size
+                with open(self.__segment_path__(seq), 'r+b') as f:
+                    f.truncate(size)
+            self.segments[seq] = [size, num_records]
+            self.num_records += num_records
+        if len(seqs) == 0:
+            return
+
+        self.read_seq = seqs[0]
+        if os.path.exists(self.__cursor_path__()):
+            with open(self.__cursor_path__(), 'rb') as f:
+                data = f.read()
+            if len(data) == CURSOR.size:
+                seq, offset = CURSOR.unpack(data)
+                if seq in self.segments and offset <= self.segments[seq][0]:
+                    self.read_seq, self.read_offset = seq, offset
+        # the segments before the cursor were already consumed
+        for seq in seqs:
+            if seq >= self.read_seq:
+                break
+            self.__remove_segment__(seq)
+        self.read_index = self.__scan__(self.read_seq, self.read_offset)[1] if self.read_offset > 0 else 0
+        self.num_records -= self.read_index
+        if self.num_records > 0:
+            logging.info("Spool %s: %d records recovered" % (self.path, self.num_records))
+
+    def __remove_segment__(self, seq):
+        '''
+            Delete a segment, discarding its unread records
+        '''
+        size, num_records = self.segments.pop(seq)
+        if seq == self.read_seq:
+            num_records -= self.read_index
+            if self.read_file is not None:
+                self.read_file.close()
+                self.read_file = None
+            self.read_seq = next(iter(self.segments)) if len(self.segments) > 0 else seq + 1
+            self.read_offset = 0
+            self.read_index = 0
+        if seq == self.write_seq:
+            self.write_file.close()
+            self.write_file = None
+            self.write_seq = None
+        self.num_records -= num_records
+        os.remove(self.__segment_path__(seq))
+        return num_records
+
+    def size(self):
+        return sum(s[0] for s in self.segments.values())
+
+    def __len__(self):
+        return self.num_records
+
+    def append(self, data):
+        '''
+            Add a record to the end of the spool
+        '''
+        record_size = RECORD_HEADER.size + len(data)
+        while len(self.segments) > 0 and self.size() + record_size > self.max_size:
+            evicted = self.__remove_segment__(next(iter(self.segments)))
+            self.num_evicted += evicted
+            logging.warning("Spool %s is full: %d records evicted" % (self.path, evicted))
+
+        last_seq = next(reversed(self.segments)) if len(self.segments) > 0 else None
+        if last_seq is None or self.segments[last_seq][0] + record_size > self.segment_size:
+            self.__open_segment__(self.read_seq if last_seq is None else last_seq + 1)
+        elif self.write_file is None:
+            self.__open_segment__(last_seq) # recovered from disk
+
+        self.write_file.write(RECORD_HEADER.pack(len(data), zlib.crc32(data)))
+        self.write_file.write(data)
+        segment = self.segments[self.write_seq]
+        segment[0] += record_size
+        segment[1] += 1
+        self.num_records += 1
+        self.dirty = True
+        self.sync(force=False)
+
+    def __open_segment__(self, seq):
+        if self.write_file is not None:
+            self.sync()
+            self.write_file.close()
+        self.write_seq = seq
+        self.write_file = open(self.__segment_path__(seq), 'ab')
+        if seq not in self.segments:
+            self.segments[seq] = [0, 0]
+
+    def sync(self, force=True):
+        '''
+            fsync the pending writes. If force is False, only when
+            fsync_interval seconds have passed since the last one
+        '''
+        if not self.dirty:
+            return
+        if not force and time.time() - self.last_sync < self.fsync_interval:
+            return
+        self.write_file.flush()
+        os.fsync(self.write_file.fileno())
+        self.last_sync = time.time()
+        self.dirty = False
+
+    def peek(self):
+        '''
+            Return the oldest record, without removing it, or None if the spool is empty
+        '''
+        while self.num_records > 0:
+            size, num_records = self.segments[self.read_seq]
+            if self.read_offset < size:
+                if self.read_seq == self.write_seq:
+                    self.write_file.flush()
+                if self.read_file is None:
+                    self.read_file = open(self.__segment_path__(self.read_seq), 'rb')
+                self.read_file.seek(self.read_offset)
+                header = self.read_file.read(RECORD_HEADER.size)
+                if len(header) == RECORD_HEADER.size:
+                    length, crc = RECORD_HEADER.unpack(header)
+                    data = self.read_file.read(length)
+                    if len(data) == length and zlib.crc32(data) == crc:
+                        self.next_offset = self.read_offset + RECORD_HEADER.size + length
+                        return data
+                # truncated or corrupted after it was written: the valid
+                # data ends here, so skip the rest of the segment
+                logging.error("Spool %s: corrupted segment %d" % (self.path, self.read_seq))
+                self.num_corrupted += size - self.read_offset
+                self.num_records -= num_records - self.read_index
+                self.segments[self.read_seq][1] = self.read_index
+                self.read_offset = size
+            elif self.read_seq == self.write_seq:
+                break
+            else:
+                self.__remove_segment__(self.read_seq) # completely read
+                self.__save_cursor__()
+        return None
+
+    def pop(self):
+        '''
+            Remove the record returned by peek
+        '''
+        if self.next_offset is None:
+            raise Exception("pop() without peek()")
+        self.read_offset = self.next_offset
+        self.read_index += 1
+        self.num_records -= 1
+        self.next_offset = None
+        if self.read_offset >= self.segments[self.read_seq][0] and self.read_seq != self.write_seq:
+            self.__remove_segment__(self.read_seq)
+        self.__save_cursor__()
+
+    def __save_cursor__(self):
+        path = self.__cursor_path__()
+        with open(path + '.tmp', 'wb') as f:
+            f.write(CURSOR.pack(self.read_seq, self.read_offset))
+        os.replace(path + '.tmp', path)
+
+    def stats(self):
+        return {
+            'records': self.num_records, 'bytes': self.size(), 'segments': len(self.segments),
+            'evicted': self.num_evicted, 'corrupted_bytes': self.num_corrupted
+        }
+
+    def close(self):
+        self.sync()
+        if self.write_file is not None:
+            self.write_file.close()
+            self.write_file = None
+        if self.read_file is not None:
+            self.read_file.close()
+            self.read_file = None
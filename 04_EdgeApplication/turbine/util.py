@@ -2,18 +2,37 @@
 # SPDX-License-Identifier: MIT-0
 import math
 import numpy as np
-import boto3
 import pywt
 import socket
-import requests
 import json
+from turbine.credentials import fetch_aws_credentials, get_credentials_provider
 
-def euler_from_quaternion(x, y, z, w):
+def euler_from_quaternions(q, out=None):
     """
-    Convert a quaternion into euler angles (roll, pitch, yaw)
+    Convert an array of quaternions (N,4) in the order x,y,z,w
+    into an array of euler angles (N,3): roll, pitch, yaw
     roll is rotation around x in radians (counterclockwise)
     pitch is rotation around y in radians (counterclockwise)
     yaw is rotation around z in radians (counterclockwise)
+    If out (N,3) is informed, the angles are written into it
+    """
+    q = np.asarray(q, dtype=np.float64)
+    x, y, z, w = q[:,0], q[:,1], q[:,2], q[:,3]
+    if out is None:
+        out = np.empty((q.shape[0], 3), dtype=np.float64)
+
+    np.arctan2(2.0 * (w * x + y * z), 1.0 - 2.0 * (x * x + y * y), out=out[:,0])
+    # clamp to [-1, 1] to avoid NaNs at the +-90 degrees pitch singularity
+    np.arcsin(np.clip(2.0 * (w * y - z * x), -1.0, 1.0), out=out[:,1])
+    np.arctan2(2.0 * (w * z + x * y), 1.0 - 2.0 * (y * y + z * z), out=out[:,2])
+
+    return out # in radians
+
+def euler_from_quaternion(x, y, z, w):
+    """
+    Convert a quaternion into euler angles (roll, pitch, yaw)
+    Scalar version of euler_from_quaternions, for a single reading
+    (math is ~40x faster than numpy for one quaternion)
     """
     t0 = +2.0 * (w * x + y * z)
     t1 = +1.0 - 2.0 * (x * x + y * y)
@@ -44,49 +63,110 @@ def wavelet_denoise(data, noise_sigma, wavelet):
 
     return pywt.waverec(list(new_wavelet_coeffs), wavelet)
 
-def create_dataset(X, time_steps=1, step=1):
+class WaveletDenoiser(object):
+    def __init__(self, samples, noise_sigma, wavelet='db6'):
+        '''
+            wavelet_denoise for the fixed-length window kept by a RingBuffer
+            of multi-feature samples. It is not incremental: each denoise()
+            runs a full wavedec/waverec over the whole window, at most once
+            per appended sample (the result is cached). Everything that only
+            depends on the window length (wavelet filters, decomposition
+            levels and the per-feature thresholds) is computed once here and
+            all the features are denoised together by a single multi-channel
+            decomposition instead of one per feature.
+
+            The output matches wavelet_denoise applied to each column of the
+            same window up to float64 rounding (max abs error < 1e-9). The
+            dyadic decimation grid is anchored at the start of the window,
+            so sliding it by one sample changes every coefficient and there
+            is no exact way to reuse the previous decomposition.
+        '''
+        self.samples = samples
+        self.window_size = samples.capacity
+        self.noise_sigma = np.asarray(noise_sigma, dtype=np.float64)
+        self.wavelet = pywt.Wavelet(wavelet)
+        self.levels = min(5, int(np.floor(np.log2(self.window_size))))
+        self.thresholds = self.noise_sigma * np.sqrt(2*np.log2(self.window_size))
+        self.denoised = None
+        self.denoised_at = -1
+
+    def denoise(self, last=None):
+        '''
+            Denoised version of the current window with shape (N, num_features).
+            If last is informed, only the last N rows are returned.
+            The result is cached until the next append, so don't modify it in place
+        '''
+        if not self.samples.is_full():
+            raise Exception("The window is not full yet: %d/%d" % (len(self.samples), self.window_size))
+        if self.denoised_at != self.samples.num_appended:
+            wavelet_coeffs = pywt.wavedec(self.samples.last(), self.wavelet, level=self.levels, axis=0)
+            new_wavelet_coeffs = [pywt.threshold(c, self.thresholds, mode='soft') for c in wavelet_coeffs]
+            self.denoised = pywt.waverec(new_wavelet_coeffs, self.wavelet, axis=0)
+            self.denoised_at = self.samples.num_appended
+        if last is None:
+            return self.denoised
+        return self.denoised[-last:]
+
+def create_dataset(X, time_steps=1, step=1, grid=None, out=None):
     '''
         Format a timeseries buffer into a multidimensional tensor
-        required by the model
+        required by the model.
+        By default it returns a read-only strided view of X with shape
+        (N, time_steps, features), so the overlapping windows aren't copied.
+        If grid=(rows, cols) is informed, it returns the model layout
+        (N, features, rows, cols) as float32, written into out if informed.
+        That is the only copy done by this function.
+        Raises ValueError if rows * cols != time_steps or if out isn't
+        a C-contiguous float32 array with the expected shape
+    '''
+    X = np.asarray(X)
+    num_samples, num_features = X.shape
+    num_windows = len(range(0, num_samples - time_steps, step))
+    if grid is not None:
+        grid = tuple(grid)
+        if len(grid) != 2 or grid[0] * grid[1] != time_steps:
+            raise ValueError("Invalid grid %s for %d time steps" % (grid, time_steps))
+        shape = (num_windows, num_features) + grid
+        if out is not None:
+            # a non-contiguous out would be reshaped into a temporary copy
+            if out.shape != shape or out.dtype != np.float32 or not out.flags['C_CONTIGUOUS']:
+                raise ValueError("out must be a C-contiguous float32 array %s. Got %s %s (contiguous: %s)" % (
+                    shape, out.dtype, out.shape, out.flags['C_CONTIGUOUS']))
+    # windows[i, f, t] = X[i * step + t, f]
+    windows = np.lib.stride_tricks.as_strided(
+        X, shape=(num_windows, num_features, time_steps),
+        strides=(X.strides[0] * step, X.strides[1], X.strides[0]),
+        writeable=False
+    )
+    if grid is None:
+        return windows.transpose((0, 2, 1))
+    if out is None:
+        out = np.empty(shape, dtype=np.float32)
+    np.copyto(out.reshape(num_windows, num_features, time_steps), windows, casting='same_kind')
+    return out
+
+def reconstruction_mae(x, p):
     '''
-    Xs = []
-    for i in range(0, len(X) - time_steps, step):
-        v = X[i:(i + time_steps)]
-        Xs.append(v)
-    return np.array(Xs)
+        Mean absolute error of each window and feature (N, features) between
+        the model input x and its reconstruction p, both (N, features, rows, cols)
+    '''
+    a = x.reshape(x.shape[0], x.shape[1], -1)
+    b = p.reshape(a.shape)
+    return np.mean(np.abs(b - a), axis=2)
 
 def get_aws_credentials(cred_endpoint, thing_name, cert_file, key_file, ca_file):
     '''
         Invoke SageMaker Edge Manager endpoint to exchange the certificates
         by temp credentials
     '''
-    resp = requests.get(
-        cred_endpoint,
-        cert=(cert_file, key_file, ca_file),
-    )
-    if not resp:
-        raise Exception('Error while getting the IoT credentials: ', resp)
-    credentials = resp.json()
-    return (credentials['credentials']['accessKeyId'],
-        credentials['credentials']['secretAccessKey'],
-        credentials['credentials']['sessionToken'])
+    credentials = fetch_aws_credentials(cred_endpoint, thing_name, cert_file, key_file, ca_file)
+    return (credentials['access_key'], credentials['secret_key'], credentials['token'])
 
 def get_client(service_name, iot_params):
     '''
-        Build a boto3 client of a given service
-        It uses the temp credentials exchanged by the certificates
+        Return a boto3 client of a given service
+        It uses the temp credentials exchanged by the certificates, cached
+        and refreshed by a process-wide IoTCredentialsProvider. The clients
+        are reused, so don't change their configuration
     '''
-    access_key_id,secret_access_key,session_token = get_aws_credentials(
-        iot_params['sagemaker_edge_provider_aws_iot_cred_endpoint'],
-        iot_params['sagemaker_edge_core_device_uuid'],
-        iot_params['sagemaker_edge_provider_aws_cert_file'],
-        iot_params['sagemaker_edge_provider_aws_cert_pk_file'],
-        iot_params['sagemaker_edge_provider_aws_ca_cert_file']
-    )
-    return boto3.client(
-        service_name, iot_params['sagemaker_edge_core_region'],
-        aws_access_key_id=access_key_id,
-        aws_secret_access_key=secret_access_key,
-        aws_session_token=session_token
-    )
-
+    return get_credentials_provider(iot_params).get_client(service_name)